@@ -0,0 +1,36 @@
+# cart/services.py
+from django.db.models import F
+from django.db.models.functions import Greatest
+from marketplace.models import Product
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Product.saved_count / Product.cart_count are denormalized counters.
+# Call these inside the same transaction as the SavedItem/CartItem write so the
+# counter and the rows commit (or roll back) together. Greatest() keeps a drifted
+# counter from going negative; reconcile_product_counters fixes any drift.
+
+def adjust_saved_count(product_ids, delta):
+    """Atomically adds delta to saved_count for each product id (repeats count once each)."""
+    if not product_ids:
+        return 0
+    return Product.objects.filter(id__in=product_ids).update(saved_count=Greatest(F('saved_count') + delta, 0))
+
+def adjust_cart_count(product_ids, delta):
+    """Atomically adds delta to cart_count for each product id (repeats count once each)."""
+    if not product_ids:
+        return 0
+    return Product.objects.filter(id__in=product_ids).update(cart_count=Greatest(F('cart_count') + delta, 0))
+
+def clear_cart(cart):
+    """
+    Deletes every item in the cart and decrements cart_count for their products.
+    Must be called inside a transaction. Returns the number of items deleted.
+    """
+    # Locked, so a concurrent clear (or removal) can't have its items decremented twice
+    product_ids = list(cart.cart_items.select_for_update().values_list('product_id', flat=True))
+    count, _ = cart.cart_items.all().delete()
+    adjust_cart_count(product_ids, -1)
+    logger.debug(f"Cleared {count} items from cart {cart.id}")
+    return count
@@ -12,6 +12,7 @@ import logging
 from marketplace.models import Product
 from .models import Cart, CartItem, SavedItem
 from .forms import CartItemForm
+from .services import adjust_saved_count, adjust_cart_count, clear_cart
 from orders.models import Order, OrderItem
 from wallet.models import Wallet
 # Assuming wallet functions are in wallet/models.py or moved to wallet/services.py
@@ -33,12 +34,12 @@ def initialize_cart(user):
 @login_required
 def cart_list(request):
     cart = initialize_cart(request.user)
-    cart_items = cart.cart_items.select_related('product').prefetch_related('product__images').all()
+    cart_items = cart.cart_items.select_related('product__primary_image').all()
     total_price = sum((item.product.price or 0) * item.quantity for item in cart_items)
 
     for item in cart_items:
         item.subtotal = (item.product.price or 0) * item.quantity
-        primary_image = item.product.images.filter(is_primary=True).first()
+        primary_image = item.product.primary_image
         item.primary_image_url = primary_image.image.url if primary_image else None
 
     if request.method == 'POST':
@@ -90,9 +91,12 @@ def add_to_cart(request, product_id):
         messages.error(request, f"Sorry, '{product.title}' is out of stock.")
         return redirect(request.META.get('HTTP_REFERER', 'marketplace:home'))
 
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart, product=product, defaults={'quantity': 1}
-    )
+    with transaction.atomic():
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=cart, product=product, defaults={'quantity': 1}
+        )
+        if created:
+            adjust_cart_count([product.id], 1)
 
     if not created:
         # Use atomic transaction for incrementing quantity to prevent race conditions
@@ -123,7 +127,11 @@ def remove_from_cart(request, item_id):
     try:
         cart_item = CartItem.objects.get(id=item_id, cart=cart)
         product_title = cart_item.product.title
-        cart_item.delete()
+        with transaction.atomic():
+            # Only the request that actually deleted the row decrements (double submits, two tabs)
+            deleted, _ = CartItem.objects.filter(pk=cart_item.pk).delete()
+            if deleted:
+                adjust_cart_count([cart_item.product_id], -1)
         messages.success(request, f"Removed {product_title} from cart.")
     except CartItem.DoesNotExist:
         messages.error(request, "Item not found in your cart.")
@@ -135,9 +143,9 @@ def remove_from_cart(request, item_id):
 # --- Saved Items Views (Keep as is) ---
 @login_required
 def saved_list(request):
-    saved_items = SavedItem.objects.filter(user=request.user).select_related('product').prefetch_related('product__images').all()
+    saved_items = SavedItem.objects.filter(user=request.user).select_related('product__primary_image').all()
     for item in saved_items:
-        primary_image = item.product.images.filter(is_primary=True).first()
+        primary_image = item.product.primary_image
         item.primary_image_url = primary_image.image.url if primary_image else None
     return render(request, 'cart/saved_list.html', {'saved_items': saved_items})
 
@@ -147,7 +155,10 @@ def add_to_saved(request, product_id):
     if product.seller == request.user:
         messages.warning(request, "You cannot save your own product.")
         return redirect(request.META.get('HTTP_REFERER', 'marketplace:home'))
-    _, created = SavedItem.objects.get_or_create(user=request.user, product=product)
+    with transaction.atomic():
+        _, created = SavedItem.objects.get_or_create(user=request.user, product=product)
+        if created:
+            adjust_saved_count([product.id], 1)
     if created: messages.success(request, f"Saved {product.title}.")
     else: messages.info(request, f"{product.title} is already saved.")
     return redirect(request.META.get('HTTP_REFERER', reverse('cart:saved_list')))
@@ -157,7 +168,10 @@ def remove_from_saved(request, saved_item_id):
     try:
         saved_item = SavedItem.objects.get(id=saved_item_id, user=request.user)
         product_title = saved_item.product.title
-        saved_item.delete()
+        with transaction.atomic():
+            deleted, _ = SavedItem.objects.filter(pk=saved_item.pk).delete()
+            if deleted:
+                adjust_saved_count([saved_item.product_id], -1)
         messages.success(request, f"Removed {product_title} from saved items.")
     except SavedItem.DoesNotExist: messages.error(request, "Item not found in your saved list.")
     except Exception as e: logger.error(f"Error removing saved item {saved_item_id}: {e}", exc_info=True); messages.error(request, "Could not remove saved item.")
@@ -329,7 +343,7 @@ def checkout_view(request):
                         raise ValueError("Fund distribution failed for Wallet payment.")
 
                     # 3e. Clear cart (safe to do now)
-                    cart.cart_items.all().delete()
+                    clear_cart(cart)
                     logger.info(f"Cleared cart for user {request.user.email} after successful wallet payment.")
 
                     # If we reach here, wallet payment and post-processing succeeded
@@ -343,7 +357,7 @@ def checkout_view(request):
                     # Stock is deducted only when the success webhook arrives.
                     logger.info(f"Order {order.id} created. Initiating Xendit payment process...")
                     # Clear cart now, as user will be redirected
-                    cart.cart_items.all().delete()
+                    clear_cart(cart)
                     logger.info(f"Cleared cart for user {request.user.email} before Xendit redirect/display.")
                     # The transaction commits here, saving the PENDING order
 
@@ -1,6 +1,6 @@
 # image_scanning/admin.py
 from django.contrib import admin
-from .models import UploadedImage, ProcessedClothingItem
+from .models import UploadedImage, ProcessedClothingItem, BackgroundRemovalJob
 
 @admin.register(UploadedImage)
 class UploadedImageAdmin(admin.ModelAdmin):
@@ -9,3 +9,9 @@ class UploadedImageAdmin(admin.ModelAdmin):
 @admin.register(ProcessedClothingItem)
 class ProcessedClothingItemAdmin(admin.ModelAdmin):
     list_display = ('user', 'processed_image', 'product', 'created_at')
+
+@admin.register(BackgroundRemovalJob)
+class BackgroundRemovalJobAdmin(admin.ModelAdmin):
+    list_display = ('uploaded_image', 'status', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
@@ -0,0 +1,34 @@
+# image_scanning/batch.py
+"""
+Entry points for the process pool used by the process_uploads command.
+Pool processes are started with 'spawn' (forking a process that has imported
+rembg/onnxruntime can deadlock), so this module only imports Django and the
+app lazily, after django.setup() has run in the child.
+"""
+import time
+
+
+def init_process(intra_op_threads):
+    """Runs once per pool process: sets up Django and builds the one rembg session it reuses for every image."""
+    import django
+    django.setup()
+
+    from .sessions import warm_up
+    warm_up(intra_op_threads=intra_op_threads)
+
+
+def process_job(job_id, worker):
+    """
+    Claims and runs one BackgroundRemovalJob; returns (job_id, success, seconds).
+    The claim happens here, when processing starts, so jobs waiting in the pool queue
+    don't age past IMAGE_JOB_STALE_AFTER. success is None if another worker took the job first.
+    """
+    from .models import BackgroundRemovalJob
+    from .services import claim_jobs, run_job
+
+    if not claim_jobs([job_id], worker):
+        return job_id, None, 0.0
+    job = BackgroundRemovalJob.objects.select_related('uploaded_image__user').get(pk=job_id)
+    started = time.perf_counter()
+    success = run_job(job)
+    return job_id, success, time.perf_counter() - started
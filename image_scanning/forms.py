@@ -17,3 +17,32 @@ class ProcessedClothingItemForm(forms.ModelForm):
     class Meta:
         model = ProcessedClothingItem
         fields = ['processed_image', 'product']
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleImageField(forms.ImageField):
+    """ImageField that validates every file of a multi-file input and returns a list."""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput(attrs={'accept': "image/*"}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleImageField, self).clean(d, initial) for d in data]
+        return [super().clean(data, initial)]
+
+class BatchUploadForm(forms.Form):
+    MAX_FILES = 50
+    MAX_FILE_SIZE = 25 * 1024 * 1024
+
+    images = MultipleImageField(label="Clothing images")
+
+    def clean_images(self):
+        images = self.cleaned_data['images']
+        if len(images) > self.MAX_FILES:
+            raise forms.ValidationError(f"Upload at most {self.MAX_FILES} images at a time.")
+        too_large = [f.name for f in images if f.size > self.MAX_FILE_SIZE]
+        if too_large:
+            raise forms.ValidationError(f"Image file too large (max 25MB): {', '.join(too_large)}")
+        return images
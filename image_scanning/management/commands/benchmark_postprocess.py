@@ -0,0 +1,207 @@
+# image_scanning/management/commands/benchmark_postprocess.py
+
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageEnhance
+
+from image_scanning import utils
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _stub_remove(data):
+    """
+    Stands in for rembg so the benchmark isolates decode/post-processing/resize:
+    cuts out a centred ellipse at the input's resolution and, like rembg,
+    returns PNG bytes for bytes input and a PIL image otherwise.
+    """
+    image = Image.open(io.BytesIO(data)) if isinstance(data, bytes) else data
+    image = image.convert('RGB')
+    mask = np.zeros((image.height, image.width), dtype=np.uint8)
+    cv2.ellipse(mask, (image.width // 2, image.height // 2), (image.width // 3, image.height // 3), 0, 0, 360, 255, -1)
+    cutout = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    cutout.paste(image, mask=Image.fromarray(mask))
+    if isinstance(data, bytes):
+        buffer = io.BytesIO()
+        cutout.save(buffer, format='PNG')
+        return buffer.getvalue()
+    return cutout
+
+
+def legacy_pipeline(file_path, max_dimension, remove):
+    """The pre-rework remove_background_and_optimize, kept here for comparison."""
+    with open(file_path, 'rb') as f: input_bytes = f.read()
+    output_bytes = remove(input_bytes)
+    output_image = Image.open(io.BytesIO(output_bytes)).convert("RGBA")
+    output_np = np.array(output_image); rgb = output_np[...,:3]; alpha = output_np[...,3]
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV).astype(np.float32); hsv[...,2] /= 255.0
+    shadow_mask = hsv[...,2] < 0.4; hsv[...,2][shadow_mask] = np.power(hsv[...,2][shadow_mask], 0.8)
+    hsv[...,2] *= 255.0; hsv = hsv.astype(np.uint8); processed_rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
+    processed_image = Image.fromarray(processed_rgb); enhancer = ImageEnhance.Contrast(processed_image)
+    processed_image = enhancer.enhance(1.1); final_image_np = np.dstack([np.array(processed_image), alpha])
+    final_image = Image.fromarray(final_image_np, mode="RGBA")
+    resized_image = final_image.copy()
+    resized_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    return resized_image
+
+
+def current_pipeline(file_path, max_dimension, remove):
+    """remove_background_and_optimize's steps with an injectable remove()."""
+    image = utils.load_downsized(file_path, max_dimension)
+    rgba = np.array(remove(image).convert('RGBA'))
+    utils.postprocess_cutout(rgba)
+    return Image.fromarray(rgba)
+
+
+PIPELINES = {'legacy': legacy_pipeline, 'current': current_pipeline}
+
+
+def _remove_function(use_rembg):
+    if use_rembg:
+        from image_scanning.sessions import remove_background
+        return remove_background
+    return _stub_remove
+
+
+def _reset_peak_rss():
+    """Resets the kernel's peak-RSS counter (Linux); False if unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # Linux reports KB
+
+
+def _measure(name, file_path, max_dimension, repeat, use_rembg):
+    """Runs in a fresh process so the peak RSS reflects only this pipeline."""
+    import django
+    django.setup()
+    remove = _remove_function(use_rembg)
+    if use_rembg:
+        remove(Image.new('RGB', (64, 64))) # Load the model before taking the memory baseline
+
+    # ru_maxrss survives exec, so a spawned child can inherit the parent's peak; reset it first
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        PIPELINES[name](file_path, max_dimension, remove)
+        timings.append((time.perf_counter() - started) * 1000)
+    peak_kb = _peak_rss_kb()
+    return timings, peak_kb - baseline_kb
+
+
+def write_synthetic_photo(path, width, height):
+    """A noisy, textured JPEG the size of a phone photo (random noise keeps JPEG decode realistic)."""
+    rng = np.random.default_rng(0)
+    x = np.arange(width, dtype=np.float32)[None, :]
+    y = np.arange(height, dtype=np.float32)[:, None]
+    photo = np.empty((height, width, 3), dtype=np.float32)
+    photo[..., 0] = x * 255 / width
+    photo[..., 1] = y * 255 / height
+    photo[..., 2] = (x + y) * 127 / (width + height)
+    photo += rng.normal(0, 18, size=(height, width, 3)).astype(np.float32)
+    photo = np.clip(photo, 0, 255).astype(np.uint8)
+    cv2.rectangle(photo, (width // 4, height // 4), (3 * width // 4, 3 * height // 4), (40, 30, 25), -1) # Dark garment
+    Image.fromarray(photo).save(path, format='JPEG', quality=90)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks remove_background_and_optimize post-processing: the old full-resolution '
+        'HSV/ImageEnhance pipeline vs the downsize-first single-pass one. Reports latency and '
+        'peak memory per pipeline (each measured in its own process).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images',
+            nargs='+',
+            help='Photos to benchmark with (default: a synthetic 12MP 4032x3024 JPEG).',
+        )
+        parser.add_argument(
+            '--max-dimension',
+            type=int,
+            default=1024,
+            help='max_dimension passed to the pipelines (default 1024).',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per image and pipeline; the median is reported.',
+        )
+        parser.add_argument(
+            '--rembg',
+            action='store_true',
+            help='Include real rembg inference (needs the model) instead of a synthetic cutout.',
+        )
+
+    def handle(self, *args, **options):
+        max_dimension = options['max_dimension']
+        repeat = max(1, options['repeat'])
+        use_rembg = options['rembg']
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            images = options['images']
+            if not images:
+                synthetic = os.path.join(tmp_dir, 'synthetic_12mp.jpg')
+                write_synthetic_photo(synthetic, 4032, 3024)
+                images = [synthetic]
+            for path in images:
+                if not os.path.exists(path):
+                    raise CommandError(f"Image not found: {path}")
+
+            self.stdout.write(f"{'image':<28} {'pipeline':<9} {'median ms':>10} {'min ms':>8} {'peak MB':>8}")
+            self.stdout.write("-" * 67)
+            ctx = multiprocessing.get_context('spawn') # Fresh process per measurement
+            for path in images:
+                with Image.open(path) as im:
+                    label = f"{os.path.basename(path)[:18]} {im.width}x{im.height}"
+                results = {}
+                for name in PIPELINES:
+                    with ctx.Pool(1) as pool:
+                        timings, peak_kb = pool.apply(_measure, (name, path, max_dimension, repeat, use_rembg))
+                    results[name] = (statistics.median(timings), peak_kb / 1024)
+                    self.stdout.write(
+                        f"{label[:28]:<28} {name:<9} {results[name][0]:>10.1f} {min(timings):>8.1f} {results[name][1]:>8.1f}"
+                    )
+
+                legacy_ms, legacy_mb = results['legacy']
+                current_ms, current_mb = results['current']
+                remove = _remove_function(use_rembg)
+                diff = self._mean_abs_diff(
+                    legacy_pipeline(path, max_dimension, remove), current_pipeline(path, max_dimension, remove)
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"{'':<28} {legacy_ms / current_ms:.1f}x faster, {legacy_mb - current_mb:.1f} MB less peak memory, "
+                    f"mean abs pixel difference {diff:.2f}/255"
+                ))
+
+    def _mean_abs_diff(self, a, b):
+        if a.size != b.size:
+            b = b.resize(a.size, Image.Resampling.LANCZOS) # draft() can land a pixel off after rounding
+        return float(np.mean(np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16))))
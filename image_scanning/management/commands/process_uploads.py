@@ -0,0 +1,144 @@
+# image_scanning/management/commands/process_uploads.py
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from image_scanning.models import UploadedImage, BackgroundRemovalJob
+from image_scanning.batch import init_process, process_job
+from image_scanning.services import enqueue_removal, worker_name
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs background removal for many UploadedImages at once (e.g. a bulk closet import) '
+        'using a process pool, and reports throughput.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--upload_ids',
+            nargs='+',
+            type=int,
+            help='Specific UploadedImage IDs to process.',
+        )
+        parser.add_argument(
+            '--user',
+            help='Only process uploads belonging to this username.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-process uploads whose background removal already finished (DONE or FAILED).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPU cores).',
+        )
+        parser.add_argument(
+            '--onnx-threads',
+            type=int,
+            default=1,
+            help='ONNX intra-op threads per worker process (default 1, since the pool already uses every core).',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        uploads = UploadedImage.objects.all()
+        if options['upload_ids']:
+            uploads = uploads.filter(id__in=options['upload_ids'])
+        if options['user']:
+            uploads = uploads.filter(user__username=options['user'])
+        if not options['force']:
+            # Skip uploads that already have a processed (or definitively failed) result
+            uploads = uploads.exclude(removal_job__status__in=[BackgroundRemovalJob.STATUS_DONE, BackgroundRemovalJob.STATUS_FAILED])
+
+        job_ids = []
+        for uploaded in uploads.order_by('id').iterator():
+            job = enqueue_removal(uploaded)
+            if options['force'] and job.status == BackgroundRemovalJob.STATUS_DONE:
+                BackgroundRemovalJob.objects.filter(pk=job.pk).update(status=BackgroundRemovalJob.STATUS_PENDING, attempts=0)
+            job_ids.append(job.pk)
+
+        # Jobs already being run by run_image_worker are left to it. The rest are claimed one at a
+        # time as pool processes start them (image_scanning/batch.py), so queued jobs don't go stale.
+        pending_ids = set(BackgroundRemovalJob.objects.filter(
+            pk__in=job_ids, status=BackgroundRemovalJob.STATUS_PENDING,
+        ).values_list('pk', flat=True))
+        skipped = len(job_ids) - len(pending_ids)
+        job_ids = [job_id for job_id in job_ids if job_id in pending_ids]
+        total = len(job_ids)
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("No uploads needed processing."))
+            return
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipping {skipped} upload(s) already being processed by a worker."))
+        worker = f"batch:{worker_name()}"
+
+        workers = min(workers, total)
+        self.stdout.write(f"Processing {total} upload(s) with {workers} worker process(es), model '{settings.REMBG_MODEL}'...")
+
+        success_count = 0
+        failure_count = 0
+        image_seconds = 0.0
+        timed_count = 0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'), # see image_scanning/batch.py
+            initializer=init_process,
+            initargs=(options['onnx_threads'],),
+        ) as pool:
+            futures = {pool.submit(process_job, job_id, worker): job_id for job_id in job_ids}
+            for processed_count, future in enumerate(as_completed(futures), start=1):
+                job_id = futures[future]
+                try:
+                    job_id, success, seconds = future.result()
+                except Exception as e:
+                    # e.g. the pool process died or could not load the model
+                    failure_count += 1
+                    BackgroundRemovalJob.objects.filter(pk=job_id, status=BackgroundRemovalJob.STATUS_RUNNING, worker=worker).update(
+                        status=BackgroundRemovalJob.STATUS_FAILED, error=str(e)[:1000], finished_at=timezone.now()
+                    )
+                    self.stdout.write(f"[{processed_count}/{total}] Job {job_id} " + self.style.ERROR(f"ERROR ({e})"))
+                    logger.error(f"Batch background removal error for job {job_id}", exc_info=True)
+                    continue
+                if success is None:
+                    skipped += 1
+                    self.stdout.write(f"[{processed_count}/{total}] Job {job_id} " + self.style.WARNING("SKIPPED (taken by a worker)"))
+                    continue
+                image_seconds += seconds
+                timed_count += 1
+                if success:
+                    success_count += 1
+                    self.stdout.write(f"[{processed_count}/{total}] Job {job_id} " + self.style.SUCCESS(f"OK ({seconds:.2f}s)"))
+                else:
+                    failure_count += 1
+                    self.stdout.write(f"[{processed_count}/{total}] Job {job_id} " + self.style.ERROR("FAILED"))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write("-" * 30)
+        self.stdout.write(self.style.SUCCESS(f"Successfully processed: {success_count}"))
+        if failure_count > 0:
+            self.stdout.write(self.style.ERROR(f"Failed: {failure_count}"))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped (processed by a worker): {skipped}"))
+        per_image = image_seconds / timed_count if timed_count else 0
+        steady_rate = workers / per_image if per_image else 0
+        self.stdout.write(
+            f"Wall time {elapsed:.2f}s (including process start-up and model load), {total / elapsed:.2f} images/s; "
+            f"{per_image:.2f}s per image per worker, ~{steady_rate:.2f} images/s once warm."
+        )
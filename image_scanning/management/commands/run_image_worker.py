@@ -0,0 +1,119 @@
+# image_scanning/management/commands/run_image_worker.py
+
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from image_scanning.services import claim_next_job, run_job, requeue_stale_jobs
+from image_scanning.sessions import warm_up, session_stats
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        'Runs the background removal worker: claims queued BackgroundRemovalJobs '
+        'and processes them outside the web workers. Run one per host (e.g. under systemd).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.IMAGE_WORKER_CONCURRENCY,
+            help='Number of jobs processed in parallel (default: IMAGE_WORKER_CONCURRENCY).',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.IMAGE_WORKER_POLL_INTERVAL,
+            help='Seconds to wait before polling again when the queue is empty.',
+        )
+        parser.add_argument(
+            '--no-warmup',
+            action='store_true',
+            help='Skip loading the rembg model before claiming jobs.',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs.',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+
+        self.stop_event = threading.Event()
+        self.counts = {'done': 0, 'failed': 0}
+        self.counts_lock = threading.Lock()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._request_stop)
+            signal.signal(signal.SIGINT, self._request_stop)
+
+        requeue_stale_jobs() # Jobs orphaned by a previous worker crash
+        if not options['no_warmup']:
+            # Load the model once up front instead of inside the first job
+            try:
+                load_seconds = warm_up()
+                self.stdout.write(f"Loaded rembg model '{settings.REMBG_MODEL}' in {load_seconds:.2f}s.")
+            except Exception as e:
+                logger.error("rembg warm-up failed", exc_info=True)
+                raise CommandError(f"Could not load rembg model '{settings.REMBG_MODEL}': {e}")
+        self.stdout.write(f"Image worker started with concurrency={concurrency}{' (burst)' if burst else ''}.")
+
+        threads = [
+            threading.Thread(target=self._work_loop, args=(poll_interval, burst), name=f"image-worker-{i}")
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # join with a timeout so the main thread keeps receiving signals
+            while thread.is_alive():
+                thread.join(timeout=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Image worker stopped. Done: {self.counts['done']}, failed: {self.counts['failed']}."
+        ))
+        for model_name, stats in session_stats().items():
+            avg = f"{stats['avg_seconds']:.3f}s" if stats['avg_seconds'] is not None else "n/a"
+            self.stdout.write(
+                f"rembg '{model_name}': load {stats['load_seconds']:.2f}s, "
+                f"{stats['inferences']} inference(s), avg {avg}"
+            )
+
+    def _request_stop(self, signum, frame):
+        self.stdout.write(self.style.WARNING("Stopping after the jobs in progress finish..."))
+        self.stop_event.set()
+
+    def _work_loop(self, poll_interval, burst):
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                job = claim_next_job()
+                if job is None:
+                    if burst:
+                        return
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                self.stdout.write(f"[{threading.current_thread().name}] Job {job.id} (upload {job.uploaded_image_id})...")
+                started = time.monotonic()
+                success = run_job(job)
+                with self.counts_lock:
+                    self.counts['done' if success else 'failed'] += 1
+                status = self.style.SUCCESS("OK") if success else self.style.ERROR("FAILED")
+                self.stdout.write(f"[{threading.current_thread().name}] Job {job.id} {status} in {time.monotonic() - started:.2f}s")
+        except Exception:
+            logger.error("Image worker thread crashed", exc_info=True)
+            raise
+        finally:
+            connection.close() # Each thread has its own DB connection
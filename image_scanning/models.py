@@ -48,3 +48,46 @@ class ProcessedClothingItem(models.Model):
     def __str__(self):
         product_str = f" for Product {self.product.title}" if self.product else ""
         return f"Processed image by {self.user.username}{product_str}"
+
+class BackgroundRemovalJob(models.Model):
+    """
+    Queued background removal for one UploadedImage.
+    Web requests only enqueue; the run_image_worker command claims PENDING jobs
+    (SELECT ... FOR UPDATE SKIP LOCKED) and runs remove_background_and_optimize.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    uploaded_image = models.OneToOneField(
+        UploadedImage,
+        on_delete=models.CASCADE,
+        related_name='removal_job'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True) # hostname:pid/thread that ran it last
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query: oldest PENDING first
+            models.Index(fields=['status', 'created_at'], name='removal_job_status_created'),
+        ]
+
+    def __str__(self):
+        return f"Background removal for upload {self.uploaded_image_id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
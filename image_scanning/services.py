@@ -0,0 +1,156 @@
+# image_scanning/services.py
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import utils
+from .models import BackgroundRemovalJob
+
+logger = logging.getLogger(__name__)
+
+
+def get_processed_paths(uploaded_instance):
+    """Generates expected relative path, full path, and URL for the processed image."""
+    if not all([uploaded_instance, uploaded_instance.original_image, uploaded_instance.user]):
+         return None, None, None
+
+    # Replicate logic from models.upload_to_processed
+    base_name = os.path.splitext(os.path.basename(uploaded_instance.original_image.name))[0]
+    processed_filename = f"processed_{base_name}.png" # Standardize name
+    relative_dir = f'image_scanning/processed/{uploaded_instance.user.username}' # Matches models.py function
+
+    processed_relative_path = os.path.join(relative_dir, processed_filename)
+    processed_full_path = os.path.join(settings.MEDIA_ROOT, processed_relative_path)
+    processed_url = os.path.join(settings.MEDIA_URL, processed_relative_path).replace(os.path.sep, '/')
+
+    return processed_relative_path, processed_full_path, processed_url
+
+
+def process_upload(uploaded):
+    """
+    Runs background removal for an UploadedImage and writes the optimized PNG
+    to its processed path. Returns the full path written.
+    """
+    processed_image_pil = utils.remove_background_and_optimize(uploaded.original_image.path)
+
+    relative_path, full_path, _ = get_processed_paths(uploaded)
+    if not full_path: raise ValueError("Could not determine processed image path.")
+
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    processed_image_pil.save(full_path, format='PNG', optimize=True)
+    logger.info(f"Saved optimized processed image to: {full_path}")
+    return full_path
+
+
+def enqueue_removal(uploaded):
+    """
+    Queues background removal for an upload and returns its job.
+    An existing PENDING/RUNNING/DONE job is returned as-is; a FAILED one is re-queued.
+    """
+    job, created = BackgroundRemovalJob.objects.get_or_create(uploaded_image=uploaded)
+    if not created and job.status == BackgroundRemovalJob.STATUS_FAILED:
+        job.status = BackgroundRemovalJob.STATUS_PENDING
+        job.attempts = 0
+        job.error = ''
+        job.save(update_fields=['status', 'attempts', 'error'])
+    if created or job.status == BackgroundRemovalJob.STATUS_PENDING:
+        logger.info(f"Queued background removal job {job.id} for upload {uploaded.id}")
+    return job
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}/{threading.current_thread().name}"[:100]
+
+
+def claim_next_job():
+    """
+    Atomically moves the oldest PENDING job to RUNNING and returns it (or None).
+    SKIP LOCKED lets several worker threads/processes poll the same table
+    without handing out the same job twice.
+    """
+    with transaction.atomic():
+        job = (
+            BackgroundRemovalJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=BackgroundRemovalJob.STATUS_PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = BackgroundRemovalJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.worker = worker_name()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'worker'])
+    return job
+
+
+def _finish_job(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    # update() rather than save(): the upload (and its job) may have been discarded meanwhile
+    BackgroundRemovalJob.objects.filter(pk=job.pk).update(status=status, error=error, finished_at=job.finished_at)
+
+
+def run_job(job):
+    """Processes a claimed job and records DONE or FAILED. Returns True on success."""
+    try:
+        process_upload(job.uploaded_image)
+    except Exception as e:
+        logger.error(f"Background removal job {job.id} failed (attempt {job.attempts}): {e}", exc_info=True)
+        _finish_job(job, BackgroundRemovalJob.STATUS_FAILED, str(e)[:1000])
+        return False
+
+    _finish_job(job, BackgroundRemovalJob.STATUS_DONE)
+    logger.info(f"Background removal job {job.id} done in {(job.finished_at - job.started_at).total_seconds():.2f}s")
+    return True
+
+
+def claim_jobs(job_ids, worker):
+    """
+    Moves the given PENDING jobs to RUNNING for a batch run and returns their ids.
+    Jobs already claimed by run_image_worker are skipped (SKIP LOCKED + status check).
+    started_at is the claim time, which requeue_stale_jobs measures from, so claim
+    jobs right before processing them rather than a whole batch up front.
+    """
+    with transaction.atomic():
+        claimable = list(
+            BackgroundRemovalJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(pk__in=job_ids, status=BackgroundRemovalJob.STATUS_PENDING)
+            .values_list('pk', flat=True)
+        )
+        BackgroundRemovalJob.objects.filter(pk__in=claimable).update(
+            status=BackgroundRemovalJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=timezone.now(),
+            worker=worker[:100],
+        )
+    return claimable
+
+
+def requeue_stale_jobs():
+    """
+    Returns RUNNING jobs whose worker died (started longer than IMAGE_JOB_STALE_AFTER
+    ago) to PENDING, or marks them FAILED once they used up IMAGE_JOB_MAX_ATTEMPTS.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_STALE_AFTER)
+    stale = BackgroundRemovalJob.objects.filter(status=BackgroundRemovalJob.STATUS_RUNNING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.IMAGE_JOB_MAX_ATTEMPTS).update(
+        status=BackgroundRemovalJob.STATUS_FAILED,
+        error="Worker stopped responding too many times.",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=BackgroundRemovalJob.STATUS_PENDING)
+    if failed or requeued:
+        logger.warning(f"Stale background removal jobs: {requeued} re-queued, {failed} failed")
+    return requeued, failed
@@ -0,0 +1,105 @@
+# image_scanning/sessions.py
+"""
+Process-wide registry of rembg sessions.
+Building an ONNX InferenceSession (and loading the model weights) costs far more
+than a single inference, so each process builds one session per model on first
+use and reuses it. InferenceSession.run is thread-safe, so the image worker's
+threads share the same session.
+"""
+import io
+import logging
+import threading
+import time
+
+import onnxruntime as ort
+from django.conf import settings
+from PIL import Image
+from rembg import new_session, remove
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_MODELS = ('u2net', 'u2netp', 'isnet-general-use', 'silueta')
+
+_sessions = {}
+_lock = threading.Lock()
+_stats = {} # model name -> {'load_seconds', 'inferences', 'total_seconds', 'last_seconds'}
+
+
+def _session_options(intra_op_threads=None):
+    """ONNX thread bounds from settings; 0 leaves the onnxruntime default (all cores)."""
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = settings.REMBG_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    sess_opts.inter_op_num_threads = settings.REMBG_INTER_OP_THREADS
+    return sess_opts
+
+
+def get_session(model_name=None, intra_op_threads=None):
+    """
+    Returns this process's session for model_name (default: REMBG_MODEL), building it once.
+    intra_op_threads overrides REMBG_INTRA_OP_THREADS for the build (e.g. one thread
+    per process in a process pool); it has no effect once the session exists.
+    """
+    model_name = model_name or settings.REMBG_MODEL
+    session = _sessions.get(model_name)
+    if session is not None:
+        return session
+
+    if model_name not in SUPPORTED_MODELS:
+        raise ValueError(f"Unsupported rembg model '{model_name}'. Choose one of: {', '.join(SUPPORTED_MODELS)}")
+
+    with _lock:
+        session = _sessions.get(model_name)
+        if session is None: # Another thread may have built it while we waited
+            started = time.perf_counter()
+            session = new_session(model_name, sess_opts=_session_options(intra_op_threads))
+            load_seconds = time.perf_counter() - started
+            _sessions[model_name] = session
+            _stats[model_name] = {'load_seconds': load_seconds, 'inferences': 0, 'total_seconds': 0.0, 'last_seconds': None}
+            logger.info(f"Loaded rembg model '{model_name}' in {load_seconds:.2f}s")
+    return session
+
+
+def remove_background(input_data, model_name=None):
+    """
+    rembg.remove() using the shared session; records per-inference latency.
+    Returns the same type it is given (PNG bytes or a PIL image).
+    """
+    model_name = model_name or settings.REMBG_MODEL
+    session = get_session(model_name)
+    started = time.perf_counter()
+    output = remove(input_data, session=session)
+    elapsed = time.perf_counter() - started
+    with _lock:
+        model_stats = _stats[model_name]
+        model_stats['inferences'] += 1
+        model_stats['total_seconds'] += elapsed
+        model_stats['last_seconds'] = elapsed
+    logger.debug(f"rembg '{model_name}' inference took {elapsed:.3f}s")
+    return output
+
+
+def warm_up(model_name=None, intra_op_threads=None):
+    """
+    Builds the session and runs one tiny inference so the first real upload
+    doesn't pay for model download/load or ONNX graph initialization.
+    Returns the model load time in seconds.
+    """
+    model_name = model_name or settings.REMBG_MODEL
+    get_session(model_name, intra_op_threads)
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(buffer, format='PNG')
+    remove_background(buffer.getvalue(), model_name)
+    return _stats[model_name]['load_seconds']
+
+
+def session_stats():
+    """Snapshot of load time and inference latency per loaded model."""
+    with _lock:
+        snapshot = {}
+        for model_name, model_stats in _stats.items():
+            inferences = model_stats['inferences']
+            snapshot[model_name] = dict(
+                model_stats,
+                avg_seconds=model_stats['total_seconds'] / inferences if inferences else None,
+            )
+        return snapshot
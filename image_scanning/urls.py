@@ -7,7 +7,11 @@ app_name = 'image_scanning'
 urlpatterns = [
     path('guide/', views.scanning_guide, name='scanning_guide'),
     path('upload/', views.upload_image, name='upload_image'),
+    path('upload/batch/', views.upload_batch, name='upload_batch'),
+    path('upload/batch/status/', views.batch_status, name='batch_status'),
+    path('upload/batch/status.json', views.batch_status_json, name='batch_status_json'),
     path('process/<int:uploaded_id>/', views.process_image, name='process_image'),
     path('preview/<int:uploaded_id>/', views.process_preview, name='process_preview'),
+    path('status/<int:uploaded_id>/', views.job_status, name='job_status'),
     path('edit/<int:uploaded_id>/', views.edit_image, name='edit_image'),
 ]
\ No newline at end of file
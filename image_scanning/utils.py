@@ -1,10 +1,9 @@
 # image_scanning/utils.py
-import io
 import logging
-from rembg import remove
-from PIL import Image, ImageEnhance, ImageOps # Ensure ImageOps is imported
+from PIL import Image, ImageOps
 import numpy as np
 import cv2
+from .sessions import remove_background
 
 logger = logging.getLogger(__name__)
 
@@ -15,39 +14,79 @@ def read_image_from_django_file(django_file):
     image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
     return image
 
+# Shadow lift: in HSV terms, V < 0.4 is raised to V ** 0.8. Changing V with hue and
+# saturation fixed scales R, G and B by the same factor f(V) / V, where V = max(R, G, B),
+# so the lift is a per-pixel gain looked up from this table, with no HSV round trip.
+SHADOW_THRESHOLD = 0.4
+SHADOW_GAMMA = 0.8
+CONTRAST_FACTOR = 1.1 # Same as ImageEnhance.Contrast(image).enhance(1.1)
+
+_levels = np.arange(256, dtype=np.float32)
+_in_shadow = (_levels > 0) & (_levels < SHADOW_THRESHOLD * 255)
+SHADOW_GAIN = np.ones(256, dtype=np.float32)
+SHADOW_GAIN[_in_shadow] = 255.0 * np.power(_levels[_in_shadow] / 255.0, SHADOW_GAMMA) / _levels[_in_shadow]
+del _levels, _in_shadow
+
+def load_downsized(file_path, max_dimension):
+    """
+    Opens an upload already reduced to fit max_dimension. JPEGs are decoded at
+    1/2, 1/4 or 1/8 scale via draft(), so a 12MP phone photo is never fully decoded.
+    EXIF orientation is applied here, since rembg would otherwise do it.
+    """
+    image = Image.open(file_path)
+    image.draft('RGB', (max_dimension, max_dimension)) # No-op for non-JPEG files
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS) # High-quality downscaling
+    return image
+
+def postprocess_cutout(rgba):
+    """
+    Shadow lift + contrast on an RGBA uint8 array, in place and in one float pass.
+    Equivalent to the HSV shadow lift followed by ImageEnhance.Contrast(1.1):
+    out = mean + 1.1 * (gain(V) * rgb - mean), with mean the luma mean after the lift.
+    """
+    rgb = rgba[..., :3]
+    gain = SHADOW_GAIN[rgb.max(axis=2)] # HxW float32
+    luma = cv2.cvtColor(rgba, cv2.COLOR_RGBA2GRAY)
+    lifted_mean = float(np.mean(luma * gain)) # Mean grayscale of the lifted image, as ImageEnhance computes it
+    mean = int(lifted_mean + 0.5)
+
+    gain *= CONTRAST_FACTOR
+    out = rgb.astype(np.float32)
+    out *= gain[..., None]
+    out += mean * (1.0 - CONTRAST_FACTOR) + 0.5 # +0.5 rounds on the uint8 store below
+    np.clip(out, 0, 255, out=out)
+    rgb[...] = out
+    return rgba
+
 def remove_background_and_optimize(file_path, max_dimension=1024):
     """
     Removes background, applies post-processing, resizes, and returns
     an optimized PIL Image object (RGBA).
+    The upload is downsized to max_dimension first, so background removal,
+    post-processing and the returned image all work on at most
+    max_dimension x max_dimension pixels.
     """
     logger.info(f"Starting background removal for: {file_path}")
     try:
-        with open(file_path, 'rb') as f: input_bytes = f.read()
+        image = load_downsized(file_path, max_dimension)
+        logger.debug(f"Loaded image downsized to: {image.size}")
 
-        # Use rembg for background removal
-        output_bytes = remove(input_bytes)
-        if not output_bytes: raise ValueError("Background removal returned empty output.")
-        output_image = Image.open(io.BytesIO(output_bytes)).convert("RGBA")
+        # Use rembg for background removal (shared per-process session, see sessions.py)
+        # Passing a PIL image skips the PNG encode/decode of the cutout
+        output_image = remove_background(image)
+        if output_image is None: raise ValueError("Background removal returned empty output.")
         logger.info("Background removal successful.")
 
-        # Optional Post-processing (keep if helpful)
         logger.debug("Applying post-processing...")
-        output_np = np.array(output_image); rgb = output_np[...,:3]; alpha = output_np[...,3]
-        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV).astype(np.float32); hsv[...,2] /= 255.0
-        shadow_mask = hsv[...,2] < 0.4; hsv[...,2][shadow_mask] = np.power(hsv[...,2][shadow_mask], 0.8)
-        hsv[...,2] *= 255.0; hsv = hsv.astype(np.uint8); processed_rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
-        processed_image = Image.fromarray(processed_rgb); enhancer = ImageEnhance.Contrast(processed_image)
-        processed_image = enhancer.enhance(1.1); final_image_np = np.dstack([np.array(processed_image), alpha])
-        final_image = Image.fromarray(final_image_np, mode="RGBA")
-        logger.debug("Post-processing applied.")
-
-        # --- Resize image ---
-        logger.debug(f"Resizing image to max dimension: {max_dimension}px")
-        resized_image = final_image.copy()
-        resized_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS) # High-quality downscaling
-        logger.info(f"Image resized to: {resized_image.size}")
+        rgba = np.array(output_image.convert("RGBA")) # Writable copy; post-processing runs in place
+        postprocess_cutout(rgba)
+        final_image = Image.fromarray(rgba)
+        logger.info(f"Processed image size: {final_image.size}")
 
-        return resized_image # Return the resized PIL image
+        return final_image
 
     except Exception as e:
         logger.error(f"Error in remove_background_and_optimize for {file_path}: {e}", exc_info=True)
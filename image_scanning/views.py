@@ -8,33 +8,17 @@ from django.contrib import messages
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.urls import reverse
+from django.http import JsonResponse
 
-from .forms import UploadedImageForm
-from .models import UploadedImage # Import model containing upload_to functions
+from .forms import UploadedImageForm, BatchUploadForm
+from .models import UploadedImage, BackgroundRemovalJob # Import model containing upload_to functions
+from .services import get_processed_paths, enqueue_removal
 # Remove ProcessedClothingItem if not directly used
 from marketplace.models import Product, ProductImage
-from . import utils
 import logging
 
 logger = logging.getLogger(__name__)
 
-# --- Helper to get expected paths/url (Revised) ---
-def get_processed_paths(uploaded_instance: UploadedImage):
-    """Generates expected relative path, full path, and URL for the processed image."""
-    if not all([uploaded_instance, uploaded_instance.original_image, uploaded_instance.user]):
-         return None, None, None
-
-    # Replicate logic from models.upload_to_processed
-    base_name = os.path.splitext(os.path.basename(uploaded_instance.original_image.name))[0]
-    processed_filename = f"processed_{base_name}.png" # Standardize name
-    relative_dir = f'image_scanning/processed/{uploaded_instance.user.username}' # Matches models.py function
-
-    processed_relative_path = os.path.join(relative_dir, processed_filename)
-    processed_full_path = os.path.join(settings.MEDIA_ROOT, processed_relative_path)
-    processed_url = os.path.join(settings.MEDIA_URL, processed_relative_path).replace(os.path.sep, '/')
-
-    return processed_relative_path, processed_full_path, processed_url
-
 # --- Views ---
 
 @login_required
@@ -53,9 +37,7 @@ def upload_image(request):
             try:
                 uploaded = form.save(commit=False); uploaded.user = request.user; uploaded.save()
                 logger.info(f"Uploaded image {uploaded.id} saved by {request.user.email}")
-                # Instead of redirecting to process_image, redirect to the preview page
-                # which will *trigger* processing via JS if needed, or show result.
-                # For now, we stick to sync: redirect to process which redirects to preview
+                # process_image queues background removal; the preview page polls until it's done
                 return redirect('image_scanning:process_image', uploaded_id=uploaded.id)
             except Exception as e:
                  logger.error(f"Error saving uploaded image: {e}", exc_info=True)
@@ -65,29 +47,91 @@ def upload_image(request):
     return render(request, 'image_scanning/upload.html', {'form': form})
 
 @login_required
-def process_image(request, uploaded_id):
+def upload_batch(request):
     """
-    Processes the image synchronously, saves optimized version, redirects to preview.
+    Multi-file upload for bulk closet imports. Every file becomes an UploadedImage
+    with a queued BackgroundRemovalJob; batch_status shows their progress.
     """
-    uploaded = get_object_or_404(UploadedImage, id=uploaded_id, user=request.user)
-    try:
-        logger.info(f"Processing image {uploaded_id} for {request.user.email}")
-        processed_image_pil = utils.remove_background_and_optimize(uploaded.original_image.path)
-
-        relative_path, full_path, _ = get_processed_paths(uploaded)
-        if not full_path: raise ValueError("Could not determine processed image path.")
+    if request.method == 'POST':
+        form = BatchUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            uploaded_ids = []
+            try:
+                for image_file in form.cleaned_data['images']:
+                    uploaded = UploadedImage.objects.create(user=request.user, original_image=image_file)
+                    enqueue_removal(uploaded)
+                    uploaded_ids.append(uploaded.id)
+            except Exception as e:
+                logger.error(f"Error saving batch upload for {request.user.email}: {e}", exc_info=True)
+                messages.error(request, "Could not save all uploaded images.")
+            if uploaded_ids:
+                logger.info(f"Batch of {len(uploaded_ids)} images queued by {request.user.email}")
+                request.session['batch_upload_ids'] = uploaded_ids
+                messages.success(request, f"{len(uploaded_ids)} image(s) queued for background removal.")
+                return redirect('image_scanning:batch_status')
+        else: messages.error(request, "Invalid files or form data.")
+    else: form = BatchUploadForm()
+    return render(request, 'image_scanning/upload_batch.html', {'form': form, 'max_files': BatchUploadForm.MAX_FILES})
+
+def _batch_uploads(request):
+    ids = request.session.get('batch_upload_ids', [])
+    return UploadedImage.objects.filter(id__in=ids, user=request.user).select_related('removal_job', 'user').order_by('id')
 
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        processed_image_pil.save(full_path, format='PNG', optimize=True)
-        logger.info(f"Saved optimized processed image to: {full_path}")
+@login_required
+def batch_status(request):
+    """Progress page for the last batch upload; polls batch_status_json."""
+    uploads = list(_batch_uploads(request))
+    for uploaded in uploads:
+        uploaded.processed_url = get_processed_paths(uploaded)[2]
+    return render(request, 'image_scanning/batch_status.html', {'uploads': uploads})
 
-        # Redirect to the preview page
-        return redirect('image_scanning:process_preview', uploaded_id=uploaded.id)
+@login_required
+def batch_status_json(request):
+    """Job status for every upload in the last batch."""
+    items = []
+    for uploaded in _batch_uploads(request):
+        job = getattr(uploaded, 'removal_job', None)
+        status = job.status if job else None
+        items.append({
+            'id': uploaded.id,
+            'status': status,
+            'processed_url': get_processed_paths(uploaded)[2] if status == BackgroundRemovalJob.STATUS_DONE else None,
+            'preview_url': reverse('image_scanning:process_preview', kwargs={'uploaded_id': uploaded.id}),
+        })
+    done = sum(1 for item in items if item['status'] in (BackgroundRemovalJob.STATUS_DONE, BackgroundRemovalJob.STATUS_FAILED))
+    return JsonResponse({'items': items, 'finished': done, 'total': len(items)})
 
+@login_required
+def process_image(request, uploaded_id):
+    """
+    Queues background removal for the upload and redirects to the preview page,
+    which polls job_status until the worker (run_image_worker) has finished.
+    """
+    uploaded = get_object_or_404(UploadedImage, id=uploaded_id, user=request.user)
+    try:
+        enqueue_removal(uploaded)
     except Exception as e:
-        logger.error(f"Error processing image {uploaded_id}: {e}", exc_info=True)
+        logger.error(f"Error queueing image {uploaded_id}: {e}", exc_info=True)
         messages.error(request, f"Error processing image: Please try uploading again.")
         return redirect('image_scanning:upload_image')
+    return redirect('image_scanning:process_preview', uploaded_id=uploaded.id)
+
+@login_required
+def job_status(request, uploaded_id):
+    """JSON status of the upload's background removal job, polled by the processing page."""
+    uploaded = get_object_or_404(UploadedImage, id=uploaded_id, user=request.user)
+    job = BackgroundRemovalJob.objects.filter(uploaded_image=uploaded).first()
+    if job is None:
+        return JsonResponse({'status': None, 'error': "No processing job found for this image."}, status=404)
+    # job.error holds the raw exception for admins; users get a generic message
+    failed = job.status == BackgroundRemovalJob.STATUS_FAILED
+    data = {'status': job.status, 'error': "Background removal failed. Please try again." if failed else ''}
+    if job.status == BackgroundRemovalJob.STATUS_PENDING:
+        # Rough queue position so the page can say "2 images ahead of yours"
+        data['queue_position'] = BackgroundRemovalJob.objects.filter(
+            status=BackgroundRemovalJob.STATUS_PENDING, created_at__lt=job.created_at
+        ).count()
+    return JsonResponse(data)
 
 @login_required
 def process_preview(request, uploaded_id):
@@ -95,6 +139,11 @@ def process_preview(request, uploaded_id):
      uploaded = get_object_or_404(UploadedImage, id=uploaded_id, user=request.user)
      relative_path, full_path, processed_url = get_processed_paths(uploaded)
 
+     # Still queued/running (or failed): show the polling page instead of the preview
+     job = BackgroundRemovalJob.objects.filter(uploaded_image=uploaded).first()
+     if job and job.status != BackgroundRemovalJob.STATUS_DONE and request.method != 'POST':
+         return render(request, 'image_scanning/processing.html', {'uploaded': uploaded, 'job': job})
+
      if not processed_url or not os.path.exists(full_path):
          # Maybe the file is still being processed? Or failed?
          # Re-trigger processing just in case? Or assume failure?
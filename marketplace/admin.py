@@ -7,7 +7,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category', 'condition', 'is_sold', 'created_at')
     search_fields = ('title', 'description', 'seller__username')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'saved_count', 'cart_count')
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
@@ -0,0 +1,200 @@
+# marketplace/colors.py
+"""
+Dominant colors of ProductImage files, for searching by color swatch instead of
+matching the free-text Product.color. Foreground pixels (alpha from background
+removal) are converted to CIE Lab and counted in a coarse Lab grid; the most
+common cells become ProductImage.dominant_colors (for display) and those covering
+at least INDEX_MIN_SHARE of the item go into ProductImage.color_bins, which has a
+GIN index. Every grid cell belongs to exactly one swatch, the one with the nearest
+prototype color, so any indexed color is findable and the filter is one indexed
+array overlap (&&). Colors are extracted when an image is finalized or edited, and
+by the extract_colors management command for existing media.
+"""
+import logging
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Lab grid: L 0..100 in steps of 20, a and b -110..110 in steps of 20. The a/b cells are
+# centered on 0, so neutrals (grey, black, white) get cells of their own, and the range
+# covers fully saturated sRGB (pure blue is b = -108).
+L_STEP = 20
+AB_STEP = 20
+AB_MIN = -110
+L_BINS = 5
+AB_BINS = 11
+BIN_COUNT = L_BINS * AB_BINS * AB_BINS # 605, fits a smallint
+
+ANALYSIS_SIZE = 256 # Images are thumbnailed to this first; dominant colors don't need detail
+ALPHA_THRESHOLD = 128 # Pixels at least this opaque are the item
+MAX_COLORS = 5
+MIN_SHARE = 0.05 # Smallest share of the item kept in dominant_colors
+INDEX_MIN_SHARE = 0.15 # Smallest share that makes an image match a swatch
+
+# (slug, label, hex) offered by the swatch filter
+SWATCHES = (
+    ('black', 'Black', '#1c1c1c'),
+    ('white', 'White', '#f5f5f0'),
+    ('grey', 'Grey', '#8c8c8c'),
+    ('beige', 'Beige', '#d8c3a5'),
+    ('brown', 'Brown', '#6f4e37'),
+    ('red', 'Red', '#c0392b'),
+    ('pink', 'Pink', '#f4a6b8'),
+    ('orange', 'Orange', '#e67e22'),
+    ('yellow', 'Yellow', '#f1c40f'),
+    ('green', 'Green', '#2e8b57'),
+    ('blue', 'Blue', '#2f5fa7'),
+    ('navy', 'Navy', '#1f2a44'),
+    ('purple', 'Purple', '#7d3c98'),
+)
+# Further colors each swatch stands for (besides its own hex). Cells go to the swatch with the
+# nearest prototype; a single muted hex per swatch leaves e.g. pure blue closer to purple.
+SWATCH_PROTOTYPES = {
+    'black': ('#000000',),
+    'white': ('#ffffff',),
+    'grey': ('#a9a9a9', '#5a5a5a', '#c8c8c8'),
+    'beige': ('#d2b48c', '#f5f5dc'),
+    'brown': ('#8b4513', '#a0522d', '#654321'),
+    'red': ('#ff0000', '#8b0000', '#dc143c'),
+    'pink': ('#ffc0cb', '#ff69b4', '#ff1493'),
+    'orange': ('#ffa500', '#ff8c00', '#ff4500'),
+    'yellow': ('#ffff00', '#ffd700', '#f0e68c'),
+    'green': ('#008000', '#00ff00', '#228b22', '#6b8e23', '#006400'),
+    'blue': ('#0000ff', '#4169e1', '#1e90ff', '#4682b4', '#87ceeb', '#0000cd'),
+    'navy': ('#000080', '#191970', '#00008b'),
+    'purple': ('#800080', '#9400d3', '#8a2be2', '#ee82ee'),
+}
+
+
+def rgb_to_lab(rgb):
+    """(N, 3) uint8 RGB -> (N, 3) float32 Lab (L 0..100, a/b about -128..127)."""
+    rgb = np.asarray(rgb, dtype=np.float32).reshape(-1, 1, 3) / 255.0
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB).reshape(-1, 3)
+
+
+def lab_to_hex(lab):
+    rgb = cv2.cvtColor(np.asarray(lab, dtype=np.float32).reshape(1, 1, 3), cv2.COLOR_LAB2RGB).reshape(3)
+    r, g, b = (int(round(c)) for c in np.clip(rgb * 255.0, 0, 255))
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def hex_to_rgb(value):
+    value = value.strip().lstrip('#')
+    if len(value) == 3:
+        value = ''.join(c * 2 for c in value)
+    if len(value) != 6:
+        raise ValueError(f"Not a hex color: {value!r}")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def quantize(lab):
+    """Lab grid cell of each (N, 3) Lab row."""
+    l = np.clip((lab[:, 0] // L_STEP).astype(np.int64), 0, L_BINS - 1)
+    a = np.clip(((lab[:, 1] - AB_MIN) // AB_STEP).astype(np.int64), 0, AB_BINS - 1)
+    b = np.clip(((lab[:, 2] - AB_MIN) // AB_STEP).astype(np.int64), 0, AB_BINS - 1)
+    return (l * AB_BINS + a) * AB_BINS + b
+
+
+def _bin_centers():
+    cells = np.arange(BIN_COUNT)
+    l, rest = np.divmod(cells, AB_BINS * AB_BINS)
+    a, b = np.divmod(rest, AB_BINS)
+    return np.stack([
+        (l + 0.5) * L_STEP,
+        AB_MIN + (a + 0.5) * AB_STEP,
+        AB_MIN + (b + 0.5) * AB_STEP,
+    ], axis=1).astype(np.float32)
+
+
+BIN_CENTERS = _bin_centers()
+
+
+def dominant_colors(rgba):
+    """
+    [{'hex', 'share', 'bin'}, ...] for an (H, W, 4) uint8 array, most common first.
+    share is the fraction of foreground pixels; hex is their mean color in that cell.
+    Images without transparency are analysed whole.
+    """
+    pixels = rgba.reshape(-1, 4)
+    foreground = pixels[pixels[:, 3] >= ALPHA_THRESHOLD, :3]
+    if not len(foreground):
+        return []
+    lab = rgb_to_lab(foreground)
+    bins = quantize(lab)
+    counts = np.bincount(bins, minlength=BIN_COUNT)
+    sums = np.stack([np.bincount(bins, weights=lab[:, c], minlength=BIN_COUNT) for c in range(3)], axis=1)
+
+    colors = []
+    for cell in np.argsort(-counts, kind='stable')[:MAX_COLORS]:
+        share = counts[cell] / len(foreground)
+        if share < MIN_SHARE:
+            break
+        colors.append({
+            'hex': lab_to_hex(sums[cell] / counts[cell]),
+            'share': round(float(share), 3),
+            'bin': int(cell),
+        })
+    return colors
+
+
+def index_bins(colors):
+    """The cells of dominant_colors() output that go into ProductImage.color_bins."""
+    return sorted(color['bin'] for color in colors if color['share'] >= INDEX_MIN_SHARE)
+
+
+def _swatch_bins():
+    """{slug: grid cells}: each cell goes to the swatch whose nearest prototype is closest (Lab CIE76)."""
+    slugs, prototypes = [], []
+    for slug, _, hex_color in SWATCHES:
+        for prototype in (hex_color, *SWATCH_PROTOTYPES.get(slug, ())):
+            slugs.append(slug)
+            prototypes.append(hex_to_rgb(prototype))
+    distances = np.linalg.norm(BIN_CENTERS[:, None, :] - rgb_to_lab(prototypes)[None, :, :], axis=2)
+    nearest = distances.argmin(axis=1)
+    bins = {slug: [] for slug, _, _ in SWATCHES}
+    for cell, prototype in enumerate(nearest.tolist()):
+        bins[slugs[prototype]].append(cell)
+    return bins
+
+
+SWATCH_BINS = _swatch_bins()
+
+
+def filter_by_swatch(queryset, swatch):
+    """Products whose primary image has a dominant color assigned to a SWATCHES slug (unknown slugs are ignored)."""
+    bins = SWATCH_BINS.get(swatch)
+    if not bins:
+        return queryset
+    return queryset.filter(primary_image__color_bins__overlap=bins)
+
+
+def extract_colors(product_image):
+    """
+    Computes and stores dominant_colors and color_bins for product_image.
+    Returns the dominant colors.
+    """
+    with product_image.image.open('rb') as f:
+        source = Image.open(f)
+        source.draft('RGB', (ANALYSIS_SIZE, ANALYSIS_SIZE)) # No-op for non-JPEG files
+        source.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+    colors = dominant_colors(np.asarray(source.convert('RGBA')))
+    bins = index_bins(colors)
+
+    # update() so extraction doesn't fire ProductImage signals
+    type(product_image).objects.filter(pk=product_image.pk).update(dominant_colors=colors, color_bins=bins)
+    product_image.dominant_colors = colors
+    product_image.color_bins = bins
+    logger.info(f"Extracted {len(colors)} dominant colors for ProductImage {product_image.pk}")
+    return colors
+
+
+def safe_extract_colors(product_image):
+    """extract_colors() for request paths: failures are logged and the image just won't match swatches."""
+    try:
+        return extract_colors(product_image)
+    except Exception as e:
+        logger.error(f"Error extracting colors for ProductImage {product_image.pk}: {e}", exc_info=True)
+        return None
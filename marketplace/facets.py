@@ -0,0 +1,84 @@
+# marketplace/facets.py
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('category', 'condition', 'size', 'color', 'material')
+# Facets filtered by exact choice values (checkbox lists); the rest use icontains
+EXACT_FACETS = ('category', 'condition')
+
+FACET_CACHE_TIMEOUT = 60 * 10 # Seconds; also bounds staleness from queryset.update() calls
+GENERATION_KEY = 'marketplace:facets:generation'
+
+
+def invalidate_facets():
+    """Bumps the facet generation so every cached facet table is ignored."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError: # Key missing (first bump or evicted)
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def _facet_rows(base_queryset, scope, cache_params):
+    """
+    Returns [(category, condition, size, color, material, count), ...] for base_queryset,
+    computed with a single GROUP BY query and cached per (generation, scope, params).
+    """
+    params_hash = hashlib.md5(json.dumps(cache_params, sort_keys=True).encode()).hexdigest()
+    key = f"marketplace:facets:{_generation()}:{scope}:{params_hash}"
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(
+            base_queryset.order_by().values_list(*FACET_FIELDS).annotate(n=Count('pk'))
+        )
+        cache.set(key, rows, FACET_CACHE_TIMEOUT)
+        logger.debug(f"Facet cache miss for {scope} ({len(rows)} combinations)")
+    return rows
+
+
+def _matches(field, value, selected):
+    """True if a row's value for field passes the currently selected filter for field."""
+    wanted = selected.get(field)
+    if not wanted:
+        return True
+    if field in EXACT_FACETS:
+        return value in wanted
+    return bool(value) and wanted.lower() in value.lower()
+
+
+def facet_counts(base_queryset, scope, cache_params, selected, fields=FACET_FIELDS):
+    """
+    Computes {field: {value: count}} for the filter modal.
+    base_queryset: products filtered by everything except the facet filters
+        (availability, search query, owner...).
+    scope / cache_params: identify base_queryset in the cache, e.g.
+        scope='public', cache_params={'q': ..., 'is_sold': [...]}.
+    selected: currently applied facet filters, e.g. {'category': ['TOPS'], 'color': 'red'}.
+    Each field's counts honour every *other* selected filter, so the modal shows
+    how many results a choice would give ("Tops (134)") without hiding siblings.
+    Empty/null values are left out.
+    """
+    rows = _facet_rows(base_queryset, scope, cache_params)
+    counts = {field: {} for field in fields}
+    for row in rows:
+        values = dict(zip(FACET_FIELDS, row[:-1]))
+        n = row[-1]
+        passing = {field: _matches(field, values[field], selected) for field in FACET_FIELDS}
+        for field in fields:
+            value = values[field]
+            if not value:
+                continue
+            if all(ok for other, ok in passing.items() if other != field):
+                counts[field][value] = counts[field].get(value, 0) + n
+            else:
+                counts[field].setdefault(value, 0)
+    return counts
@@ -0,0 +1,132 @@
+# marketplace/management/commands/benchmark_search.py
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from marketplace.models import Product
+from marketplace.search import search_products
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary used to build synthetic listings
+WORDS = [
+    'vintage', 'denim', 'jacket', 'floral', 'dress', 'linen', 'shirt', 'cotton', 'knit',
+    'sweater', 'pleated', 'skirt', 'leather', 'boots', 'wool', 'coat', 'silk', 'blouse',
+    'cargo', 'pants', 'striped', 'polo', 'oversized', 'hoodie', 'corduroy', 'trousers',
+]
+COLORS = ['black', 'white', 'beige', 'navy', 'olive', 'red', 'pink', 'brown', 'grey', 'blue']
+MATERIALS = ['cotton', 'polyester', 'denim', 'wool', 'linen', 'silk', 'leather', 'nylon']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks product search: the old ILIKE path vs the tsvector/trigram indexed path. '
+        'Synthetic products are inserted inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10000, 100000, 1000000],
+            help='Catalog sizes to benchmark (default: 10k, 100k, 1M).',
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['denim jacket', 'floral', 'sweatr', 'leather boots black'],
+            help='Search terms to time (include a typo to exercise the trigram fallback).',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per query; the median is reported.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("This benchmark requires PostgreSQL.")
+
+        sizes = sorted(options['sizes'])
+        queries = options['queries']
+        repeat = max(1, options['repeat'])
+
+        self.stdout.write(f"{'products':>10} {'query':<24} {'ilike ms':>10} {'indexed ms':>11} {'speedup':>8} {'hits':>7}")
+        self.stdout.write("-" * 75)
+
+        with transaction.atomic():
+            seller_id = self._create_seller()
+            inserted = 0
+            for size in sizes:
+                self._insert_products(seller_id, inserted, size - inserted)
+                inserted = size
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE marketplace_product")
+
+                for q in queries:
+                    ilike_qs = Product.objects.filter(Q(title__icontains=q) | Q(description__icontains=q))
+                    indexed_qs = search_products(Product.objects.all(), q).order_by('-search_score', '-pk')
+
+                    ilike_ms = self._time(lambda: list(ilike_qs.order_by('-created_at')[:12]), repeat)
+                    indexed_ms = self._time(lambda: list(indexed_qs[:12]), repeat)
+                    hits = indexed_qs.count()
+                    speedup = ilike_ms / indexed_ms if indexed_ms else 0
+                    self.stdout.write(f"{size:>10} {q[:24]:<24} {ilike_ms:>10.2f} {indexed_ms:>11.2f} {speedup:>7.1f}x {hits:>7}")
+
+            # Never keep the synthetic catalog
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark complete (synthetic data rolled back)."))
+
+    def _time(self, fn, repeat):
+        """Runs fn `repeat` times and returns the median wall time in milliseconds."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2]
+
+    def _create_seller(self):
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        seller = User.objects.create(email='search-benchmark@example.invalid', username='search-benchmark')
+        return seller.pk
+
+    def _insert_products(self, seller_id, offset, count):
+        """Bulk-inserts synthetic products server-side with generate_series (the search trigger fills search_vector)."""
+        if count <= 0:
+            return
+        self.stdout.write(f"Inserting {count} synthetic products...")
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO marketplace_product
+                    (seller_id, title, description, price, quantity, size, color, material,
+                     category, condition, is_sold, is_public, created_at, updated_at,
+                     saved_count, cart_count)
+                SELECT
+                    %(seller)s,
+                    w[1 + (i * 7) %% n] || ' ' || w[1 + (i * 13) %% n] || ' ' || w[1 + (i * 17) %% n],
+                    'Pre-loved ' || w[1 + (i * 3) %% n] || ' ' || w[1 + (i * 11) %% n] || ' in good condition, item ' || i,
+                    (i %% 2000) + 50, 1, 'M',
+                    c[1 + i %% array_length(c, 1)],
+                    m[1 + i %% array_length(m, 1)],
+                    'TOPS', 'GU', false, true, now(), now(),
+                    0, 0 -- NOT NULL with only a Python-side default
+                FROM generate_series(%(start)s, %(stop)s) AS i,
+                     (SELECT %(words)s::text[] AS w, %(colors)s::text[] AS c, %(materials)s::text[] AS m,
+                             array_length(%(words)s::text[], 1) AS n) AS vocab
+                """,
+                {
+                    'seller': seller_id, 'start': offset + 1, 'stop': offset + count,
+                    'words': WORDS, 'colors': COLORS, 'materials': MATERIALS,
+                },
+            )
+        logger.info(f"Inserted {count} synthetic products in {time.perf_counter() - start:.1f}s")
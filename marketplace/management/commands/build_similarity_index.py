@@ -0,0 +1,79 @@
+# marketplace/management/commands/build_similarity_index.py
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from marketplace.models import Product, ProductImage
+from marketplace import similarity
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        'Computes missing "more like this" image embeddings, then rewrites the memory-mapped '
+        'similarity index from all available public products (dropping sold/hidden rows).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute embeddings even for images that already have current ones.',
+        )
+        parser.add_argument(
+            '--benchmark',
+            type=int,
+            default=0,
+            metavar='QUERIES',
+            help='Afterwards, time this many random nearest-neighbour queries.',
+        )
+
+    def handle(self, *args, **options):
+        images_to_process = ProductImage.objects.exclude(image='')
+        if not options['force']:
+            images_to_process = images_to_process.filter(
+                Q(embedding__isnull=True) | ~Q(embedding_version=similarity.FEATURE_VERSION)
+            )
+        total_images = images_to_process.count()
+        self.stdout.write(f"Computing embeddings for {total_images} image(s)...")
+
+        failure_count = 0
+        for product_image in images_to_process.order_by('id').iterator(): # Use iterator for memory efficiency
+            try:
+                similarity.compute_embedding(product_image)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"ProductImage {product_image.id}: ERROR ({e})"))
+                failure_count += 1
+                logger.error(f"Management command error processing ProductImage {product_image.id}", exc_info=True)
+
+        available = (
+            Product.objects.filter(is_public=True, is_sold=False, quantity__gt=0, primary_image__isnull=False)
+            .select_related('primary_image')
+            .order_by('id')
+        )
+        entries = (
+            (product.pk, vector) for product in available.iterator()
+            if (vector := similarity.embedding_vector(product.primary_image)) is not None
+        )
+        indexed = similarity.rebuild(entries)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
+        if failure_count > 0:
+            self.stdout.write(self.style.ERROR(f"Failed embeddings: {failure_count}"))
+
+        if options['benchmark'] and indexed:
+            vectors, _ = similarity.index_arrays()
+            timings = []
+            for _ in range(options['benchmark']):
+                query = vectors[random.randrange(len(vectors))].copy()
+                started = time.perf_counter()
+                similarity.nearest(query, 24)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{options['benchmark']} queries over {indexed} rows: "
+                f"median {statistics.median(timings):.2f}ms, max {max(timings):.2f}ms"
+            )
@@ -0,0 +1,68 @@
+# marketplace/management/commands/extract_colors.py
+
+from django.core.management.base import BaseCommand
+from marketplace.models import ProductImage
+from marketplace.colors import extract_colors
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Extracts dominant colors (for the color swatch filter) from existing ProductImages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-extract colors even for images that already have them.',
+        )
+        parser.add_argument(
+            '--image_ids',
+            nargs='+',
+            type=int,
+            help='Specific ProductImage IDs to process.',
+        )
+
+    def handle(self, *args, **options):
+        force_extraction = options['force']
+        specific_ids = options['image_ids']
+
+        images_to_process = ProductImage.objects.exclude(image='')
+
+        if specific_ids:
+            self.stdout.write(f"Processing specific image IDs: {specific_ids}")
+            images_to_process = images_to_process.filter(id__in=specific_ids)
+        elif not force_extraction:
+            images_to_process = images_to_process.filter(dominant_colors=[])
+            self.stdout.write("Processing images missing dominant colors...")
+        else:
+            self.stdout.write(self.style.WARNING("Processing ALL images (including extracted ones) due to --force flag."))
+
+        total_images = images_to_process.count()
+        if total_images == 0:
+            self.stdout.write(self.style.SUCCESS("No images needed processing."))
+            return
+
+        self.stdout.write(f"Found {total_images} image(s) to process.")
+
+        processed_count = 0
+        success_count = 0
+        failure_count = 0
+
+        for product_image in images_to_process.order_by('id').iterator(): # Use iterator for memory efficiency
+            processed_count += 1
+            self.stdout.write(f"[{processed_count}/{total_images}] Processing ProductImage ID: {product_image.id}...", ending='')
+            try:
+                colors = extract_colors(product_image)
+                self.stdout.write(self.style.SUCCESS(f" OK ({' '.join(color['hex'] for color in colors) or 'no foreground'})"))
+                success_count += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f" ERROR ({e})"))
+                failure_count += 1
+                logger.error(f"Management command error processing ProductImage {product_image.id}", exc_info=True)
+
+        self.stdout.write("-" * 30)
+        self.stdout.write(self.style.SUCCESS(f"Successfully extracted: {success_count}"))
+        if failure_count > 0:
+            self.stdout.write(self.style.ERROR(f"Failed: {failure_count}"))
+        self.stdout.write("Processing complete.")
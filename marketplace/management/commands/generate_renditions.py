@@ -0,0 +1,71 @@
+# marketplace/management/commands/generate_renditions.py
+
+from django.core.management.base import BaseCommand
+from marketplace.models import ProductImage
+from marketplace.renditions import generate_renditions, RENDITION_WIDTHS, RENDITION_FORMATS
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Generates responsive WebP/AVIF renditions for existing ProductImages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate renditions even for images that already have them.',
+        )
+        parser.add_argument(
+            '--image_ids',
+            nargs='+',
+            type=int,
+            help='Specific ProductImage IDs to process.',
+        )
+
+    def handle(self, *args, **options):
+        force_regeneration = options['force']
+        specific_ids = options['image_ids']
+
+        images_to_process = ProductImage.objects.exclude(image='')
+
+        if specific_ids:
+            self.stdout.write(f"Processing specific image IDs: {specific_ids}")
+            images_to_process = images_to_process.filter(id__in=specific_ids)
+        elif not force_regeneration:
+            images_to_process = images_to_process.filter(renditions={})
+            self.stdout.write("Processing images missing renditions...")
+        else:
+            self.stdout.write(self.style.WARNING("Processing ALL images (including existing renditions) due to --force flag."))
+
+        total_images = images_to_process.count()
+        if total_images == 0:
+            self.stdout.write(self.style.SUCCESS("No images needed processing."))
+            return
+
+        self.stdout.write(
+            f"Found {total_images} image(s) to process. "
+            f"Widths: {', '.join(map(str, RENDITION_WIDTHS))}; formats: {', '.join(RENDITION_FORMATS)}."
+        )
+
+        processed_count = 0
+        success_count = 0
+        failure_count = 0
+
+        for product_image in images_to_process.order_by('id').iterator(): # Use iterator for memory efficiency
+            processed_count += 1
+            self.stdout.write(f"[{processed_count}/{total_images}] Processing ProductImage ID: {product_image.id}...", ending='')
+            try:
+                renditions = generate_renditions(product_image)
+                self.stdout.write(self.style.SUCCESS(f" OK ({sum(len(v) for v in renditions.values())} files)"))
+                success_count += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f" ERROR ({e})"))
+                failure_count += 1
+                logger.error(f"Management command error processing ProductImage {product_image.id}", exc_info=True)
+
+        self.stdout.write("-" * 30)
+        self.stdout.write(self.style.SUCCESS(f"Successfully generated: {success_count}"))
+        if failure_count > 0:
+            self.stdout.write(self.style.ERROR(f"Failed: {failure_count}"))
+        self.stdout.write("Processing complete.")
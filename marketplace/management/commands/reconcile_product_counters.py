@@ -0,0 +1,74 @@
+# marketplace/management/commands/reconcile_product_counters.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from marketplace.models import Product
+from cart.models import SavedItem, CartItem
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Recomputes Product.saved_count and Product.cart_count from SavedItem/CartItem rows and fixes any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted products without updating them.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of products updated per query.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = max(1, options['batch_size'])
+
+        saved = SavedItem.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+            n=Count('user', distinct=True)
+        ).values('n')
+        in_carts = CartItem.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+            n=Count('cart', distinct=True)
+        ).values('n')
+
+        drifted = Product.objects.annotate(
+            actual_saved=Coalesce(Subquery(saved), 0),
+            actual_cart=Coalesce(Subquery(in_carts), 0),
+        ).filter(
+            ~Q(saved_count=F('actual_saved')) | ~Q(cart_count=F('actual_cart'))
+        ).only('id', 'saved_count', 'cart_count')
+
+        to_update = []
+        fixed_count = 0
+        for product in drifted.iterator(chunk_size=batch_size):
+            self.stdout.write(
+                f"Product {product.id}: saved {product.saved_count} -> {product.actual_saved}, "
+                f"cart {product.cart_count} -> {product.actual_cart}"
+            )
+            product.saved_count = product.actual_saved
+            product.cart_count = product.actual_cart
+            to_update.append(product)
+            if len(to_update) >= batch_size:
+                fixed_count += self._save(to_update, dry_run)
+                to_update = []
+        fixed_count += self._save(to_update, dry_run)
+
+        if fixed_count == 0:
+            self.stdout.write(self.style.SUCCESS("All product counters are consistent."))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{fixed_count} product(s) have drifted counters (dry run, nothing changed)."))
+        else:
+            logger.info(f"Reconciled counters for {fixed_count} product(s).")
+            self.stdout.write(self.style.SUCCESS(f"Reconciled counters for {fixed_count} product(s)."))
+
+    def _save(self, products, dry_run):
+        if products and not dry_run:
+            with transaction.atomic():
+                Product.objects.bulk_update(products, ['saved_count', 'cart_count'])
+        return len(products)
@@ -0,0 +1,39 @@
+# Generated by Django 5.1 on 2026-10-18 00:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Product = apps.get_model('marketplace', 'Product')
+    SavedItem = apps.get_model('cart', 'SavedItem')
+    CartItem = apps.get_model('cart', 'CartItem')
+    saved = SavedItem.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(n=Count('user', distinct=True)).values('n')
+    in_carts = CartItem.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(n=Count('cart', distinct=True)).values('n')
+    Product.objects.update(
+        saved_count=Coalesce(Subquery(saved), 0),
+        cart_count=Coalesce(Subquery(in_carts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0005_product_search_vector'),
+        ('cart', '0002_alter_cartitem_product_alter_saveditem_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='saved_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
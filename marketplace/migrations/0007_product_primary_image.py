@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_primary_image(apps, schema_editor):
+    Product = apps.get_model('marketplace', 'Product')
+    ProductImage = apps.get_model('marketplace', 'ProductImage')
+    best_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'id').values('id')[:1]
+    Product.objects.update(primary_image=Subquery(best_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_product_saved_count_product_cart_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='marketplace.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_image, migrations.RunPython.noop),
+    ]
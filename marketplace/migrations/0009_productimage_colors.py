@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 01:17
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0008_productimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='color_bins',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='dominant_colors',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['color_bins'], name='productimage_color_bins_gin'),
+        ),
+    ]
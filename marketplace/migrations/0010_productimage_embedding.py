@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0009_productimage_colors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='embedding_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
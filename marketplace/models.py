@@ -1,6 +1,11 @@
 from django.db import models
 from django.conf import settings
 from django.urls import reverse
+from django.templatetags.static import static
+from django.core.files.storage import default_storage
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 class Product(models.Model):
     CATEGORY_CHOICES = [
@@ -33,6 +38,28 @@ class Product(models.Model):
     is_public = models.BooleanField(default=True, help_text="Uncheck for a private item (personal closet)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized pointer to the image listings show (is_primary image, else the first one).
+    # Kept in sync by refresh_primary_image() via ProductImage signals (see marketplace/signals.py).
+    primary_image = models.ForeignKey(
+        'ProductImage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+    )
+    # Denormalized counters maintained with F() updates by cart.services (see reconcile_product_counters)
+    saved_count = models.PositiveIntegerField(default=0, editable=False)
+    cart_count = models.PositiveIntegerField(default=0, editable=False)
+    # Maintained by a database trigger (see migration 0005) from title/description/color/material.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Trigram index for typo-tolerant title matching (requires pg_trgm)
+            GinIndex(fields=['title'], name='product_title_trgm_gin', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.title}"
@@ -40,10 +67,61 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('marketplace:product-detail', kwargs={'pk': self.pk})
 
+    def get_primary_image_url(self):
+        """
+        URL of the primary image, or the placeholder if the product has none.
+        Use select_related('primary_image') on listings to avoid a query per product.
+        """
+        if self.primary_image_id and self.primary_image.image:
+            return self.primary_image.image.url
+        return static('images/placeholder.png')
+
+    def refresh_primary_image(self):
+        """Re-points primary_image at the is_primary image (or the first image, or None)."""
+        image = self.images.order_by('-is_primary', 'id').first()
+        image_id = image.pk if image else None
+        if image_id != self.primary_image_id:
+            # update() so listings don't bump updated_at or fire Product signals
+            Product.objects.filter(pk=self.pk).update(primary_image=image)
+            self.primary_image = image
+        return image
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
     is_primary = models.BooleanField(default=False)
+    # Bumped whenever the row (and so the image file) is saved; part of outfit render keys
+    updated_at = models.DateTimeField(auto_now=True)
+    # {format: {width: storage name}} written by marketplace.renditions.generate_renditions()
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # [{'hex', 'share', 'bin'}, ...] most common first, written by marketplace.colors.extract_colors()
+    dominant_colors = models.JSONField(default=list, blank=True, editable=False)
+    # Lab grid cells of the main dominant colors; the swatch filter matches them with && (see colors.py)
+    color_bins = ArrayField(models.PositiveSmallIntegerField(), default=list, blank=True, editable=False)
+    # float32 feature vector for "more like this" (marketplace.similarity.compute_embedding)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    embedding_version = models.PositiveSmallIntegerField(default=0, editable=False) # similarity.FEATURE_VERSION
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['color_bins'], name='productimage_color_bins_gin'),
+        ]
 
     def __str__(self):
         return f"Image for {self.product.title}"
+
+    def srcset(self, fmt='webp'):
+        """srcset attribute value for one rendition format, or '' if none were generated."""
+        by_width = self.renditions.get(fmt) or {}
+        return ', '.join(
+            f"{default_storage.url(name)} {width}w"
+            for width, name in sorted(by_width.items(), key=lambda item: int(item[0]))
+        )
+
+    def rendition_url(self, width, fmt='webp'):
+        """URL of the smallest rendition at least `width` wide (else the largest, else the original)."""
+        by_width = sorted(((int(w), name) for w, name in (self.renditions.get(fmt) or {}).items()))
+        if not by_width:
+            return self.image.url
+        name = next((n for w, n in by_width if w >= width), by_width[-1][1])
+        return default_storage.url(name)
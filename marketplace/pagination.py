@@ -0,0 +1,122 @@
+# marketplace/pagination.py
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor string cannot be decoded for the current ordering."""
+
+
+class KeysetPage:
+    """
+    One page of results from KeysetPaginator.
+    Exposes the same has_next/has_previous flags templates already use for
+    Django's Page, plus the cursors needed to build the next/previous links.
+    """
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], reverse=False)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) paginator for a queryset ordered by a single field or annotation.
+    The primary key is used as a tie-breaker so the ordering is total, and each
+    page is fetched with a WHERE (field, pk) > (last_field, last_pk) condition
+    instead of an OFFSET, so deep pages cost the same as the first one.
+    Usage:
+        paginator = KeysetPaginator(queryset, 12, '-created_at')
+        page = paginator.page(request.GET.get('cursor'))
+    """
+    def __init__(self, queryset, per_page, ordering):
+        self.per_page = per_page
+        self.descending = ordering.startswith('-')
+        self.field_name = ordering.lstrip('-')
+        try:
+            self.field = queryset.model._meta.get_field(self.field_name)
+        except FieldDoesNotExist:
+            # Ordering by an annotation, e.g. search_score
+            self.field = queryset.query.annotations[self.field_name].output_field
+        pk_order = '-pk' if self.descending else 'pk'
+        self.queryset = queryset.order_by(ordering, pk_order)
+
+    def encode_cursor(self, obj, reverse=False):
+        """Builds an opaque, URL-safe cursor pointing just past (or before) obj."""
+        value = getattr(obj, self.field_name)
+        if not isinstance(value, (int, str)):
+            value = str(value) # datetimes/decimals round-trip through field.to_python
+        payload = json.dumps({'v': value, 'pk': obj.pk, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Returns (value, pk, reverse) for a cursor produced by encode_cursor."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            value = self.field.to_python(payload['v'])
+            pk = self.queryset.model._meta.pk.to_python(payload['pk'])
+            return value, pk, bool(payload.get('r'))
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+    def _after(self, value, pk, descending):
+        """Q object selecting rows strictly after (value, pk) in the given direction."""
+        lookup = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field_name}__{lookup}': value})
+            | Q(**{self.field_name: value, f'pk__{lookup}': pk})
+        )
+
+    def page(self, cursor=None):
+        """
+        Fetches one page. Reads per_page + 1 rows so has_next/has_previous
+        can be answered without a COUNT query.
+        """
+        if not cursor:
+            rows = list(self.queryset[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+        value, pk, reverse = self.decode_cursor(cursor)
+        if not reverse:
+            qs = self.queryset.filter(self._after(value, pk, self.descending))
+            rows = list(qs[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        # Walking backwards: flip the ordering, then restore display order.
+        qs = self.queryset.filter(self._after(value, pk, not self.descending)).reverse()
+        rows = list(qs[:self.per_page + 1])
+        page_rows = rows[:self.per_page]
+        page_rows.reverse()
+        return KeysetPage(page_rows, self, True, len(rows) > self.per_page)
@@ -0,0 +1,117 @@
+# marketplace/renditions.py
+"""
+Responsive renditions (downscaled WebP/AVIF copies) of ProductImage files.
+Listings serve these through <picture>/srcset instead of the full processed PNG.
+Renditions are generated when an image is finalized or edited, and by the
+generate_renditions management command for existing media.
+"""
+import hashlib
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, features
+
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (160, 320, 640)
+RENDITION_DIR = 'products/renditions'
+# Pillow builds without libavif simply skip the AVIF variants.
+RENDITION_FORMATS = tuple(fmt for fmt in ('avif', 'webp') if features.check(fmt))
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 55, 'speed': 6},
+}
+
+
+def rendition_name(image_name, width, fmt):
+    """
+    Storage name of one rendition, e.g. products/renditions/shirt-1a2b3c4d5e6f-320w.webp.
+    The hash covers the image's full storage name: basenames repeat across users
+    (every iOS upload is image.jpg), so the basename alone would collide.
+    """
+    stem, _ = os.path.splitext(os.path.basename(image_name))
+    digest = hashlib.sha256(image_name.encode()).hexdigest()[:12]
+    return f"{RENDITION_DIR}/{stem}-{digest}-{width}w.{fmt}"
+
+
+def target_widths(original_width):
+    """Widths to generate; never upscales, but always yields at least one rendition."""
+    widths = [w for w in RENDITION_WIDTHS if w < original_width]
+    if len(widths) < len(RENDITION_WIDTHS):
+        widths.append(original_width) # Largest rendition is the original size, re-encoded
+    return widths
+
+
+def delete_renditions(renditions, exclude_pk=None):
+    """
+    Removes the files listed in a ProductImage.renditions mapping, except those another
+    ProductImage (other than exclude_pk, the row being regenerated or deleted) still lists.
+    """
+    for fmt, by_width in (renditions or {}).items():
+        for width, name in by_width.items():
+            # JSON containment rather than a key path: numeric keys would be read as array indexes
+            if ProductImage.objects.filter(renditions__contains={fmt: {width: name}}).exclude(pk=exclude_pk).exists():
+                logger.info(f"Keeping rendition {name}, still used by another image")
+                continue
+            try:
+                default_storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Could not delete rendition {name}: {e}")
+
+
+def generate_renditions(product_image):
+    """
+    Writes every width/format rendition for product_image and stores the
+    resulting {format: {width: name}} mapping on product_image.renditions.
+    The new files are saved and the mapping updated before previous renditions
+    are deleted, so the stored mapping never lists a missing file. Returns the new mapping.
+    """
+    with product_image.image.open('rb') as f:
+        source = Image.open(f)
+        source.load()
+    # Keep transparency from background removal; everything else becomes RGB
+    mode = 'RGBA' if 'A' in source.getbands() or 'transparency' in source.info else 'RGB'
+    source = source.convert(mode)
+
+    old_renditions = product_image.renditions
+    renditions = {}
+    try:
+        for width in target_widths(source.width):
+            height = max(1, round(source.height * width / source.width))
+            resized = source if width == source.width else source.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in RENDITION_FORMATS:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                # A name still in use (e.g. by the old mapping) gets a suffixed copy rather than being replaced
+                name = default_storage.save(rendition_name(product_image.image.name, width, fmt), ContentFile(buffer.getvalue()))
+                renditions.setdefault(fmt, {})[str(width)] = name
+    except Exception:
+        delete_renditions(renditions, exclude_pk=product_image.pk) # Nothing points at the partial set yet
+        raise
+
+    # update() so regenerating renditions doesn't fire ProductImage signals
+    type(product_image).objects.filter(pk=product_image.pk).update(renditions=renditions)
+    product_image.renditions = renditions
+
+    new_names = {name for by_width in renditions.values() for name in by_width.values()}
+    delete_renditions({
+        fmt: {width: name for width, name in by_width.items() if name not in new_names}
+        for fmt, by_width in (old_renditions or {}).items()
+    }, exclude_pk=product_image.pk)
+    logger.info(f"Generated {sum(len(v) for v in renditions.values())} renditions for ProductImage {product_image.pk}")
+    return renditions
+
+
+def safe_generate_renditions(product_image):
+    """generate_renditions() for request paths: failures are logged, the original is still served."""
+    try:
+        return generate_renditions(product_image)
+    except Exception as e:
+        logger.error(f"Error generating renditions for ProductImage {product_image.pk}: {e}", exc_info=True)
+        return None
@@ -0,0 +1,33 @@
+# marketplace/search.py
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q, IntegerField
+from django.db.models.functions import Cast
+
+# Must match the config used by the search_vector trigger (migration 0005)
+SEARCH_CONFIG = 'english'
+
+# search_rank is a float; search_score scales it to an integer so it can be used
+# as an exact keyset pagination key.
+SEARCH_SCORE_SCALE = 1000000
+
+
+def search_filter(q):
+    """
+    Q object matching products for q: the GIN-indexed search_vector (websearch
+    syntax, stemmed), or some word in the title trigram-similar to q (pg_trgm
+    word_similarity_threshold, default 0.6), which catches typos the stemmer can't.
+    """
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+    return Q(search_vector=query) | Q(title__trigram_word_similar=q)
+
+
+def search_products(queryset, q):
+    """
+    Filters queryset with search_filter(q) and annotates search_rank/search_score.
+    Order by '-search_score' for relevance.
+    """
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_filter(q)).annotate(
+        search_rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(q, 'title'),
+        search_score=Cast(F('search_rank') * SEARCH_SCORE_SCALE, IntegerField()),
+    )
@@ -0,0 +1,41 @@
+# marketplace/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .facets import invalidate_facets
+from .renditions import delete_renditions
+from .similarity import safe_sync_product
+from .models import Product, ProductImage
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    """Cached facet counts are stale once any product is saved or deleted."""
+    invalidate_facets()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    """Keeps Product.primary_image pointing at the right image when images are added, replaced or removed."""
+    product = Product.objects.filter(pk=instance.product_id).first()
+    if product:
+        product.refresh_primary_image()
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance, **kwargs):
+    """Renditions are derived files, so they go with the image row."""
+    delete_renditions(instance.renditions, exclude_pk=instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def similarity_index_changed(sender, instance, **kwargs):
+    """Listing, selling, hiding or re-imaging a product updates its "more like this" row once committed."""
+    product_id = instance.pk if sender is Product else instance.product_id
+    transaction.on_commit(lambda: safe_sync_product(product_id))
@@ -0,0 +1,315 @@
+# marketplace/similarity.py
+"""
+Visual "more like this" for product pages.
+
+Each ProductImage gets a compact feature vector (ProductImage.embedding, EMBEDDING_DIM
+float32) computed from the background-removed cutout: a Lab color histogram, the
+silhouette (alpha mask of the item's bounding box at 8x8) and a gradient orientation
+histogram (texture/pattern). Each block is L2-normalised and scaled by the square root
+of its weight, so the dot product of two vectors is the weighted mean of the block
+cosine similarities.
+
+Vectors of available public products (their primary image) are kept in a memory-mapped
+float32 matrix under SIMILARITY_INDEX_DIR, shared by every process through the page
+cache: a query is one brute-force matrix-vector product (milliseconds at 100k rows).
+Rows are updated in place as products are listed, edited, sold or hidden (see
+signals.py); removed products keep their row, marked inactive, until the next
+`build_similarity_index` compacts the files.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .colors import ALPHA_THRESHOLD, ANALYSIS_SIZE, rgb_to_lab
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Bump when the features change; build_similarity_index then recomputes stale embeddings
+FEATURE_VERSION = 1
+COLOR_BINS = 4 # Per Lab axis, 64 cells
+SHAPE_SIZE = 8 # Silhouette grid, 64 cells
+ORIENTATIONS = 8 # Unsigned gradient orientation bins, per cell of a 2x2 grid
+EMBEDDING_DIM = COLOR_BINS ** 3 + SHAPE_SIZE ** 2 + ORIENTATIONS * 4 # 160
+BLOCK_WEIGHTS = (0.5, 0.3, 0.2) # color, shape, texture
+OVERSAMPLE = 3 # Candidates fetched per result; some may have sold since they were indexed
+
+VECTORS_FILE = 'vectors.f32'
+PRODUCTS_FILE = 'products.i64' # Product id per row; negated while the product is inactive
+META_FILE = 'meta.json'
+LOCK_FILE = 'lock'
+MIN_CAPACITY = 1024 # Rows; files grow by doubling
+
+
+# --- Features ---
+
+def _unit(block):
+    norm = np.linalg.norm(block)
+    return block / norm if norm > 0 else block
+
+
+def image_features(rgba):
+    """EMBEDDING_DIM float32 vector for an (H, W, 4) uint8 cutout; None if it has no foreground."""
+    mask = rgba[..., 3] >= ALPHA_THRESHOLD
+    if not mask.any():
+        return None
+    ys, xs = np.nonzero(mask)
+    top, bottom, left, right = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+    crop = np.ascontiguousarray(rgba[top:bottom, left:right])
+    crop_mask = mask[top:bottom, left:right]
+
+    # Color: Lab histogram of the foreground; sqrt so a dominant color doesn't swamp the rest
+    lab = rgb_to_lab(crop[crop_mask][:, :3])
+    cells = (
+        np.clip(lab[:, 0] * COLOR_BINS // 100.01, 0, COLOR_BINS - 1).astype(np.int64) * COLOR_BINS * COLOR_BINS
+        + np.clip((lab[:, 1] + 128) * COLOR_BINS // 256, 0, COLOR_BINS - 1).astype(np.int64) * COLOR_BINS
+        + np.clip((lab[:, 2] + 128) * COLOR_BINS // 256, 0, COLOR_BINS - 1).astype(np.int64)
+    )
+    color = np.sqrt(np.bincount(cells, minlength=COLOR_BINS ** 3).astype(np.float32))
+
+    # Shape: the silhouette scaled to a fixed grid (aspect ratio is part of the shape)
+    shape = cv2.resize(crop_mask.astype(np.float32), (SHAPE_SIZE, SHAPE_SIZE), interpolation=cv2.INTER_AREA).ravel()
+    shape -= shape.mean()
+
+    # Texture: magnitude-weighted gradient orientations inside the item, per quadrant
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGBA2GRAY).astype(np.float32)
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude = cv2.magnitude(gx, gy) * cv2.erode(crop_mask.astype(np.uint8), None) # Skip the outline itself
+    orientation = (np.arctan2(gy, gx) % np.pi) * ORIENTATIONS / np.pi
+    orientation = np.minimum(orientation.astype(np.int64), ORIENTATIONS - 1)
+    height, width = gray.shape
+    quadrant = (np.arange(height)[:, None] * 2 // height) * 2 + (np.arange(width)[None, :] * 2 // width)
+    texture = np.bincount(
+        (quadrant * ORIENTATIONS + orientation).ravel(), weights=magnitude.ravel(), minlength=ORIENTATIONS * 4,
+    ).astype(np.float32)
+
+    blocks = [np.sqrt(weight) * _unit(block) for weight, block in zip(BLOCK_WEIGHTS, (color, shape, texture))]
+    return _unit(np.concatenate(blocks)).astype(np.float32)
+
+
+def compute_embedding(product_image):
+    """Computes and stores product_image.embedding. Returns the vector (None if it has no foreground)."""
+    with product_image.image.open('rb') as f:
+        source = Image.open(f)
+        source.draft('RGB', (ANALYSIS_SIZE, ANALYSIS_SIZE)) # No-op for non-JPEG files
+        source.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+    vector = image_features(np.asarray(source.convert('RGBA')))
+    embedding = vector.tobytes() if vector is not None else None
+
+    # update() so computing features doesn't fire ProductImage signals
+    type(product_image).objects.filter(pk=product_image.pk).update(
+        embedding=embedding, embedding_version=FEATURE_VERSION,
+    )
+    product_image.embedding = embedding
+    product_image.embedding_version = FEATURE_VERSION
+    return vector
+
+
+def embedding_vector(product_image):
+    """The stored embedding as a float32 array, or None if missing or from an older FEATURE_VERSION."""
+    if not product_image or not product_image.embedding or product_image.embedding_version != FEATURE_VERSION:
+        return None
+    return np.frombuffer(bytes(product_image.embedding), dtype=np.float32)
+
+
+# --- Index files ---
+
+def _path(name):
+    return os.path.join(settings.SIMILARITY_INDEX_DIR, name)
+
+
+def _read_meta():
+    try:
+        with open(_path(META_FILE)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'dim': EMBEDDING_DIM, 'version': FEATURE_VERSION}
+    return meta
+
+
+def _write_meta(meta):
+    """Atomic replace; readers reopen their maps when its mtime changes."""
+    fd, tmp_path = tempfile.mkstemp(dir=settings.SIMILARITY_INDEX_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _path(META_FILE))
+
+
+class _IndexLock:
+    """Exclusive flock serialising writers across processes; readers never take it."""
+
+    def __enter__(self):
+        os.makedirs(settings.SIMILARITY_INDEX_DIR, exist_ok=True)
+        self.file = open(_path(LOCK_FILE), 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def _open_for_write(min_rows):
+    """(vectors, products) memmaps opened r+ with room for at least min_rows rows."""
+    row_bytes = EMBEDDING_DIM * 4
+    try:
+        capacity = os.path.getsize(_path(PRODUCTS_FILE)) // 8
+    except FileNotFoundError:
+        capacity = 0
+    if capacity < min_rows:
+        capacity = max(MIN_CAPACITY, capacity * 2, min_rows)
+        # Extending the files leaves existing rows (and readers' maps of them) untouched
+        for name, size in ((VECTORS_FILE, capacity * row_bytes), (PRODUCTS_FILE, capacity * 8)):
+            with open(_path(name), 'ab') as f:
+                f.truncate(size)
+    vectors = np.memmap(_path(VECTORS_FILE), dtype=np.float32, mode='r+', shape=(capacity, EMBEDDING_DIM))
+    products = np.memmap(_path(PRODUCTS_FILE), dtype=np.int64, mode='r+', shape=(capacity,))
+    return vectors, products
+
+
+def upsert(product_id, vector):
+    """Adds or refreshes a product's row and marks it active."""
+    with _IndexLock():
+        meta = _read_meta()
+        rows = meta['rows']
+        vectors, products = _open_for_write(rows + 1)
+        existing = np.flatnonzero(np.abs(products[:rows]) == product_id)
+        row = int(existing[0]) if len(existing) else rows
+        vectors[row] = vector
+        products[row] = product_id
+        vectors.flush()
+        products.flush()
+        meta['rows'] = max(rows, row + 1)
+        _write_meta(meta)
+
+
+def deactivate(product_id):
+    """Hides a product from results (sold, hidden, deleted or without an embedding). No-op if not indexed."""
+    with _IndexLock():
+        meta = _read_meta()
+        if not meta['rows'] or not os.path.exists(_path(PRODUCTS_FILE)):
+            return
+        products = np.memmap(_path(PRODUCTS_FILE), dtype=np.int64, mode='r+')
+        active = np.flatnonzero(products[:meta['rows']] == product_id)
+        if not len(active):
+            return
+        products[active] = -product_id
+        products.flush()
+        _write_meta(meta)
+
+
+def rebuild(entries):
+    """
+    Rewrites the index from (product id, vector) pairs, dropping inactive rows.
+    New files are swapped in with os.replace, so readers keep their old maps until they reload.
+    """
+    entries = list(entries)
+    with _IndexLock():
+        capacity = max(MIN_CAPACITY, len(entries))
+        vectors = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        products = np.zeros(capacity, dtype=np.int64)
+        for row, (product_id, vector) in enumerate(entries):
+            vectors[row] = vector
+            products[row] = product_id
+        for name, array in ((VECTORS_FILE, vectors), (PRODUCTS_FILE, products)):
+            fd, tmp_path = tempfile.mkstemp(dir=settings.SIMILARITY_INDEX_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                array.tofile(f)
+            os.replace(tmp_path, _path(name))
+        _write_meta({'rows': len(entries), 'dim': EMBEDDING_DIM, 'version': FEATURE_VERSION})
+    logger.info(f"Rebuilt similarity index with {len(entries)} products")
+    return len(entries)
+
+
+# --- Queries ---
+
+_loaded = {'version': None, 'vectors': None, 'products': None}
+
+
+def index_arrays():
+    """(vectors, products) read-only maps of the used rows, reopened when meta.json is replaced."""
+    try:
+        stat = os.stat(_path(META_FILE))
+    except FileNotFoundError:
+        return None, None
+    version = (stat.st_ino, stat.st_mtime_ns) # Every write is a new file (os.replace)
+    if version != _loaded['version']:
+        meta = _read_meta()
+        rows = meta['rows']
+        if not rows or meta.get('dim') != EMBEDDING_DIM or meta.get('version') != FEATURE_VERSION:
+            vectors = products = None # Empty, or built by other code; wait for build_similarity_index
+        else:
+            vectors = np.memmap(_path(VECTORS_FILE), dtype=np.float32, mode='r', shape=(rows, EMBEDDING_DIM))
+            products = np.memmap(_path(PRODUCTS_FILE), dtype=np.int64, mode='r', shape=(rows,))
+        _loaded.update(version=version, vectors=vectors, products=products)
+    return _loaded['vectors'], _loaded['products']
+
+
+def nearest(vector, k, exclude=()):
+    """[(product id, score), ...] of the k active products most similar to vector, best first."""
+    vectors, products = index_arrays()
+    if vectors is None or k <= 0:
+        return []
+    scores = vectors @ vector
+    scores[products <= 0] = -np.inf
+    for product_id in exclude:
+        scores[products == product_id] = -np.inf
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(products[row]), float(scores[row])) for row in best if np.isfinite(scores[row])]
+
+
+def similar_products(product, k, queryset):
+    """
+    Up to k products from queryset that look most like product's primary image, best first.
+    queryset applies availability; the index may lag a sale by a moment.
+    """
+    vector = embedding_vector(product.primary_image)
+    if vector is None:
+        return []
+    ranked = [product_id for product_id, _ in nearest(vector, k * OVERSAMPLE, exclude=(product.pk,))]
+    matching = queryset.in_bulk(ranked)
+    return [matching[pk] for pk in ranked if pk in matching][:k]
+
+
+# --- Keeping the index current ---
+
+def is_indexable(product):
+    return product.is_public and not product.is_sold and product.quantity > 0
+
+
+def sync_product(product_id):
+    """Upserts or deactivates one product's row to match the database."""
+    product = Product.objects.select_related('primary_image').filter(pk=product_id).first()
+    vector = embedding_vector(product.primary_image) if product else None
+    if product and is_indexable(product) and vector is not None:
+        upsert(product.pk, vector)
+    else:
+        deactivate(product_id)
+
+
+def safe_sync_product(product_id):
+    """sync_product() for request paths and signals: failures are logged, results just lag."""
+    try:
+        sync_product(product_id)
+    except Exception as e:
+        logger.error(f"Error updating similarity index for Product {product_id}: {e}", exc_info=True)
+
+
+def safe_compute_embedding(product_image):
+    """compute_embedding() then re-index its product; failures are logged, the page just shows fewer similar items."""
+    try:
+        compute_embedding(product_image)
+    except Exception as e:
+        logger.error(f"Error computing embedding for ProductImage {product_image.pk}: {e}", exc_info=True)
+        return
+    safe_sync_product(product_image.product_id)
@@ -1,5 +1,8 @@
 # marketplace/templatetags/marketplace_tags.py
 from django import template
+from django.utils.html import format_html_join
+
+from marketplace.renditions import RENDITION_FORMATS, MIME_TYPES
 
 register = template.Library()
 
@@ -19,4 +22,20 @@ def query_transform(context, **kwargs):
             updated.pop(k, 0)  # Remove key if value is None
     return updated.urlencode()
 
+@register.simple_tag
+def rendition_sources(product_image, sizes):
+    """
+    Renders <source> elements (AVIF first, then WebP) for a ProductImage's renditions.
+    Place inside a <picture> before the fallback <img>; renders nothing if the
+    image has no renditions yet.
+    Usage: <picture>{% rendition_sources product.primary_image "50vw" %}<img src="..."></picture>
+    """
+    if not product_image:
+        return ''
+    sources = [
+        (MIME_TYPES[fmt], product_image.srcset(fmt), sizes)
+        for fmt in RENDITION_FORMATS if product_image.renditions.get(fmt)
+    ]
+    return format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources)
+
 # Remember to load the tag in your template: {% load marketplace_tags %}
\ No newline at end of file
@@ -1,3 +1,43 @@
-from django.test import TestCase
+import numpy as np
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .colors import SWATCH_BINS, SWATCHES, dominant_colors, hex_to_rgb, index_bins
+
+
+class SwatchCoverageTests(SimpleTestCase):
+    # Common garment colors, including saturated variants of each swatch's muted hex
+    VARIANTS = {
+        'black': [(0, 0, 0), (30, 30, 30)],
+        'white': [(255, 255, 255), (240, 240, 240)],
+        'grey': [(128, 128, 128), (169, 169, 169), (90, 90, 90)],
+        'beige': [(210, 180, 140), (216, 195, 165)],
+        'brown': [(139, 69, 19), (101, 67, 33)],
+        'red': [(255, 0, 0), (200, 30, 30), (139, 0, 0), (220, 20, 60)],
+        'pink': [(255, 192, 203), (255, 105, 180)],
+        'orange': [(255, 165, 0), (255, 140, 0)],
+        'yellow': [(255, 255, 0), (255, 215, 0), (240, 230, 140)],
+        'green': [(0, 128, 0), (0, 255, 0), (34, 139, 34), (107, 142, 35)],
+        'blue': [(0, 0, 255), (65, 105, 225), (30, 144, 255), (70, 130, 180), (135, 206, 235)],
+        'navy': [(0, 0, 128), (25, 25, 112)],
+        'purple': [(128, 0, 128), (148, 0, 211)],
+    }
+
+    def matching_swatches(self, rgb):
+        rgba = np.zeros((4, 4, 4), dtype=np.uint8)
+        rgba[...] = (*rgb, 255)
+        bins = set(index_bins(dominant_colors(rgba)))
+        return [slug for slug, cells in SWATCH_BINS.items() if bins & set(cells)]
+
+    def test_every_cell_belongs_to_one_swatch(self):
+        cells = [cell for bins in SWATCH_BINS.values() for cell in bins]
+        self.assertEqual(sorted(cells), list(range(len(cells))))
+
+    def test_swatch_hex_matches_its_swatch(self):
+        for slug, _, hex_color in SWATCHES:
+            self.assertEqual(self.matching_swatches(hex_to_rgb(hex_color)), [slug])
+
+    def test_saturated_variants_match_their_swatch(self):
+        for slug, variants in self.VARIANTS.items():
+            for rgb in variants:
+                with self.subTest(slug=slug, rgb=rgb):
+                    self.assertEqual(self.matching_swatches(rgb), [slug])
@@ -8,6 +8,12 @@ from django.db.models import Q, Count
 from django.db import transaction
 from .models import Product, ProductImage
 from .forms import ProductForm
+from .pagination import KeysetPaginator, InvalidCursor
+from .search import search_products, search_filter
+from .facets import facet_counts
+from .colors import SWATCHES, filter_by_swatch, safe_extract_colors
+from .renditions import safe_generate_renditions
+from .similarity import safe_compute_embedding, similar_products
 from django.contrib.auth.decorators import login_required
 import os
 from django.templatetags.static import static 
@@ -23,11 +29,40 @@ from django.conf import settings
 from django.core.files import File
 import logging
 # Add JsonResponse
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 
 
 logger = logging.getLogger(__name__)
 
+SIMILAR_PRODUCTS_COUNT = 8 # "More like this" on the product page
+
+
+def decorate_product_page(products):
+    """
+    Attaches primary_image_url and formatted_price to an already-sliced list of
+    products (one page). Select the products with select_related('primary_image');
+    saved_count and cart_count are stored columns, so no aggregation is needed.
+    """
+    for product in products:
+        product.primary_image_url = product.get_primary_image_url()
+
+        # Format price
+        if product.price is not None:
+            product.formatted_price = f"\u20B1{product.price:.2f}" # PHP Peso sign
+        else:
+            product.formatted_price = "N/A (Private)" if not product.is_public else "Price N/A"
+    return products
+
+def selected_facets(request):
+    """Facet filters currently applied in the query string, in the shape facet_counts expects."""
+    return {
+        'category': request.GET.getlist('category'),
+        'condition': request.GET.getlist('condition'),
+        'size': request.GET.get('size', ''),
+        'color': request.GET.get('color', ''),
+        'material': request.GET.get('material', ''),
+    }
+
 # --- HomePage View remains largely the same, context data generation is still useful ---
 class HomePage(ListView):
     model = Product
@@ -65,10 +100,12 @@ class HomePage(ListView):
             queryset = queryset.filter(is_sold=False, quantity__gt=0)
         # --- End Availability Filtering ---
 
-        # Full-text search
+        # Full-text search (tsvector GIN index + trigram fallback for typos)
         q = self.request.GET.get('q')
+        # Facet counts are computed over availability + search, before the facet filters
+        self.facet_base = queryset.filter(search_filter(q)) if q else queryset
         if q:
-            queryset = queryset.filter(Q(title__icontains=q) | Q(description__icontains=q))
+            queryset = search_products(queryset, q)
 
         # Filtering other fields (Keep existing logic)
         categories = self.request.GET.getlist('category')
@@ -83,64 +120,70 @@ class HomePage(ListView):
         color_filter = self.request.GET.get('color')
         if color_filter:
             queryset = queryset.filter(color__icontains=color_filter)
+        # Swatch: indexed match on the primary image's extracted colors
+        queryset = filter_by_swatch(queryset, self.request.GET.get('swatch'))
         material_filter = self.request.GET.get('material')
         if material_filter:
             queryset = queryset.filter(material__icontains=material_filter)
 
         # Sorting (Keep existing logic)
+        # Orderings are single-field so KeysetPaginator can page on (field, pk)
         sort_by = self.request.GET.get('sort')
         if sort_by == 'title_asc':
-            queryset = queryset.order_by('title')
+            self.sort_ordering = 'title'
         elif sort_by == 'title_desc':
-            queryset = queryset.order_by('-title')
+            self.sort_ordering = '-title'
         elif sort_by == 'price_asc':
-            queryset = queryset.filter(price__isnull=False).order_by('price')
+            queryset = queryset.filter(price__isnull=False)
+            self.sort_ordering = 'price'
         elif sort_by == 'price_desc':
-            queryset = queryset.filter(price__isnull=False).order_by('-price')
+            queryset = queryset.filter(price__isnull=False)
+            self.sort_ordering = '-price'
         elif sort_by == 'created_at_asc':
-            queryset = queryset.order_by('created_at')
+            self.sort_ordering = 'created_at'
+        elif q: # Default for searches: most relevant first
+            self.sort_ordering = '-search_score'
         else: # Default to newest first
-            queryset = queryset.order_by('-created_at')
+            self.sort_ordering = '-created_at'
+        queryset = queryset.order_by(self.sort_ordering)
 
-        # --- EFFICIENTLY FETCH RELATED DATA ---
-        queryset = queryset.select_related(
-            'seller__profile' # Select seller and their profile
-        ).prefetch_related(
-            'images' # Prefetch images
-        ).annotate(
-            # Annotate counts using the related_names we added
-            saved_count=Count('saved_by_users', distinct=True), # Count distinct users who saved
-            cart_count=Count('in_carts', distinct=True) # Count distinct carts containing the item
+        # Only cheap joins here; images and prices are attached per page in get_context_data
+        return queryset.select_related(
+            'seller__profile', # Select seller and their profile
+            'primary_image', # Denormalized primary image, no per-product image scan
         )
-        # --- END FETCHING RELATED DATA ---
-
-        # Attach primary image URL and formatted price after filtering/sorting/annotating
-        # Note: Annotations must usually come before slicing (pagination)
-        # This loop is okay here *before* pagination happens internally
-        for product in queryset:
-             # Find primary image from prefetched data
-             product.primary_image = next((img for img in product.images.all() if img.is_primary), product.images.first())
-             product.primary_image_url = product.primary_image.image.url if product.primary_image and hasattr(product.primary_image, 'image') else static('images/placeholder.png')
-
-             # Format price
-             if product.price is not None:
-                 product.formatted_price = f"\u20B1{product.price:.2f}" # PHP Peso sign
-             else:
-                 product.formatted_price = "N/A (Private)" if not product.is_public else "Price N/A"
 
-        return queryset # Return the prepared queryset
+    def paginate_queryset(self, queryset, page_size):
+        """Keyset pagination on the current sort field instead of OFFSET/COUNT."""
+        paginator = KeysetPaginator(queryset, page_size, self.sort_ordering)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # --- Filter options needed for the modal (Keep existing logic) ---
-        qs_all_public = Product.objects.filter(is_public=True) # Use this for filter options
-        context['categories'] = Product.CATEGORY_CHOICES
-        context['conditions'] = Product.CONDITION_CHOICES
+        # Decorate only the products on the current page
+        decorate_product_page(context[self.context_object_name])
+
+        # --- Filter options for the modal, with counts for the current filters ---
+        counts = facet_counts(
+            self.facet_base,
+            scope='public',
+            cache_params={
+                'q': self.request.GET.get('q', ''),
+                'is_sold': self.request.GET.getlist('is_sold') if 'is_sold' in self.request.GET else None,
+            },
+            selected=selected_facets(self.request),
+        )
+        context['categories'] = [(value, display, counts['category'].get(value, 0)) for value, display in Product.CATEGORY_CHOICES]
+        context['conditions'] = [(value, display, counts['condition'].get(value, 0)) for value, display in Product.CONDITION_CHOICES]
         context['availability_options'] = [('false', 'Available'), ('true', 'Sold')]
 
-        distinct_sizes = list(qs_all_public.values_list('size', flat=True).distinct().exclude(size__isnull=True).exclude(size__exact='').order_by('size'))
-        distinct_colors = list(qs_all_public.values_list('color', flat=True).distinct().exclude(color__isnull=True).exclude(color__exact='').order_by('color'))
-        distinct_materials = list(qs_all_public.values_list('material', flat=True).distinct().exclude(material__isnull=True).exclude(material__exact='').order_by('material'))
+        distinct_sizes = sorted(counts['size'].items())
+        distinct_colors = sorted(counts['color'].items())
+        distinct_materials = sorted(counts['material'].items())
 
         context['show_size_checkboxes'] = len(distinct_sizes) < 10
         context['sizes'] = distinct_sizes
@@ -156,6 +199,8 @@ class HomePage(ListView):
         context['filter_is_sold'] = self.request.GET.getlist("is_sold")
         context['filter_size'] = self.request.GET.get("size", "")
         context['filter_color'] = self.request.GET.get("color", "")
+        context['swatches'] = SWATCHES
+        context['filter_swatch'] = self.request.GET.get("swatch", "")
         context['filter_material'] = self.request.GET.get("material", "")
         context['filter_sort'] = self.request.GET.get("sort", "")
 
@@ -198,10 +243,9 @@ class MyClosetView(LoginRequiredMixin, ListView):
 
         # --- Apply Search ---
         q = self.request.GET.get('q')
+        self.facet_base = queryset.filter(search_filter(q)) if q else queryset
         if q:
-            queryset = queryset.filter(
-                Q(title__icontains=q) | Q(description__icontains=q)
-            )
+            queryset = search_products(queryset, q)
 
         # --- Apply Filters (Category, Size, Color, Material) ---
         # (Keep filter logic as implemented previously)
@@ -214,6 +258,8 @@ class MyClosetView(LoginRequiredMixin, ListView):
         color_filter = self.request.GET.get('color')
         if color_filter:
             queryset = queryset.filter(color__icontains=color_filter)
+        # Swatch: indexed match on the primary image's extracted colors
+        queryset = filter_by_swatch(queryset, self.request.GET.get('swatch'))
         material_filter = self.request.GET.get('material')
         if material_filter:
             queryset = queryset.filter(material__icontains=material_filter)
@@ -228,12 +274,14 @@ class MyClosetView(LoginRequiredMixin, ListView):
             queryset = queryset.order_by('-title')
         elif sort_by == 'created_at_asc':
             queryset = queryset.order_by('created_at')
+        elif q: # Default for searches: most relevant first
+            queryset = queryset.order_by('-search_score', '-created_at')
         else: # Default: Newest first
             queryset = queryset.order_by('-created_at')
 
 
-        # --- Prefetch related data and return UNEVALUATED queryset ---
-        return queryset.prefetch_related('images')
+        # --- Join the primary image and return UNEVALUATED queryset ---
+        return queryset.select_related('primary_image')
 
     def get_context_data(self, **kwargs):
         # Get base context from ListView (includes paginator, page_obj, is_paginated)
@@ -241,34 +289,20 @@ class MyClosetView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
 
         # --- Attach primary_image_url to the objects for the CURRENT page ---
-        # Access the list of objects for the current page from the context
-        products_on_page = context.get(self.context_object_name) # Use context_object_name
-        if products_on_page: # Check if there are objects on the page
-            for product in products_on_page:
-                # Find the primary image using prefetched data
-                primary_image = next((img for img in product.images.all() if img.is_primary), product.images.first())
-                # Set the attribute directly on the product object IN THE CONTEXT
-                product.primary_image_url = primary_image.image.url if primary_image and hasattr(primary_image, 'image') and primary_image.image else static('images/placeholder.png')
-
-        # --- Filter Options for Modal ---
-        # (Keep the logic for populating context['categories'], etc.)
-        closet_qs_base = Product.objects.filter(seller=self.request.user, is_public=False)
-        context['categories'] = sorted(list(
-            closet_qs_base.exclude(category__isnull=True).exclude(category__exact='')
-            .values_list('category', flat=True).distinct()
-        ))
-        context['sizes'] = sorted(list(
-             closet_qs_base.exclude(size__isnull=True).exclude(size__exact='')
-             .values_list('size', flat=True).distinct()
-        ))
-        context['colors'] = sorted(list(
-             closet_qs_base.exclude(color__isnull=True).exclude(color__exact='')
-             .values_list('color', flat=True).distinct()
-        ))
-        context['materials'] = sorted(list(
-             closet_qs_base.exclude(material__isnull=True).exclude(material__exact='')
-             .values_list('material', flat=True).distinct()
-        ))
+        decorate_product_page(context.get(self.context_object_name) or [])
+
+        # --- Filter Options for Modal (cached, with counts for the current filters) ---
+        counts = facet_counts(
+            self.facet_base,
+            scope=f'closet:{self.request.user.pk}',
+            cache_params={'q': self.request.GET.get('q', '')},
+            selected=selected_facets(self.request),
+            fields=('category', 'size', 'color', 'material'),
+        )
+        context['categories'] = sorted(counts['category'].items())
+        context['sizes'] = sorted(counts['size'].items())
+        context['colors'] = sorted(counts['color'].items())
+        context['materials'] = sorted(counts['material'].items())
         context['show_size_checkboxes'] = len(context['sizes']) < 15
         context['show_color_checkboxes'] = len(context['colors']) < 20
         context['show_material_checkboxes'] = len(context['materials']) < 15
@@ -280,6 +314,8 @@ class MyClosetView(LoginRequiredMixin, ListView):
         context['filter_category'] = self.request.GET.getlist("category")
         context['filter_size'] = self.request.GET.get("size", "")
         context['filter_color'] = self.request.GET.get("color", "")
+        context['swatches'] = SWATCHES
+        context['filter_swatch'] = self.request.GET.get("swatch", "")
         context['filter_material'] = self.request.GET.get("material", "")
         context['filter_sort'] = self.request.GET.get("sort", "")
 
@@ -333,6 +369,10 @@ class ProductDetailView(DetailView):
             seller_profile_pic_url = product.seller.userprofile.profile_picture.url
         context['seller_profile_pic_url'] = seller_profile_pic_url
 
+        # --- Visually similar listings (memory-mapped index, see similarity.py) ---
+        available = Product.objects.filter(is_public=True, is_sold=False, quantity__gt=0).select_related('primary_image')
+        context['similar_products'] = similar_products(product, SIMILAR_PRODUCTS_COUNT, available) if product.is_public else []
+
         return context
 
 
@@ -395,7 +435,7 @@ class ProductUpdateView(LoginRequiredMixin, UpdateView):
         context = super().get_context_data(**kwargs)
         product = self.get_object()
         # Pass primary image and brand colors
-        context['primary_image'] = product.images.filter(is_primary=True).first()
+        context['primary_image'] = product.primary_image
         context['brand_colors'] = {
             'primary': '#6aad6c', 'secondary': '#cf899b', 'accent1': '#efaca4',
             'navbar_bg': '#2c2c47', 'body_bg': '#fffef7', 'button_text': '#faffda',
@@ -443,8 +483,7 @@ class ProductDeleteView(LoginRequiredMixin, DeleteView):
         """Add the primary image to the context."""
         context = super().get_context_data(**kwargs)
         # self.object is available here (the product being deleted)
-        primary_image = self.object.images.filter(is_primary=True).first()
-        context['primary_image'] = primary_image
+        context['primary_image'] = self.object.primary_image
         return context
     # --- End added method ---
 
@@ -487,12 +526,19 @@ def finalize_product_image(request, product_id, uploaded_id):
             # Delete existing primary image(s) for this product
             ProductImage.objects.filter(product=product, is_primary=True).delete()
             # Create the new primary image record
-            ProductImage.objects.create(
+            product_image = ProductImage.objects.create(
                 product=product,
                 image=processed_relative_path, # Store relative path from MEDIA_ROOT
                 is_primary=True
             )
+            # The product_image_changed post_save receiver re-points product.primary_image
         logger.info(f"Successfully attached image '{processed_relative_path}' to Product {product_id}")
+        # Listing-sized WebP/AVIF copies; on failure listings fall back to the original
+        safe_generate_renditions(product_image)
+        # Dominant colors for the swatch filter, from the background-removed cutout
+        safe_extract_colors(product_image)
+        # Feature vector for "more like this"; also (re)indexes the product
+        safe_compute_embedding(product_image)
 
         # --- Cleanup Original Uploaded Image and Record ---
         try:
@@ -538,7 +584,7 @@ def edit_existing_product_image(request, pk):
         raise PermissionDenied("You do not have permission to edit this product's image.")
 
     # --- Find the primary image ---
-    primary_image = product.images.filter(is_primary=True).first()
+    primary_image = product.primary_image
 
     if not primary_image or not primary_image.image:
         messages.error(request, "No primary image found to edit for this product.")
@@ -564,6 +610,11 @@ def edit_existing_product_image(request, pk):
                 # Save the new content under the existing ImageField instance
                 # This will replace the file on the storage backend
                 primary_image.image.save(new_filename, image_content_file, save=True) # Save=True updates the model instance
+                # Same ProductImage row, so product.primary_image stays valid (the post_save receiver re-checks it)
+                # Old renditions show the pre-edit image; rebuild them from the new file
+                safe_generate_renditions(primary_image)
+                safe_extract_colors(primary_image)
+                safe_compute_embedding(primary_image)
 
                 logger.info(f"Overwrote existing image for ProductImage {primary_image.id} with edited version: {new_filename}")
                 messages.success(request, "Image edited and saved successfully!")
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserOutfit, OutfitItem, OutfitRecommendation
+from .models import UserOutfit, OutfitItem, OutfitRecommendation, PreviewRenderJob, AIGenerationJob, AICritiqueCacheEntry
 
 class OutfitItemInline(admin.TabularInline):
     """Inline view for Outfit Items within the UserOutfit admin."""
@@ -40,3 +40,28 @@ class OutfitRecommendationAdmin(admin.ModelAdmin):
         return (obj.criteria[:75] + '...') if len(obj.criteria) > 75 else obj.criteria
     criteria_summary.short_description = 'Criteria'
 
+
+@admin.register(PreviewRenderJob)
+class PreviewRenderJobAdmin(admin.ModelAdmin):
+    """Admin configuration for queued outfit preview renders."""
+    list_display = ('id', 'outfit', 'status', 'attempts', 'requested_at', 'finished_at', 'worker')
+    list_filter = ('status',)
+    search_fields = ('outfit__id', 'outfit__user__email')
+    readonly_fields = ('requested_at', 'started_at', 'finished_at', 'worker', 'error')
+
+
+@admin.register(AIGenerationJob)
+class AIGenerationJobAdmin(admin.ModelAdmin):
+    """Admin configuration for queued AI critique/image generations."""
+    list_display = ('id', 'outfit', 'status', 'attempts', 'requested_at', 'finished_at', 'worker')
+    list_filter = ('status',)
+    search_fields = ('outfit__id', 'outfit__user__email')
+    readonly_fields = ('requested_at', 'started_at', 'finished_at', 'worker', 'error')
+
+
+@admin.register(AICritiqueCacheEntry)
+class AICritiqueCacheEntryAdmin(admin.ModelAdmin):
+    """Admin configuration for cached Gemini responses."""
+    list_display = ('id', 'key', 'hits', 'created_at', 'last_used_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'created_at', 'last_used_at', 'hits')
@@ -0,0 +1,123 @@
+# mix_and_match/ai_cache.py
+"""
+Cache of Gemini critique + image responses (AICritiqueCacheEntry), so regenerating an
+unchanged outfit costs no API calls. The key covers everything that is sent: the composite
+(by its render key, which determines the composite bytes without rendering them), the
+critique and image prompts (built from build_prompt(profile) and the item details) and the
+model. Entries expire after AI_CACHE_TTL seconds; past AI_CACHE_MAX_ENTRIES the least
+recently used are deleted. Hit/miss counters live in the shared Django cache, so they
+cover every web and worker process (see the ai_cache_stats command).
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.utils import timezone
+
+from .gemini_client import IMAGE_GEN_MODEL_ALIAS, build_critique_prompt, build_image_prompt
+from .image_generator import render_key
+from .models import AICritiqueCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Bump to drop every entry, e.g. after changing how responses are post-processed
+CACHE_VERSION = 1
+HITS_KEY = 'mix_and_match:ai_cache:hits'
+MISSES_KEY = 'mix_and_match:ai_cache:misses'
+CALLS_PER_REQUEST = 2 # One critique and one image call per generation
+
+
+def cache_key(layers, user_details, item_details_str):
+    """SHA-256 identifying a Gemini request (see the module docstring)."""
+    payload = json.dumps(
+        [
+            CACHE_VERSION,
+            IMAGE_GEN_MODEL_ALIAS,
+            render_key(layers, profile='hq', fmt='png'), # The composite generate_outfit_image_with_critique sends
+            build_critique_prompt(user_details, item_details_str),
+            build_image_prompt(user_details, item_details_str),
+        ],
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError: # Key missing (first count or evicted)
+        cache.set(key, 1, None)
+
+
+def lookup(key):
+    """The live entry for key (counted as a hit), or None. Misses are counted by record_miss."""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_CACHE_TTL)
+    entry = AICritiqueCacheEntry.objects.filter(key=key, created_at__gte=cutoff).first()
+    if entry is None:
+        return None
+    AICritiqueCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    _count(HITS_KEY)
+    logger.info(f"AI cache hit for {key[:12]}")
+    return entry
+
+
+def record_miss():
+    """Counts a request that had to go to Gemini."""
+    _count(MISSES_KEY)
+
+
+def store(key, critique, image_bytes):
+    """Caches a successful response (critique text, PNG bytes or None) under key and returns the entry."""
+    entry, created = AICritiqueCacheEntry.objects.get_or_create(key=key, defaults={'critique': critique or ''})
+    if not created:
+        # Expired, or stored by a concurrent job for the same request; the new response replaces it
+        if entry.generated:
+            entry.generated.delete(save=False)
+        entry.generated = None # An image-less response must not keep pointing at the deleted file
+        entry.critique = critique or ''
+        entry.created_at = entry.last_used_at = timezone.now()
+    if image_bytes:
+        entry.generated.save(f"{key}.png", ContentFile(image_bytes), save=False)
+    entry.save()
+    evict()
+    return entry
+
+
+def evict(max_entries=None):
+    """Deletes expired entries, then the least recently used beyond max_entries. Returns the number deleted."""
+    if max_entries is None:
+        max_entries = settings.AI_CACHE_MAX_ENTRIES
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_CACHE_TTL)
+    # Queryset delete() still sends post_delete per entry, which removes its image file
+    expired, _ = AICritiqueCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+    over_limit = list(
+        AICritiqueCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:]
+    )
+    evicted, _ = AICritiqueCacheEntry.objects.filter(pk__in=over_limit).delete() if over_limit else (0, None)
+    if expired or evicted:
+        logger.info(f"AI cache: deleted {expired} expired and {evicted} least recently used entries")
+    return expired + evicted
+
+
+def stats():
+    """Hit/miss counters since the last reset_stats, with the API calls they saved."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'calls_saved': hits * CALLS_PER_REQUEST,
+        'entries': AICritiqueCacheEntry.objects.count(),
+        'max_entries': settings.AI_CACHE_MAX_ENTRIES,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
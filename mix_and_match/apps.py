@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MixAndMatchConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mix_and_match"
+
+    def ready(self):
+        from . import signals # noqa: F401 (registers receivers)
@@ -0,0 +1,40 @@
+# mix_and_match/batch.py
+"""
+Entry points for the process pool used by generate_previews --workers.
+Pool processes are started with 'spawn', so Django and the app are imported
+lazily, after django.setup() has run in the child (same pattern as
+image_scanning/batch.py).
+"""
+import os
+import time
+
+
+def init_process():
+    import django
+    django.setup()
+
+
+def render_previews(outfit_ids, force=False):
+    """
+    Renders previews for a chunk of outfits in this process (force: see update_outfit_preview_image).
+    Returns ([(outfit_id, success, seconds), ...], pid, tile cache stats).
+    Each process keeps its own tile cache, so stats are cumulative per pid.
+    """
+    from .models import UserOutfit
+    from .tile_cache import tile_cache
+    from .utils import update_outfit_preview_image
+
+    results = []
+    outfits = UserOutfit.objects.filter(pk__in=outfit_ids).order_by('pk')
+    found = set()
+    for outfit in outfits:
+        found.add(outfit.pk)
+        started = time.perf_counter()
+        try:
+            success = update_outfit_preview_image(outfit, force=force)
+        except Exception:
+            success = False
+        results.append((outfit.pk, success, time.perf_counter() - started))
+    # Outfits deleted since the parent listed them count as failures
+    results.extend((outfit_id, False, 0.0) for outfit_id in outfit_ids if outfit_id not in found)
+    return results, os.getpid(), tile_cache.stats()
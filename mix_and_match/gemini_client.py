@@ -1,12 +1,16 @@
 from google import genai
 from google.genai import types
-from PIL import Image
+from PIL import Image, ImageOps
 from io import BytesIO
+import asyncio
 import logging
+import os
+import threading
+import time
 from django.conf import settings
 from .models import UserOutfit
 from user.models import UserProfile
-from .image_generator import generate_outfit_image
+from .image_generator import generate_outfit_image, outfit_layers
 
 logger = logging.getLogger(__name__)
 
@@ -25,52 +29,8 @@ def build_prompt(profile: UserProfile):
     else:
         return "person wearing the outfit."
 
-def generate_outfit_image_with_critique(outfit: UserOutfit) -> tuple[Image.Image | None, str | None, str | None]:
-    """
-    Generates a composite image, sends to Gemini for critique and improved image separately.
-    Returns: (generated_pil_image | None, critique_text | None, error_message | None)
-    """
-    api_key = settings.GEMINI_API_KEY
-    if not api_key:
-        logger.error("GEMINI_API_KEY not configured.")
-        return None, None, "AI service is not configured."
-
-    # 1. Generate composite image
-    try:
-        composite_image_buffer = generate_outfit_image(outfit)
-        if not composite_image_buffer:
-            return None, None, "Failed to generate current outfit image."
-        current_outfit_pil = Image.open(composite_image_buffer).convert("RGB")
-    except Exception as e:
-        logger.error(f"Error generating composite for {outfit.id}: {e}", exc_info=True)
-        return None, None, "Error preparing current outfit image."
-
-    # 2. Build user details
-    try:
-        profile = UserProfile.objects.get(user=outfit.user)
-        user_details = build_prompt(profile)
-    except UserProfile.DoesNotExist:
-        logger.warning(f"Profile not found for {outfit.user.id}.")
-        user_details = "person wearing the outfit."
-    except Exception as e:
-        logger.error(f"Error building prompt details: {e}")
-        user_details = "person wearing the outfit."
-
-    # 3. Retrieve item details for prompts
-    items = outfit.items.select_related('product').all()
-    item_details = []
-    for item in items:
-        product = item.product
-        title = product.title
-        description = product.description[:50] + '...' if product.description and len(product.description) > 50 else product.description or "No description"
-        item_details.append(f"{title} - {description}")
-    item_details_str = "; ".join(item_details) if item_details else "No items in the outfit."
-
-    # 4. Set up client
-    client = genai.Client(api_key=api_key)
-
-    # 5. Generate critique
-    critique_prompt = f'''
+def build_critique_prompt(user_details: str, item_details_str: str) -> str:
+    return f'''
     You are a helpful and encouraging style assistant. Your goal is to provide constructive feedback on the outfit shown in the provided image. The outfit is worn by a person described as: {user_details}.
 
     The outfit consists of the following items: {item_details_str}
@@ -101,35 +61,9 @@ def generate_outfit_image_with_critique(outfit: UserOutfit) -> tuple[Image.Image
     Ensure suggestions respect the original items in the outfit.
     The aim is to empower the user with useful style insights about their chosen outfit."
     '''
-    logger.info(f"Critique prompt: {critique_prompt}")
-    try:
-        response_critique = client.models.generate_content(
-            model=IMAGE_GEN_MODEL_ALIAS,
-            contents=[critique_prompt, current_outfit_pil],
-            config=types.GenerateContentConfig(response_modalities=['TEXT'])
-        )
-        if not response_critique.candidates:
-            block_reason = response_critique.prompt_feedback.block_reason if response_critique.prompt_feedback else 'Unknown'
-            logger.warning(f"Critique response blocked/empty for Outfit {outfit.id}. Reason: {block_reason}")
-            critique_error = f"Critique generation blocked: {block_reason}"
-            critique_text = None
-        else:
-            critique_text = None
-            for part in response_critique.candidates[0].content.parts:
-                if part.text:
-                    critique_text = part.text.strip()
-                    break
-            if not critique_text:
-                critique_error = "Critique response did not contain text."
-            else:
-                critique_error = None
-    except Exception as e:
-        logger.error(f"Error generating critique for Outfit {outfit.id}: {e}", exc_info=True)
-        critique_error = f"Critique generation error: {str(e)[:100]}"
-        critique_text = None
 
-    # 6. Generate image with retry logic
-    image_gen_prompt = f'''
+def build_image_prompt(user_details: str, item_details_str: str) -> str:
+    return f'''
     Generate a single new, realistic, vertically oriented 512x768 image. Your sole purpose is to realistically visualize the exact clothing items provided in the original input image(s) as a complete outfit. This outfit should be depicted as worn by a person described as: {user_details}, presented against a neutral background.
 
     The outfit consists of the following items: {item_details_str}
@@ -153,57 +87,239 @@ def generate_outfit_image_with_critique(outfit: UserOutfit) -> tuple[Image.Image
     Ensure the full outfit is clearly visible and realistically lit.
     Objective Failure Condition: Any deviation from the specific visual appearance (color, structure, pattern, texture) of the items shown in the input images constitutes a failure to follow instructions. The output must look like the literal items from the input were assembled into an outfit."
     '''
-    logger.info(f"Image generation prompt: {image_gen_prompt}")
-    print(f"Image generation prompt: {image_gen_prompt}")
-    
-    generated_image_pil = None
-    image_error = None
-    max_attempts = 2  # Retry once with a simpler prompt if the first attempt fails
 
-    for attempt in range(max_attempts):
-        try:
-            # Use simpler prompt on retry
-            if attempt > 0:
-                image_gen_prompt = (
-                    f"Generate a realistic 512x768 vertical image of a stylish outfit for a person: {user_details}."
-                )
-                logger.info(f"Retry attempt {attempt + 1} with prompt: {image_gen_prompt}")
-                print(f"Retry attempt {attempt + 1} with prompt: {image_gen_prompt}")
-
-            response_image = client.models.generate_content(
-                model=IMAGE_GEN_MODEL_ALIAS,
-                contents=[image_gen_prompt, current_outfit_pil] if attempt == 0 else image_gen_prompt,
-                config=types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE'])
-            )
-            logger.debug(f"Image response candidates: {response_image.candidates}")
-            print(f"Image generation response: {response_image}")
-
-            if not response_image.candidates:
-                block_reason = response_image.prompt_feedback.block_reason if response_image.prompt_feedback else 'Unknown'
-                logger.warning(f"Image generation response blocked/empty for Outfit {outfit.id}. Reason: {block_reason}")
-                image_error = f"Image generation blocked: {block_reason}"
-                continue
-
-            generated_image_pil = None
-            for part in response_image.candidates[0].content.parts:
-                if part.inline_data and part.inline_data.mime_type.startswith('image/'):
-                    image_bytes = part.inline_data.data
-                    generated_image_pil = Image.open(BytesIO(image_bytes))
-                    logger.info(f"Successfully generated image for Outfit {outfit.id}")
-                    image_error = None
-                    break
-            if generated_image_pil:
-                break  # Exit retry loop if image is generated
+def build_retry_image_prompt(user_details: str) -> str:
+    """Simpler, text-only prompt for the second image attempt."""
+    return f"Generate a realistic 512x768 vertical image of a stylish outfit for a person: {user_details}."
+
+
+# --- Backends ---
+# Both expose async critique(prompt, image) -> str | None and
+# generate_image(prompt, image | None) -> PIL image | None, and raise
+# BlockedResponse when the model returns no candidates.
+
+class BlockedResponse(Exception):
+    pass
+
+
+class GeminiBackend:
+    """google-genai's async client. One instance per process (see get_backend), used only on the AI loop."""
+
+    def __init__(self, api_key):
+        self.client = genai.Client(api_key=api_key)
+
+    async def _generate(self, contents, modalities):
+        response = await self.client.aio.models.generate_content(
+            model=IMAGE_GEN_MODEL_ALIAS,
+            contents=contents,
+            config=types.GenerateContentConfig(response_modalities=modalities),
+        )
+        if not response.candidates:
+            raise BlockedResponse(response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown')
+        return response.candidates[0].content.parts
+
+    async def critique(self, prompt, image):
+        for part in await self._generate([prompt, image], ['TEXT']):
+            if part.text:
+                return part.text.strip()
+        return None
+
+    async def generate_image(self, prompt, image):
+        parts = await self._generate([prompt, image] if image is not None else prompt, ['TEXT', 'IMAGE'])
+        for part in parts:
+            if part.inline_data and part.inline_data.mime_type.startswith('image/'):
+                return Image.open(BytesIO(part.inline_data.data))
+        return None
+
+
+class StubBackend:
+    """
+    Offline stand-in (GEMINI_BACKEND='stub') for development and tests: no network,
+    fixed latencies so concurrency and timeouts behave like the real calls.
+    """
+    critique_delay = 1.0
+    image_delay = 2.0
+
+    async def critique(self, prompt, image):
+        await asyncio.sleep(self.critique_delay)
+        return (
+            "Overall Vibe & Strengths: A relaxed, well-balanced look. "
+            "(Offline stub critique; no AI service was called.)"
+        )
+
+    async def generate_image(self, prompt, image):
+        await asyncio.sleep(self.image_delay)
+        if image is None:
+            return Image.new('RGB', (512, 768), (235, 235, 235))
+        return ImageOps.pad(image.convert('RGB'), (512, 768), color=(235, 235, 235))
+
+
+# --- Per-process event loop ---
+# Django views here are sync, and the async client's HTTP connections belong to the
+# event loop that opened them. A daemon thread runs one long-lived loop per process,
+# so the client (and its connection pool) is created once and reused across requests.
+
+_loop_lock = threading.Lock()
+_loop = None
+_loop_pid = None
+_backend = None
+
+
+def _get_loop():
+    global _loop, _loop_pid, _backend
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid(): # A forked child can't use the parent's thread
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _backend = None
+            threading.Thread(target=_loop.run_forever, name='gemini-loop', daemon=True).start()
+        return _loop
+
+
+def get_backend():
+    """The process-wide backend selected by GEMINI_BACKEND ('gemini' or 'stub'), created on first use."""
+    global _backend
+    _get_loop()
+    with _loop_lock:
+        if _backend is None:
+            if settings.GEMINI_BACKEND == 'stub':
+                _backend = StubBackend()
             else:
-                image_error = "Image generation response did not contain an image."
-                logger.warning(image_error)
+                _backend = GeminiBackend(settings.GEMINI_API_KEY)
+        return _backend
+
+
+def run_on_ai_loop(coro):
+    """Runs a coroutine on the process's AI event loop and waits for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
 
+
+async def request_critique(backend, outfit_id, prompt, image, timeout):
+    """Returns (critique_text, error)."""
+    try:
+        critique_text = await asyncio.wait_for(backend.critique(prompt, image), timeout)
+    except BlockedResponse as e:
+        logger.warning(f"Critique response blocked/empty for Outfit {outfit_id}. Reason: {e}")
+        return None, f"Critique generation blocked: {e}"
+    except asyncio.TimeoutError:
+        logger.warning(f"Critique for Outfit {outfit_id} timed out after {timeout}s")
+        return None, "Critique generation timed out."
+    except Exception as e:
+        logger.error(f"Error generating critique for Outfit {outfit_id}: {e}", exc_info=True)
+        return None, f"Critique generation error: {str(e)[:100]}"
+    if not critique_text:
+        return None, "Critique response did not contain text."
+    return critique_text, None
+
+
+async def request_image(backend, outfit_id, prompts, image, timeout):
+    """
+    Returns (generated_pil_image, error). Tries each prompt in turn: the first with the
+    composite, later ones text-only. timeout applies per attempt.
+    """
+    image_error = None
+    for attempt, prompt in enumerate(prompts):
+        if attempt > 0:
+            logger.info(f"Retry attempt {attempt + 1} with prompt: {prompt}")
+        try:
+            generated = await asyncio.wait_for(
+                backend.generate_image(prompt, image if attempt == 0 else None), timeout
+            )
+        except BlockedResponse as e:
+            logger.warning(f"Image generation response blocked/empty for Outfit {outfit_id}. Reason: {e}")
+            image_error = f"Image generation blocked: {e}"
+            continue
+        except asyncio.TimeoutError:
+            logger.warning(f"Image generation for Outfit {outfit_id} timed out after {timeout}s (attempt {attempt + 1})")
+            image_error = "Image generation timed out."
+            continue
         except Exception as e:
-            logger.error(f"Error generating image for Outfit {outfit.id} (attempt {attempt + 1}): {e}", exc_info=True)
+            logger.error(f"Error generating image for Outfit {outfit_id} (attempt {attempt + 1}): {e}", exc_info=True)
             image_error = f"Image generation error: {str(e)[:100]}"
-            generated_image_pil = None
+            continue
+        if generated:
+            logger.info(f"Successfully generated image for Outfit {outfit_id}")
+            return generated, None
+        image_error = "Image generation response did not contain an image."
+        logger.warning(image_error)
+    return None, image_error
+
+
+async def critique_and_generate(backend, outfit_id, image, user_details, item_details_str):
+    """Issues the critique and image calls concurrently; returns (image, critique, critique_error, image_error)."""
+    critique_prompt = build_critique_prompt(user_details, item_details_str)
+    image_prompts = [build_image_prompt(user_details, item_details_str), build_retry_image_prompt(user_details)]
+    logger.info(f"Critique prompt: {critique_prompt}")
+    logger.info(f"Image generation prompt: {image_prompts[0]}")
+    (critique_text, critique_error), (generated_image, image_error) = await asyncio.gather(
+        request_critique(backend, outfit_id, critique_prompt, image, settings.GEMINI_CRITIQUE_TIMEOUT),
+        request_image(backend, outfit_id, image_prompts, image, settings.GEMINI_IMAGE_TIMEOUT),
+    )
+    return generated_image, critique_text, critique_error, image_error
+
+
+def outfit_prompt_details(outfit: UserOutfit, layers=None) -> tuple[str, str]:
+    """(user_details, item_details_str) for the prompts; layers are the outfit_layers rows if already fetched."""
+    # Build user details
+    try:
+        profile = UserProfile.objects.get(user=outfit.user)
+        user_details = build_prompt(profile)
+    except UserProfile.DoesNotExist:
+        logger.warning(f"Profile not found for {outfit.user.id}.")
+        user_details = "person wearing the outfit."
+    except Exception as e:
+        logger.error(f"Error building prompt details: {e}")
+        user_details = "person wearing the outfit."
+
+    # Retrieve item details for prompts (in paint order, so the same outfit always gives the same string)
+    items = outfit_layers(outfit) if layers is None else layers
+    item_details = []
+    for item in items:
+        product = item.product
+        title = product.title
+        description = product.description[:50] + '...' if product.description and len(product.description) > 50 else product.description or "No description"
+        item_details.append(f"{title} - {description}")
+    item_details_str = "; ".join(item_details) if item_details else "No items in the outfit."
+    return user_details, item_details_str
+
+
+def generate_outfit_image_with_critique(outfit: UserOutfit, layers=None, details=None) -> tuple[Image.Image | None, str | None, str | None]:
+    """
+    Generates a composite image, sends to Gemini for critique and improved image separately.
+    Both calls run concurrently on the per-process AI loop, so the wait is about the slower one.
+    layers (outfit_layers) and details (outfit_prompt_details) can be passed if already computed,
+    e.g. for the AI response cache key.
+    Returns: (generated_pil_image | None, critique_text | None, error_message | None)
+    """
+    if settings.GEMINI_BACKEND != 'stub' and not settings.GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY not configured.")
+        return None, None, "AI service is not configured."
+
+    # 1. Generate composite image
+    try:
+        composite_image_buffer = generate_outfit_image(outfit, layers=layers, profile='hq')
+        if not composite_image_buffer:
+            return None, None, "Failed to generate current outfit image."
+        current_outfit_pil = Image.open(composite_image_buffer).convert("RGB")
+    except Exception as e:
+        logger.error(f"Error generating composite for {outfit.id}: {e}", exc_info=True)
+        return None, None, "Error preparing current outfit image."
+
+    # 2-3. User and item details for the prompts
+    user_details, item_details_str = details or outfit_prompt_details(outfit, layers)
+
+    # 4. Critique and image generation, concurrently (all DB work is done above: the loop thread must not query)
+    started = time.perf_counter()
+    try:
+        generated_image_pil, critique_text, critique_error, image_error = run_on_ai_loop(
+            critique_and_generate(get_backend(), outfit.id, current_outfit_pil, user_details, item_details_str)
+        )
+    except Exception as e:
+        logger.error(f"AI calls failed for Outfit {outfit.id}: {e}", exc_info=True)
+        return None, None, "AI service error."
+    logger.info(f"AI calls for Outfit {outfit.id} finished in {time.perf_counter() - started:.2f}s")
 
-    # 7. Combine results
+    # 5. Combine results
     if critique_error and image_error:
         error_message = f"{critique_error} | {image_error}"
         return None, None, error_message
@@ -212,4 +328,4 @@ def generate_outfit_image_with_critique(outfit: UserOutfit) -> tuple[Image.Image
     elif image_error:
         return None, critique_text, image_error
     else:
-        return generated_image_pil, critique_text, None
\ No newline at end of file
+        return generated_image_pil, critique_text, None
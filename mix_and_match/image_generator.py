@@ -1,10 +1,11 @@
 # mix_and_match/image_generator.py
+import hashlib
+import json
 from io import BytesIO
-from PIL import Image, ImageDraw # ImageDraw might be useful later
+from PIL import Image, ImageDraw, features # ImageDraw might be useful later
 from PIL.Image import Resampling
-import os
-from django.conf import settings # Access MEDIA_ROOT if needed
 import logging # Optional: Use logging instead of print for production
+from .tile_cache import get_tile
 
 # Optional: Get logger
 logger = logging.getLogger(__name__)
@@ -13,108 +14,148 @@ logger = logging.getLogger(__name__)
 BASE_WIDTH = 80 # This corresponds to the frontend's base item width before scaling
 TARGET_CANVAS_WIDTH = 500
 TARGET_CANVAS_HEIGHT = 500
+# Bump when the compositing itself changes so every render key (and preview file) changes with it
+RENDER_VERSION = 1
+
+# Render profiles. 'draft' box-reduces each tile by an integer factor and finishes with
+# BILINEAR, for stored previews and other interactive views; 'hq' resamples from full
+# resolution with LANCZOS, for downloads and the AI pipeline.
+RENDER_PROFILES = {
+    'draft': {'resample': Resampling.BILINEAR, 'reduce': True, 'format': 'webp'},
+    'hq': {'resample': Resampling.LANCZOS, 'reduce': False, 'format': 'png'},
+}
+# Pillow builds without libwebp fall back to PNG.
+OUTPUT_FORMATS = tuple(fmt for fmt in ('png', 'webp', 'jpeg') if fmt != 'webp' or features.check('webp'))
+MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'png': 'png', 'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {
+    'png': {},
+    'webp': {'quality': 82, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True},
+}
+JPEG_BACKGROUND = (255, 255, 255) # JPEG has no alpha; the canvas is flattened onto white
+
+
+def output_format(profile, fmt=None):
+    """The format a render is encoded in: fmt if given and supported, else the profile's default."""
+    fmt = fmt or RENDER_PROFILES[profile]['format']
+    return fmt if fmt in OUTPUT_FORMATS else 'png'
+
+
+def encode(canvas_img, fmt):
+    """Encodes an RGBA canvas to a rewound BytesIO in the given output format."""
+    if fmt == 'jpeg':
+        flattened = Image.new('RGB', canvas_img.size, JPEG_BACKGROUND)
+        flattened.paste(canvas_img, mask=canvas_img)
+        canvas_img = flattened
+    output = BytesIO()
+    canvas_img.save(output, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    output.seek(0)
+    return output
+
+
+def outfit_layers(outfit):
+    """The outfit's items in paint order, with each product's primary image joined in."""
+    # Product.primary_image is denormalized, so one join fetches each item's image
+    return list(outfit.items.select_related('product__primary_image').order_by('z_index', 'id'))
+
 
-def generate_outfit_image(outfit):
+def _layer_geometry(item, factor=1.0):
     """
-    Given a UserOutfit instance, generate a composite PNG image of size 500x500.
+    (tile width, paste x, paste y): the values generate_outfit_image actually draws with.
+    Positions and scale are saved for the 500px canvas; factor scales them to another size.
+    """
+    return (
+        max(1, int(BASE_WIDTH * item.scale * factor)),
+        int(round(item.position_x * factor)),
+        int(round(item.position_y * factor)),
+    )
+
+
+def render_key(layers, profile='hq', fmt=None, size=TARGET_CANVAS_WIDTH):
+    """
+    SHA-256 of everything that affects the composite: the ordered (product image, geometry)
+    of each drawable layer plus the canvas size, profile, output format and RENDER_VERSION. Layouts that render the same
+    pixels get the same key, whichever outfit or user they belong to. A product image is
+    identified by its name and updated_at, so a file saved again under the same name
+    still changes the key.
+    """
+    factor = size / TARGET_CANVAS_WIDTH
+    drawn = [
+        [
+            item.product.primary_image.image.name,
+            item.product.primary_image.updated_at.isoformat(),
+            *_layer_geometry(item, factor),
+        ]
+        for item in layers
+        if item.product.primary_image and item.product.primary_image.image
+    ]
+    payload = json.dumps(
+        [RENDER_VERSION, size, size * TARGET_CANVAS_HEIGHT // TARGET_CANVAS_WIDTH, profile, output_format(profile, fmt), drawn],
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def generate_outfit_image(outfit, layers=None, profile='hq', fmt=None, size=TARGET_CANVAS_WIDTH):
+    """
+    Given a UserOutfit instance, generate a composite image of size 500x500
+    (or size x size, with the saved layout scaled to match),
+    rendered with a RENDER_PROFILES profile and encoded as fmt (default: the
+    profile's format, so PNG for 'hq').
     OutfitItems are sorted by z_index (ascending) so lower layers are drawn first.
     Each product's primary image is resized based on the outfit item's scale
     (relative to BASE_WIDTH) and pasted onto the canvas at the stored
     normalized position_x, position_y (relative to TARGET_CANVAS_WIDTH/HEIGHT).
+    Pass layers (from outfit_layers) to reuse items already fetched for render_key.
     """
     # Use logger instead of print
-    logger.info(f"Starting image generation for Outfit ID: {outfit.id}")
-    canvas_size = (TARGET_CANVAS_WIDTH, TARGET_CANVAS_HEIGHT)
+    logger.info(f"Starting {profile} image generation for Outfit ID: {outfit.id}")
+    render_profile = RENDER_PROFILES[profile]
+    fmt = output_format(profile, fmt)
+    factor = size / TARGET_CANVAS_WIDTH
+    canvas_size = (size, size * TARGET_CANVAS_HEIGHT // TARGET_CANVAS_WIDTH)
     # Start with a transparent background
     canvas_img = Image.new("RGBA", canvas_size, (255, 255, 255, 0))
 
     # Ensure items relation is loaded, order by z_index
-    # Use prefetch_related for product images to optimize DB queries
-    items = outfit.items.select_related('product').prefetch_related('product__images').order_by('z_index')
-    if not items.exists():
+    items = outfit_layers(outfit) if layers is None else layers
+    if not items:
         logger.warning(f"Outfit {outfit.id} has no items to generate.")
         # Return an empty (transparent) image
-        output = BytesIO()
-        canvas_img.save(output, format="PNG")
-        output.seek(0)
-        return output
+        return encode(canvas_img, fmt)
 
     item_count = 0
     for item in items:
         logger.debug(f"Processing item {item.id} for outfit {outfit.id} (Product ID: {item.product_id}, Z: {item.z_index})")
-        # Find primary image or first image efficiently from prefetched data
-        primary_image_instance = None
-        first_image_instance = None
-        # Check if images were prefetched; otherwise, query
-        product_images = item.product.images.all() # Access prefetched or query if needed
-
-        for img in product_images:
-            if img.is_primary:
-                primary_image_instance = img
-                break
-            if first_image_instance is None:
-                first_image_instance = img
-
-        prod_img_instance = primary_image_instance or first_image_instance
+        # Primary image (or first image) is denormalized on Product
+        prod_img_instance = item.product.primary_image
 
         if not prod_img_instance or not prod_img_instance.image:
             logger.warning(f"Skipping item {item.id} (Product ID: {item.product_id}) - No valid image instance found.")
             continue
 
-        try:
-            # Get image path. Handle different storage backends potentially.
-            # For default FileSystemStorage:
-            if hasattr(settings, 'MEDIA_ROOT') and settings.MEDIA_ROOT:
-                 image_path = os.path.join(settings.MEDIA_ROOT, prod_img_instance.image.name)
-                 if not os.path.exists(image_path):
-                    raise FileNotFoundError(f"Image file not found at path: {image_path}")
-                 prod_img = Image.open(image_path).convert("RGBA") # Open from path
-            else:
-                 # Handle other storage (e.g., S3 might require reading from URL or storage object)
-                 # This basic example assumes FileSystemStorage or image field providing accessible path/file
-                 with prod_img_instance.image.open('rb') as f:
-                      prod_img = Image.open(f).convert("RGBA") # Open from file field
-
-
-            logger.debug(f"Opened image for item {item.id}: {prod_img_instance.image.name} (Size: {prod_img.size})")
+        # This calculates the target pixel width based on the frontend's 80px base and saved scale
+        # (height keeps the image's aspect ratio; see tile_cache.get_tile)
+        new_pixel_width, paste_x, paste_y = _layer_geometry(item, factor)
 
+        try:
+            # Decoded + resized tiles are cached per (path, mtime, width, filter) across renders
+            prod_img_resized = get_tile(
+                prod_img_instance.image, new_pixel_width,
+                resample=render_profile['resample'], reduce=render_profile['reduce'],
+            )
+            logger.debug(f"Tile for item {item.id}: {prod_img_instance.image.name} Scale={item.scale:.3f}, Size={prod_img_resized.size}")
         except FileNotFoundError as e:
             logger.error(f"ERROR finding image file for item {item.id}: {e}")
             continue # Skip this item
         except Exception as e:
-            logger.error(f"ERROR opening image for item {item.id} (Path/Name: {getattr(prod_img_instance, 'image', 'N/A')}): {e}", exc_info=True)
+            logger.error(f"ERROR opening/resizing image for item {item.id} (Path/Name: {getattr(prod_img_instance, 'image', 'N/A')}): {e}", exc_info=True)
             continue # Skip this item if image can't be opened
 
-        # --- Calculate size based on scale and BASE_WIDTH ---
-        original_width, original_height = prod_img.size
-        if original_width <= 0 or original_height <= 0: # Check height too
-            logger.warning(f"Skipping item {item.id} - Image has zero/negative dimensions: {prod_img.size}.")
-            continue
-
-        # This calculates the target pixel width based on the frontend's 80px base and saved scale
-        new_pixel_width = int(BASE_WIDTH * item.scale)
-        # Maintain aspect ratio based on the original image's dimensions
-        aspect_ratio = float(original_height) / float(original_width)
-        new_pixel_height = int(new_pixel_width * aspect_ratio)
-
-        # Ensure minimum dimensions (e.g., 1x1) after scaling
-        new_pixel_width = max(1, new_pixel_width)
-        new_pixel_height = max(1, new_pixel_height)
-
-        logger.debug(f"Resizing item {item.id}: Original={original_width}x{original_height}, Scale={item.scale:.3f}, Target={new_pixel_width}x{new_pixel_height}")
-
-        try:
-            # Use LANCZOS (or Resampling.BILINEAR for speed) for resizing
-            prod_img_resized = prod_img.resize((new_pixel_width, new_pixel_height), Resampling.LANCZOS)
-        except Exception as e:
-            logger.error(f"ERROR resizing image for item {item.id} to {new_pixel_width}x{new_pixel_height}: {e}", exc_info=True)
-            continue # Skip if resize fails
-
         # --- Calculate paste position ---
         # position_x and position_y are saved normalized (0-500 range from frontend)
-        # We use these directly as the top-left coordinates for pasting onto the 500x500 canvas.
-        paste_x = int(round(item.position_x)) # Round to nearest integer
-        paste_y = int(round(item.position_y)) # Round to nearest integer
+        # We use these directly (rounded) as the top-left coordinates for pasting onto the 500x500 canvas.
         paste_position = (paste_x, paste_y)
         logger.debug(f"Pasting item {item.id} at {paste_position} (Normalized Pos: {item.position_x:.2f}, {item.position_y:.2f}) with z-index {item.z_index}")
 
@@ -132,10 +173,8 @@ def generate_outfit_image(outfit):
     logger.info(f"Finished generation. Pasted {item_count} items onto canvas for Outfit ID: {outfit.id}")
 
     # --- Save final image to BytesIO ---
-    output = BytesIO()
     try:
-        canvas_img.save(output, format="PNG")
-        output.seek(0) # Rewind buffer to the beginning for reading
+        output = encode(canvas_img, fmt) # Rewound, ready for reading
         logger.info(f"Successfully saved final canvas image to buffer for Outfit ID: {outfit.id}")
         return output
     except Exception as e:
@@ -0,0 +1,40 @@
+# mix_and_match/management/commands/ai_cache_stats.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mix_and_match import ai_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Shows how many AI generation requests were answered from the response cache '
+        'and the Gemini calls that saved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Delete expired entries and trim the cache to AI_CACHE_MAX_ENTRIES first.',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Zero the hit/miss counters after printing them.',
+        )
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            self.stdout.write(f"Deleted {ai_cache.evict()} cache entries.")
+
+        stats = ai_cache.stats()
+        self.stdout.write(f"Entries:     {stats['entries']}/{stats['max_entries']} (TTL {settings.AI_CACHE_TTL // 3600}h)")
+        self.stdout.write(f"Hits:        {stats['hits']}")
+        self.stdout.write(f"Misses:      {stats['misses']} (requests sent to Gemini)")
+        self.stdout.write(f"Hit rate:    {stats['hit_rate']:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"Calls saved: {stats['calls_saved']} Gemini calls"))
+
+        if options['reset']:
+            ai_cache.reset_stats()
+            self.stdout.write("Counters reset.")
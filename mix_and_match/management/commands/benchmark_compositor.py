@@ -0,0 +1,115 @@
+# mix_and_match/management/commands/benchmark_compositor.py
+
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from mix_and_match.image_generator import (
+    OUTPUT_FORMATS, RENDER_PROFILES, generate_outfit_image, outfit_layers,
+)
+from mix_and_match.models import UserOutfit
+from mix_and_match.tile_cache import tile_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks generate_outfit_image for each render profile and output format: '
+        'renders/s with a cold and a warm tile cache, mean output bytes, and the mean '
+        'pixel difference from the hq profile.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--outfit_ids',
+            nargs='+',
+            type=int,
+            help='Outfits to render (default: the --limit most recently updated).',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of recent outfits to render when --outfit_ids is not given (default 20).',
+        )
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            choices=sorted(RENDER_PROFILES),
+            default=sorted(RENDER_PROFILES),
+        )
+        parser.add_argument(
+            '--formats',
+            nargs='+',
+            choices=OUTPUT_FORMATS,
+            default=list(OUTPUT_FORMATS),
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Passes over the outfits per profile/format; the median pass is reported.',
+        )
+
+    def handle(self, *args, **options):
+        outfits = UserOutfit.objects.all()
+        if options['outfit_ids']:
+            outfits = outfits.filter(id__in=options['outfit_ids'])
+        else:
+            outfits = outfits.order_by('-updated_at')[:options['limit']]
+        # Fetch layers up front so the timings cover decoding, resizing, compositing and encoding only
+        renders = [(outfit, outfit_layers(outfit)) for outfit in outfits]
+        renders = [(outfit, layers) for outfit, layers in renders if layers]
+        if not renders:
+            raise CommandError("No outfits with items to render.")
+        repeat = max(1, options['repeat'])
+
+        self.stdout.write(f"Rendering {len(renders)} outfit(s), {repeat} pass(es) per profile/format.")
+        self.stdout.write(
+            f"{'profile':<8} {'format':<6} {'cold/s':>8} {'warm/s':>8} {'avg KB':>8} {'diff vs hq':>11}"
+        )
+        self.stdout.write("-" * 54)
+        reference = {outfit.id: self._pixels(generate_outfit_image(outfit, layers, 'hq', 'png')) for outfit, layers in renders}
+
+        for profile in options['profiles']:
+            for fmt in options['formats']:
+                cold = statistics.median(self._pass(renders, profile, fmt, cold=True) for _ in range(repeat))
+                self._pass(renders, profile, fmt, cold=False) # Fill the cache for the warm passes
+                warm = statistics.median(self._pass(renders, profile, fmt, cold=False) for _ in range(repeat))
+
+                sizes, diffs = [], []
+                for outfit, layers in renders:
+                    output = generate_outfit_image(outfit, layers, profile, fmt)
+                    sizes.append(output.getbuffer().nbytes)
+                    diffs.append(self._mean_abs_diff(reference[outfit.id], self._pixels(output)))
+                self.stdout.write(
+                    f"{profile:<8} {fmt:<6} {len(renders) / cold:>8.1f} {len(renders) / warm:>8.1f} "
+                    f"{statistics.mean(sizes) / 1024:>8.1f} {statistics.mean(diffs):>8.2f}/255"
+                )
+        tile_cache.clear()
+
+    def _pass(self, renders, profile, fmt, cold):
+        """Seconds to render every outfit once; cold clears the tile cache before each render."""
+        elapsed = 0.0
+        for outfit, layers in renders:
+            if cold:
+                tile_cache.clear()
+            started = time.perf_counter()
+            generate_outfit_image(outfit, layers, profile, fmt)
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def _pixels(self, output):
+        # JPEG has no alpha; compare everything as RGB over white, as the JPEG itself is
+        image = Image.open(output).convert('RGBA')
+        flattened = Image.new('RGB', image.size, (255, 255, 255))
+        flattened.paste(image, mask=image)
+        return np.asarray(flattened, dtype=np.int16)
+
+    def _mean_abs_diff(self, a, b):
+        return float(np.mean(np.abs(a - b)))
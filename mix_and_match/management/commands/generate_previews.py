@@ -1,21 +1,33 @@
 # mix_and_match/management/commands/generate_previews.py
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Q
-from mix_and_match.models import UserOutfit
-from mix_and_match.utils import update_outfit_preview_image
+from django.db.models import Q, F, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from mix_and_match.models import UserOutfit, OutfitAIResult
+from mix_and_match.batch import init_process, render_previews
 import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Generates missing 2D preview images for UserOutfits.'
+    help = 'Generates missing or stale 2D preview images for UserOutfits.'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Regenerate previews even for outfits that already have one.',
+            help='Regenerate previews even for outfits whose preview is up to date, overwriting existing render files.',
+        )
+        parser.add_argument(
+            '--rendered-before',
+            help=(
+                'With --force, only regenerate previews rendered before this ISO datetime. '
+                'Pass the start time printed by an interrupted --force run to resume it.'
+            ),
         )
         parser.add_argument(
             '--outfit_ids',
@@ -23,10 +35,34 @@ class Command(BaseCommand):
             type=int,
             help='Specific outfit IDs to process.',
         )
+        parser.add_argument(
+            '--check-files',
+            action='store_true',
+            help=(
+                'Also stat every preview and AI image file: clear AI images whose file is gone and '
+                're-render previews whose file is gone (display_image_url trusts the stored names).'
+            ),
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of rendering processes (default 1: render in this process).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Outfits per DB read and per task handed to a worker (default 100).',
+        )
 
     def handle(self, *args, **options):
         force_regeneration = options['force']
         specific_ids = options['outfit_ids']
+        workers = options['workers']
+        batch_size = options['batch_size']
+        if workers < 1 or batch_size < 1:
+            raise CommandError("--workers and --batch-size must be at least 1.")
 
         outfits_to_process = UserOutfit.objects.all()
 
@@ -34,47 +70,134 @@ class Command(BaseCommand):
             self.stdout.write(f"Processing specific outfit IDs: {specific_ids}")
             outfits_to_process = outfits_to_process.filter(id__in=specific_ids)
         elif not force_regeneration:
-             # Process only those missing a preview image
-             # Check for null=True OR blank=True ('')
-             outfits_to_process = outfits_to_process.filter(
+             # Missing previews, plus previews older than the latest change to the outfit's items.
+             # Rendered outfits drop out of this set, so an interrupted run resumes where it stopped.
+             outfits_to_process = outfits_to_process.annotate(
+                 items_modified_at=Max('items__modified_at')
+             ).filter(
                  Q(preview_image__isnull=True) | Q(preview_image='')
+                 | Q(preview_generated_at__isnull=True)
+                 | Q(preview_generated_at__lt=F('items_modified_at'))
              )
-             self.stdout.write("Processing outfits missing preview images...")
+             self.stdout.write("Processing outfits with missing or stale preview images...")
         else:
-             self.stdout.write(self.style.WARNING("Processing ALL outfits (including existing previews) due to --force flag."))
+             rendered_before = options['rendered_before']
+             if rendered_before:
+                 cutoff = parse_datetime(rendered_before)
+                 if cutoff is None:
+                     raise CommandError(f"Invalid --rendered-before datetime: {rendered_before}")
+                 if timezone.is_naive(cutoff):
+                     cutoff = timezone.make_aware(cutoff)
+                 outfits_to_process = outfits_to_process.filter(
+                     Q(preview_generated_at__isnull=True) | Q(preview_generated_at__lt=cutoff)
+                 )
+                 self.stdout.write(self.style.WARNING(f"Resuming --force run: previews rendered before {cutoff.isoformat()}."))
+             else:
+                 self.stdout.write(self.style.WARNING(
+                     "Processing ALL outfits (including existing previews) due to --force flag. "
+                     f"To resume if interrupted: --force --rendered-before {timezone.now().isoformat()}"
+                 ))
 
-        total_outfits = outfits_to_process.count()
+        outfit_ids = list(outfits_to_process.order_by('id').values_list('id', flat=True))
+        if options['check_files']:
+            missing_ids = self._find_missing_files(batch_size)
+            if specific_ids:
+                missing_ids &= set(specific_ids)
+            outfit_ids = sorted(set(outfit_ids) | missing_ids)
+        total_outfits = len(outfit_ids)
         if total_outfits == 0:
             self.stdout.write(self.style.SUCCESS("No outfits needed processing."))
             return
 
-        self.stdout.write(f"Found {total_outfits} outfit(s) to process.")
-
-        processed_count = 0
-        success_count = 0
-        failure_count = 0
-
-        for outfit in outfits_to_process.iterator(): # Use iterator for memory efficiency
-            processed_count += 1
-            self.stdout.write(f"[{processed_count}/{total_outfits}] Processing Outfit ID: {outfit.id}...", ending='')
-            try:
-                # Ensure items are loaded if needed by generator
-                # (generate_outfit_image already selects related items)
-                success = update_outfit_preview_image(outfit)
-                if success:
-                    self.stdout.write(self.style.SUCCESS(" OK"))
-                    success_count += 1
-                else:
-                    self.stdout.write(self.style.WARNING(" FAILED (Generation/Save Error)"))
-                    failure_count += 1
-            except Exception as e:
-                 self.stdout.write(self.style.ERROR(f" ERROR ({e})"))
-                 failure_count += 1
-                 logger.error(f"Management command error processing Outfit {outfit.id}", exc_info=True)
+        workers = min(workers, -(-total_outfits // batch_size)) # No more processes than batches
+        self.stdout.write(f"Found {total_outfits} outfit(s) to process with {workers} worker(s), batch size {batch_size}.")
+
+        batches = [outfit_ids[i:i + batch_size] for i in range(0, total_outfits, batch_size)]
+        self.processed_count = 0
+        self.success_count = 0
+        self.failure_count = 0
+        self.total_outfits = total_outfits
+        cache_stats = {} # pid -> latest cumulative tile cache stats
+        started = time.perf_counter()
 
+        if workers == 1:
+            for batch in batches:
+                results, pid, stats = render_previews(batch, force_regeneration)
+                cache_stats[pid] = stats
+                self._report(results)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'), # see mix_and_match/batch.py
+                initializer=init_process,
+            ) as pool:
+                futures = {pool.submit(render_previews, batch, force_regeneration): batch for batch in batches}
+                for future in as_completed(futures):
+                    try:
+                        results, pid, stats = future.result()
+                    except Exception as e:
+                        batch = futures[future]
+                        logger.error(f"Preview worker failed on outfits {batch[0]}-{batch[-1]}", exc_info=True)
+                        self.stdout.write(self.style.ERROR(f"Worker ERROR on {len(batch)} outfit(s) ({e})"))
+                        self._report([(outfit_id, False, 0.0) for outfit_id in batch])
+                        continue
+                    cache_stats[pid] = stats
+                    self._report(results)
+
+        elapsed = time.perf_counter() - started
+        hits = sum(s['hits'] for s in cache_stats.values())
+        misses = sum(s['misses'] for s in cache_stats.values())
 
         self.stdout.write("-" * 30)
-        self.stdout.write(self.style.SUCCESS(f"Successfully generated/updated: {success_count}"))
-        if failure_count > 0:
-             self.stdout.write(self.style.ERROR(f"Failed: {failure_count}"))
-        self.stdout.write("Processing complete.")
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Successfully generated/updated: {self.success_count}"))
+        if self.failure_count > 0:
+             self.stdout.write(self.style.ERROR(f"Failed: {self.failure_count}"))
+        self.stdout.write(
+            f"Rendered {self.processed_count} outfit(s) in {elapsed:.1f}s "
+            f"({self.processed_count / elapsed if elapsed else 0:.1f} outfits/s with {workers} worker(s))."
+        )
+        self.stdout.write(
+            f"Image cache: {hits} hits, {misses} misses "
+            f"({hits / (hits + misses) if hits + misses else 0:.0%} hit rate) across {len(cache_stats)} process(es)."
+        )
+        self.stdout.write("Processing complete.")
+
+    def _find_missing_files(self, batch_size):
+        """
+        Clears OutfitAIResult images whose file no longer exists and returns the ids of
+        outfits whose preview file no longer exists (their preview fields are cleared too).
+        """
+        ai_storage = OutfitAIResult._meta.get_field('generated').storage
+        missing_ai = [
+            pk for pk, name in OutfitAIResult.objects.exclude(generated='').values_list('pk', 'generated').iterator(chunk_size=batch_size)
+            if not ai_storage.exists(name)
+        ]
+        if missing_ai:
+            OutfitAIResult.objects.filter(pk__in=missing_ai).update(generated='')
+            self.stdout.write(self.style.WARNING(f"Cleared {len(missing_ai)} AI result image(s) whose file is missing."))
+
+        preview_storage = UserOutfit._meta.get_field('preview_image').storage
+        missing_names = {
+            name for name in (
+                UserOutfit.objects.exclude(preview_image='').exclude(preview_image__isnull=True)
+                .values_list('preview_image', flat=True).distinct().iterator(chunk_size=batch_size)
+            )
+            if not preview_storage.exists(name) # Once per file, however many outfits share it
+        }
+        missing_previews = UserOutfit.objects.filter(preview_image__in=missing_names)
+        missing_ids = set(missing_previews.values_list('id', flat=True))
+        if missing_ids:
+            missing_previews.update(preview_image='', preview_hash='', preview_generated_at=None)
+            self.stdout.write(self.style.WARNING(f"{len(missing_ids)} outfit(s) have a missing preview file; re-rendering."))
+        return missing_ids
+
+    def _report(self, results):
+        for outfit_id, success, seconds in results:
+            self.processed_count += 1
+            prefix = f"[{self.processed_count}/{self.total_outfits}] Outfit ID: {outfit_id}..."
+            if success:
+                self.success_count += 1
+                self.stdout.write(prefix + self.style.SUCCESS(f" OK ({seconds:.2f}s)"))
+            else:
+                self.failure_count += 1
+                self.stdout.write(prefix + self.style.WARNING(" FAILED (Generation/Save Error)"))
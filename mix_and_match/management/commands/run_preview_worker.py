@@ -0,0 +1,105 @@
+# mix_and_match/management/commands/run_preview_worker.py
+
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from mix_and_match.services import claim_next_preview_job, run_preview_job, requeue_stale_preview_jobs
+from mix_and_match.tile_cache import log_stats
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        'Runs the outfit preview worker: claims queued PreviewRenderJobs and renders '
+        'the 2D previews outside the web workers. Run one per host (e.g. under systemd).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of previews rendered in parallel (default 1).',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.IMAGE_WORKER_POLL_INTERVAL,
+            help='Seconds to wait before polling again when no job is due.',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no job is due instead of waiting for new jobs.',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+
+        self.stop_event = threading.Event()
+        self.counts = {'done': 0, 'failed': 0}
+        self.counts_lock = threading.Lock()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._request_stop)
+            signal.signal(signal.SIGINT, self._request_stop)
+
+        requeue_stale_preview_jobs() # Jobs orphaned by a previous worker crash
+        self.stdout.write(
+            f"Preview worker started with concurrency={concurrency}, "
+            f"debounce {settings.OUTFIT_PREVIEW_DEBOUNCE:g}s{' (burst)' if burst else ''}."
+        )
+
+        threads = [
+            threading.Thread(target=self._work_loop, args=(poll_interval, burst), name=f"preview-worker-{i}")
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # join with a timeout so the main thread keeps receiving signals
+            while thread.is_alive():
+                thread.join(timeout=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Preview worker stopped. Done: {self.counts['done']}, failed: {self.counts['failed']}."
+        ))
+        stats = log_stats("preview worker run")
+        self.stdout.write(f"Image cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate).")
+
+    def _request_stop(self, signum, frame):
+        self.stdout.write(self.style.WARNING("Stopping after the renders in progress finish..."))
+        self.stop_event.set()
+
+    def _work_loop(self, poll_interval, burst):
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                job = claim_next_preview_job()
+                if job is None:
+                    if burst:
+                        return
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                self.stdout.write(f"[{threading.current_thread().name}] Job {job.id} (outfit {job.outfit_id})...")
+                started = time.monotonic()
+                success = run_preview_job(job)
+                with self.counts_lock:
+                    self.counts['done' if success else 'failed'] += 1
+                status = self.style.SUCCESS("OK") if success else self.style.ERROR("FAILED")
+                self.stdout.write(f"[{threading.current_thread().name}] Job {job.id} {status} in {time.monotonic() - started:.2f}s")
+        except Exception:
+            logger.error("Preview worker thread crashed", exc_info=True)
+            raise
+        finally:
+            connection.close() # Each thread has its own DB connection
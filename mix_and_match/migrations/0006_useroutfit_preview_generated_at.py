@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 00:49
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def backfill_preview_generated_at(apps, schema_editor):
+    # Existing previews were saved together with updated_at, the closest record of when they were rendered
+    UserOutfit = apps.get_model('mix_and_match', 'UserOutfit')
+    UserOutfit.objects.exclude(Q(preview_image__isnull=True) | Q(preview_image='')).update(
+        preview_generated_at=F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mix_and_match', '0005_useroutfit_is_public'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useroutfit',
+            name='preview_generated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_preview_generated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 00:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mix_and_match', '0006_useroutfit_preview_generated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreviewRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('outfit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preview_job', to='mix_and_match.useroutfit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'requested_at'], name='preview_job_status_requested')],
+            },
+        ),
+    ]
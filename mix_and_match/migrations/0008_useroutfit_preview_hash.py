@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mix_and_match', '0007_previewrenderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useroutfit',
+            name='preview_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
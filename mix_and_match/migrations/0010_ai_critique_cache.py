@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 01:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mix_and_match', '0009_aigenerationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outfitairesult',
+            name='content_key',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='AICritiqueCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('critique', models.TextField(blank=True)),
+                ('generated', models.ImageField(blank=True, upload_to='ai_cache/')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'AI critique cache entries',
+                'indexes': [models.Index(fields=['last_used_at'], name='ai_cache_last_used')],
+            },
+        ),
+    ]
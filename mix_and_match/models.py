@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from marketplace.models import Product
 from django.templatetags.static import static
 
@@ -8,6 +9,10 @@ class UserOutfit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     preview_image = models.ImageField(upload_to='outfit_previews/', null=True, blank=True)
+    # When preview_image was last rendered; stale if any item was modified after it (see generate_previews)
+    preview_generated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Render key of preview_image (image_generator.render_key); the file is stored under it
+    preview_hash = models.CharField(max_length=64, blank=True, editable=False)
     is_public = models.BooleanField(
             default=True,
             help_text="Make this outfit visible on your public profile?"
@@ -25,6 +30,15 @@ class UserOutfit(models.Model):
              return self.items.count()
         return 0 # Return 0 if 'items' doesn't exist (e.g., before initial save)
 
+    @property
+    def preview_pending(self):
+        """True while a PreviewRenderJob for this outfit is queued or running."""
+        try:
+            job = self.preview_job
+        except models.ObjectDoesNotExist:
+            return not self.preview_image # Never queued (e.g. created before the queue existed)
+        return job.status in (PreviewRenderJob.STATUS_PENDING, PreviewRenderJob.STATUS_RUNNING)
+
 
     @property
     def display_image_url(self):
@@ -32,6 +46,9 @@ class UserOutfit(models.Model):
         Returns the URL for the best available preview image.
         Priority: AI Generated > Auto-generated 2D Preview > Placeholder
         Includes cache-busting parameter.
+        Makes no storage calls: a file field is only set once its file is written and
+        cleared (or the row deleted) when the file is removed, so a set name means the
+        file exists. Listing pages evaluate this per outfit; prefetch 'ai_result'.
         """
         # Determine timestamp for cache busting (use updated_at if available)
         timestamp = self.updated_at.timestamp() if self.updated_at else timezone.now().timestamp()
@@ -40,31 +57,99 @@ class UserOutfit(models.Model):
         placeholder = static('images/placeholder.png') # Default placeholder
 
         # 1. Check AI result image
-        ai_result_image_url = None
-        if hasattr(self, 'ai_result') and self.ai_result and hasattr(self.ai_result, 'generated') and self.ai_result.generated:
-             try:
-                 # Check storage existence if possible/needed
-                 if self.ai_result.generated.storage.exists(self.ai_result.generated.name):
-                      ai_result_image_url = self.ai_result.generated.url
-             except Exception: # Catch storage errors or ValueError from .url
-                 pass # Fall through
-        if ai_result_image_url:
-             return ai_result_image_url + cache_bust
-
-        # 2. Check auto-generated preview_image
-        preview_image_url = None
-        if self.preview_image and hasattr(self.preview_image, 'url'):
-             try:
-                 if self.preview_image.storage.exists(self.preview_image.name):
-                     preview_image_url = self.preview_image.url
-             except Exception:
-                 pass # Fall through
-        if preview_image_url:
-             return preview_image_url + cache_bust
+        try:
+            ai_result = self.ai_result
+        except models.ObjectDoesNotExist:
+            ai_result = None
+        if ai_result and ai_result.generated:
+             return ai_result.generated.url + cache_bust
+
+        # 2. Check auto-generated preview_image. While a re-render is pending this is the
+        # previous preview; it is versioned by its render key so a new layout busts the cache.
+        if self.preview_image:
+             if self.preview_hash:
+                 return self.preview_image.url + f"?v={self.preview_hash[:12]}"
+             return self.preview_image.url + cache_bust
 
         # 3. Fallback to placeholder
         return placeholder
 
+class PreviewRenderJob(models.Model):
+    """
+    Queued preview render for one UserOutfit; there is at most one per outfit.
+    Saving an outfit re-queues it (see services.enqueue_preview_render), so
+    rapid successive saves collapse into a single render. The run_preview_worker
+    command claims jobs once they have been quiet for OUTFIT_PREVIEW_DEBOUNCE seconds.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    outfit = models.OneToOneField(UserOutfit, on_delete=models.CASCADE, related_name='preview_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True) # hostname:pid/thread that ran it last
+    requested_at = models.DateTimeField(default=timezone.now) # Latest save that asked for a render
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'requested_at'], name='preview_job_status_requested'),
+        ]
+
+    def __str__(self):
+        return f"Preview render for outfit {self.outfit_id} ({self.status})"
+
+
+class AIGenerationJob(models.Model):
+    """
+    Queued AI critique + image generation for one UserOutfit; there is at most one per
+    outfit. ai_generate_view only queues it, the run_ai_worker command runs it (up to
+    AI_WORKER_CONCURRENCY at a time) and stores the outcome in the outfit's OutfitAIResult.
+    The preview page polls ai_status until it is SUCCEEDED or FAILED.
+    """
+    STATUS_QUEUED = 'QUEUED'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_SUCCEEDED = 'SUCCEEDED'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    outfit = models.OneToOneField(UserOutfit, on_delete=models.CASCADE, related_name='ai_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True) # Shown to the user, like the old synchronous view's message
+    worker = models.CharField(max_length=100, blank=True) # hostname:pid/thread that ran it last
+    requested_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'requested_at'], name='ai_job_status_requested'),
+        ]
+
+    def __str__(self):
+        return f"AI generation for outfit {self.outfit_id} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in (self.STATUS_QUEUED, self.STATUS_RUNNING)
+
+
 class OutfitItem(models.Model):
     modified_at = models.DateTimeField(auto_now=True)  
     outfit = models.ForeignKey(UserOutfit, on_delete=models.CASCADE, related_name='items')
@@ -88,6 +173,31 @@ class OutfitAIResult(models.Model):
     generated  = models.ImageField(upload_to="ai_outfits/")
     critique   = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # ai_cache key of the request this result answers; blank for results from before the cache
+    content_key = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
         return f"AI result for outfit {self.outfit_id}"
+
+
+class AICritiqueCacheEntry(models.Model):
+    """
+    A stored Gemini critique + image, keyed by everything that was sent (see ai_cache.cache_key).
+    Lets an unchanged outfit, or an identical one, be answered without new API calls.
+    Entries expire after AI_CACHE_TTL and the least recently used go beyond AI_CACHE_MAX_ENTRIES.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    critique = models.TextField(blank=True)
+    generated = models.ImageField(upload_to="ai_cache/", blank=True)
+    created_at = models.DateTimeField(default=timezone.now) # TTL runs from here
+    last_used_at = models.DateTimeField(default=timezone.now)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'AI critique cache entries'
+        indexes = [
+            models.Index(fields=['last_used_at'], name='ai_cache_last_used'),
+        ]
+
+    def __str__(self):
+        return f"AI cache entry {self.key[:12]} ({self.hits} hits)"
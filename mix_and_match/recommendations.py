@@ -0,0 +1,95 @@
+# mix_and_match/recommendations.py
+import logging
+import random
+
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from marketplace.models import Product
+
+from .models import OutfitRecommendation
+
+logger = logging.getLogger(__name__)
+
+ID_RANGE_KEY = 'mix_and_match:recommendations:id_range'
+FILTER_OPTIONS_KEY = 'mix_and_match:recommendations:filter_options'
+ID_RANGE_TIMEOUT = 60 * 10 # Seconds; newer products are only probed once the range is refreshed
+FILTER_OPTIONS_TIMEOUT = 60 * 10
+OVERSAMPLE = 2 # Probes per missing product; probes landing in the same gap return the same row
+PROBE_ROUNDS = 3 # Further rounds only probe for what earlier rounds didn't find
+
+
+def _id_range():
+    """(min id, max id) of all products, cached; both None if there are none."""
+    id_range = cache.get(ID_RANGE_KEY)
+    if id_range is None:
+        bounds = Product.objects.aggregate(low=Min('id'), high=Max('id')) # Two primary key index lookups
+        id_range = (bounds['low'], bounds['high'])
+        cache.set(ID_RANGE_KEY, id_range, ID_RANGE_TIMEOUT)
+    return id_range
+
+
+def random_products(queryset, k):
+    """
+    About k random rows of a Product queryset, without ORDER BY RANDOM().
+    Each probe picks a random id in the table's id range and takes the first matching id
+    at or after it, an index range scan, so the cost grows with k rather than the table.
+    Each round of probes is one UNION ALL query (usually one round), then the picked rows
+    are fetched by id. Rows just
+    after large id gaps (deleted products) or after runs of non-matching rows are somewhat
+    more likely to be picked.
+    """
+    low, high = _id_range()
+    if low is None or k <= 0:
+        return []
+    ids = queryset.values_list('id', flat=True)
+    sampled = set()
+    for _ in range(PROBE_ROUNDS):
+        missing = k - len(sampled)
+        if missing <= 0:
+            break
+        probes = [
+            ids.filter(id__gte=random.randint(low, high)).order_by('id')[:1]
+            for _ in range(missing * OVERSAMPLE)
+        ]
+        sampled.update(probes[0].union(*probes[1:], all=True))
+    picked = random.sample(sorted(sampled), min(k, len(sampled)))
+    if len(picked) < k:
+        # Fewer matching rows than k (or very unlucky probes): take the rest in id order
+        picked += list(ids.exclude(id__in=sampled).order_by('id')[:k - len(picked)])
+    products = queryset.in_bulk(picked)
+    return [products[pk] for pk in picked if pk in products]
+
+
+def filter_options():
+    """(categories, conditions) present among public products, sorted; cached for FILTER_OPTIONS_TIMEOUT."""
+    options = cache.get(FILTER_OPTIONS_KEY)
+    if options is None:
+        public = Product.objects.filter(is_public=True).order_by()
+        options = (
+            sorted(value for value in public.values_list('category', flat=True).distinct() if value),
+            sorted(value for value in public.values_list('condition', flat=True).distinct() if value),
+        )
+        cache.set(FILTER_OPTIONS_KEY, options, FILTER_OPTIONS_TIMEOUT)
+    return options
+
+
+def personalized_products(user, queryset, k):
+    """
+    Up to k products of queryset from the user's precomputed recommendations (see recommender),
+    best first, topped up with random_products when there are fewer (or none computed yet).
+    queryset carries the page's filters; products sold or hidden since the last run drop out.
+    """
+    recommendation = OutfitRecommendation.objects.filter(user=user).order_by('-created_at').first()
+    products = []
+    if recommendation is not None:
+        # Through rows are written in rank order, so their ids order the ranking
+        through = OutfitRecommendation.recommended_items.through
+        ranked = list(
+            through.objects.filter(outfitrecommendation=recommendation).order_by('id').values_list('product_id', flat=True)
+        )
+        matching = queryset.in_bulk(ranked)
+        products = [matching[pk] for pk in ranked if pk in matching][:k]
+    if len(products) < k:
+        products += random_products(queryset.exclude(id__in=[p.id for p in products]), k - len(products))
+    return products
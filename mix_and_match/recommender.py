@@ -0,0 +1,243 @@
+# mix_and_match/recommender.py
+"""
+Batch item-item recommendations written to OutfitRecommendation (compute_recommendations command).
+Signals, weighted per user and product: purchases (OrderItem of paid orders), cart items, saved
+items and products used in the user's outfits. Two products are similar when the same users
+interact with both: cosine similarity of their user columns, computed with NumPy as X^T X over
+a vocabulary of the most interacted products, accumulated in user batches so memory stays at
+vocabulary^2 + batch * vocabulary floats. A user's score for a product is the similarity-weighted
+sum over the products they interacted with; the top N available products they haven't
+interacted with (and don't sell) are stored in rank order, so serving them is a single lookup.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max
+
+from cart.models import CartItem, SavedItem
+from marketplace.models import Product
+from orders.models import OrderItem
+
+from .models import OutfitItem, OutfitRecommendation, UserOutfit
+
+logger = logging.getLogger(__name__)
+
+# How strongly each signal ties a user to a product
+SIGNAL_WEIGHTS = {
+    'purchase': 5.0,
+    'cart': 3.0,
+    'saved': 2.0,
+    'outfit': 1.0,
+}
+PURCHASED_STATUSES = ('PAID', 'SHIPPED', 'DELIVERED')
+CRITERIA = "item-item co-occurrence (purchases, cart, saved, outfits)"
+
+
+def load_interactions():
+    """
+    (user ids, user rows, product ids, weights). user ids is a list of user primary keys
+    (uuid.UUID, see CustomUser); user rows, product ids and weights are parallel NumPy
+    arrays with one entry per signal occurrence, where user_ids[row] is the signal's user.
+    """
+    sources = [
+        ('purchase', OrderItem.objects.filter(
+            order__status__in=PURCHASED_STATUSES, order__buyer__isnull=False, product__isnull=False,
+        ).values_list('order__buyer_id', 'product_id')),
+        ('cart', CartItem.objects.values_list('cart__user_id', 'product_id')),
+        ('saved', SavedItem.objects.values_list('user_id', 'product_id')),
+        ('outfit', OutfitItem.objects.values_list('outfit__user_id', 'product_id')),
+    ]
+    row_of = {}
+    rows, products, weights = [], [], []
+    for signal, pairs in sources:
+        pairs = list(pairs)
+        rows.append(np.fromiter((row_of.setdefault(user_id, len(row_of)) for user_id, _ in pairs), dtype=np.int64, count=len(pairs)))
+        products.append(np.fromiter((product_id for _, product_id in pairs), dtype=np.int64, count=len(pairs)))
+        weights.append(np.full(len(pairs), SIGNAL_WEIGHTS[signal], dtype=np.float32))
+        logger.debug(f"Recommender: {len(pairs)} {signal} signals")
+    return list(row_of), np.concatenate(rows), np.concatenate(products), np.concatenate(weights)
+
+
+def last_activity_by_user():
+    """{user id: latest signal timestamp}, for picking the users an incremental run refreshes."""
+    latest = {}
+    sources = [
+        OrderItem.objects.filter(order__buyer__isnull=False).values('order__buyer_id').annotate(at=Max('order__updated_at')).values_list('order__buyer_id', 'at'),
+        CartItem.objects.values('cart__user_id').annotate(at=Max('added_at')).values_list('cart__user_id', 'at'),
+        SavedItem.objects.values('user_id').annotate(at=Max('saved_at')).values_list('user_id', 'at'),
+        UserOutfit.objects.values('user_id').annotate(at=Max('updated_at')).values_list('user_id', 'at'),
+    ]
+    for rows in sources:
+        for user_id, at in rows:
+            if at and (user_id not in latest or at > latest[user_id]):
+                latest[user_id] = at
+    return latest
+
+
+def stale_user_ids():
+    """Users with activity since their stored recommendations were computed (or with none stored)."""
+    computed = dict(
+        OutfitRecommendation.objects.values('user_id').annotate(at=Max('created_at')).values_list('user_id', 'at')
+    )
+    return {
+        user_id for user_id, at in last_activity_by_user().items()
+        if user_id not in computed or at > computed[user_id]
+    }
+
+
+class ItemSimilarity:
+    """
+    Cosine item-item similarity over the max_items products with the most distinct users.
+    Takes load_interactions() output; user ids stay UUIDs, rows are their positions.
+    """
+
+    def __init__(self, user_ids, user_rows, product_ids, weights, max_items, batch_size):
+        # Sum repeated (user, product) signals, then dampen: three carts shouldn't outweigh a purchase tenfold
+        pair_products, product_inverse = np.unique(product_ids, return_inverse=True)
+        keys = user_rows * len(pair_products) + product_inverse
+        keys, key_inverse = np.unique(keys, return_inverse=True)
+        values = np.log1p(np.bincount(key_inverse, weights=weights)).astype(np.float32)
+        rows, cols = np.divmod(keys, len(pair_products))
+
+        # Vocabulary: the products the most users interacted with; the similarity matrix is vocabulary^2
+        users_per_product = np.bincount(cols, minlength=len(pair_products))
+        vocab = np.sort(np.argsort(-users_per_product, kind='stable')[:max_items])
+        column = np.full(len(pair_products), -1, dtype=np.int64)
+        column[vocab] = np.arange(len(vocab))
+
+        self.user_ids = user_ids # Row index -> user id
+        self.product_ids = pair_products[vocab] # Column index -> product id
+        self.rows, self.cols, self.values = rows, column[cols], values # COO entries, cols -1 outside the vocabulary
+        self.batch_size = batch_size
+
+        n = len(vocab)
+        cooccurrence = np.zeros((n, n), dtype=np.float32)
+        for batch in self._user_batches():
+            dense = self._dense(batch)
+            cooccurrence += dense.T @ dense
+        norms = np.sqrt(np.diag(cooccurrence))
+        norms[norms == 0] = 1.0
+        self.similarity = cooccurrence / norms[:, None] / norms[None, :]
+        np.fill_diagonal(self.similarity, 0.0)
+
+    def _user_batches(self, user_rows=None):
+        if user_rows is None:
+            user_rows = np.arange(len(self.user_ids))
+        for start in range(0, len(user_rows), self.batch_size):
+            yield user_rows[start:start + self.batch_size]
+
+    def _dense(self, batch):
+        """Dense (len(batch), vocabulary) signal matrix for the given user rows."""
+        position = np.full(len(self.user_ids), -1, dtype=np.int64)
+        position[batch] = np.arange(len(batch))
+        keep = (position[self.rows] >= 0) & (self.cols >= 0)
+        dense = np.zeros((len(batch), len(self.product_ids)), dtype=np.float32)
+        dense[position[self.rows[keep]], self.cols[keep]] = self.values[keep]
+        return dense
+
+    def top_n(self, user_ids, n, excluded, candidates):
+        """
+        Yields (user id, [product ids best first]) for the given users.
+        excluded: {user id: set of product ids} never recommended to that user.
+        candidates: boolean mask over the vocabulary of currently recommendable products.
+        """
+        row_of = {user_id: row for row, user_id in enumerate(self.user_ids)}
+        user_rows = np.array([row_of[user_id] for user_id in user_ids if user_id in row_of], dtype=np.int64)
+        column_of = {product_id: col for col, product_id in enumerate(self.product_ids)}
+        for batch in self._user_batches(user_rows):
+            scores = self._dense(batch) @ self.similarity
+            scores[:, ~candidates] = 0.0
+            for i, row in enumerate(batch):
+                user_id = self.user_ids[row]
+                user_scores = scores[i]
+                for product_id in excluded.get(user_id, ()):
+                    col = column_of.get(product_id)
+                    if col is not None:
+                        user_scores[col] = 0.0
+                k = min(n, np.count_nonzero(user_scores > 0))
+                if not k:
+                    yield user_id, []
+                    continue
+                best = np.argpartition(-user_scores, k - 1)[:k]
+                best = best[np.argsort(-user_scores[best], kind='stable')]
+                yield user_id, [int(self.product_ids[col]) for col in best]
+
+
+def _excluded_products(user_ids, user_rows, product_ids, candidate_users):
+    """{user id: products they interacted with or sell} for the users being refreshed."""
+    excluded = {}
+    for row, product_id in zip(user_rows.tolist(), product_ids.tolist()):
+        if user_ids[row] in candidate_users:
+            excluded.setdefault(user_ids[row], set()).add(product_id)
+    for seller_id, product_id in Product.objects.filter(seller_id__in=candidate_users).values_list('seller_id', 'id'):
+        excluded.setdefault(seller_id, set()).add(product_id)
+    return excluded
+
+
+def save_recommendations(user_id, product_ids):
+    """
+    Replaces the user's OutfitRecommendation; the M2M rows are inserted in rank order.
+    Written even when empty: its created_at tells incremental runs the user is up to date.
+    """
+    through = OutfitRecommendation.recommended_items.through
+    with transaction.atomic():
+        OutfitRecommendation.objects.filter(user_id=user_id).delete()
+        recommendation = OutfitRecommendation.objects.create(user_id=user_id, criteria=CRITERIA)
+        through.objects.bulk_create([
+            through(outfitrecommendation_id=recommendation.id, product_id=product_id) for product_id in product_ids
+        ])
+
+
+def compute_recommendations(user_ids=None, top_n=None, max_items=None, batch_size=1024):
+    """
+    Recomputes stored recommendations for user_ids, an iterable of user primary keys (UUIDs;
+    default: every user with signals). Ids of users that don't exist are skipped.
+    Returns a summary dict for the management command.
+    """
+    top_n = top_n or settings.RECOMMENDATIONS_TOP_N
+    max_items = max_items or settings.RECOMMENDATIONS_MAX_ITEMS
+    started = time.perf_counter()
+
+    signal_user_ids, signal_rows, signal_products, weights = load_interactions()
+    if not len(signal_rows):
+        return {'users': 0, 'with_recommendations': 0, 'vocabulary': 0, 'signals': 0, 'fit_seconds': 0.0, 'seconds': 0.0}
+    model = ItemSimilarity(signal_user_ids, signal_rows, signal_products, weights, max_items, batch_size)
+    fitted = time.perf_counter()
+
+    if user_ids is None:
+        targets = set(model.user_ids)
+    else:
+        targets = set(get_user_model().objects.filter(pk__in=list(user_ids)).values_list('pk', flat=True))
+    available = set(Product.objects.filter(
+        id__in=model.product_ids.tolist(), is_public=True, is_sold=False, quantity__gt=0,
+    ).values_list('id', flat=True))
+    candidates = np.isin(model.product_ids, list(available))
+    excluded = _excluded_products(signal_user_ids, signal_rows, signal_products, targets)
+
+    written = with_items = 0
+    for user_id, product_ids in model.top_n(sorted(targets), top_n, excluded, candidates):
+        save_recommendations(user_id, product_ids)
+        written += 1
+        with_items += bool(product_ids)
+    # Targets without signals (e.g. only unpaid orders) get an empty entry, so nothing stale is served
+    for user_id in targets - set(model.user_ids):
+        save_recommendations(user_id, [])
+        written += 1
+
+    summary = {
+        'users': written,
+        'with_recommendations': with_items,
+        'vocabulary': len(model.product_ids),
+        'signals': len(signal_rows),
+        'fit_seconds': fitted - started,
+        'seconds': time.perf_counter() - started,
+    }
+    logger.info(
+        f"Recommendations: {written} users ({with_items} with items), vocabulary {summary['vocabulary']}, "
+        f"{summary['signals']} signals in {summary['seconds']:.2f}s"
+    )
+    return summary
@@ -0,0 +1,132 @@
+# mix_and_match/render_cache.py
+"""
+Disk cache of outfit renders served by the render_outfit endpoint (and downloads).
+Files are named by render key (image_generator.render_key), which already covers
+layout, size, profile and format, so an entry never goes stale; it just stops being
+requested. Entries are evicted least-recently-served first once the directory grows
+past OUTFIT_RENDER_CACHE_MAX_BYTES. Hits bump the file's atime explicitly (mount
+options like noatime don't matter), and its mtime stays the time it was rendered.
+Entries are handed out as open files, so an eviction (from any process) between the
+lookup and the response can't pull a file from under a request.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .image_generator import EXTENSIONS, generate_outfit_image
+
+logger = logging.getLogger(__name__)
+
+EVICT_INTERVAL = 60 # Seconds between directory scans per process
+
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+
+def cache_path(key, fmt):
+    # Two-level fan-out keeps directories small
+    return os.path.join(settings.OUTFIT_RENDER_CACHE_DIR, key[:2], f"{key}.{EXTENSIONS[fmt]}")
+
+
+def get(key, fmt):
+    """(open binary file, rendered_at mtime) of a cached render, or None. The caller closes the file."""
+    path = cache_path(key, fmt)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    mtime = os.fstat(f.fileno()).st_mtime
+    try:
+        os.utime(path, (time.time(), mtime)) # Served now; keep the render time
+    except FileNotFoundError:
+        pass # Evicted since it was opened; the open file still reads fine
+    return f, mtime
+
+
+def put(key, fmt, data):
+    """Writes a render atomically (concurrent writers of one key are harmless) and returns its mtime."""
+    path = cache_path(key, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            mtime = os.fstat(f.fileno()).st_mtime
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    maybe_evict()
+    return mtime
+
+
+def get_or_render(outfit, layers, key, profile, fmt, size):
+    """
+    (open binary file, rendered_at mtime) for a render, rendering and caching it on a miss;
+    None if rendering failed. The caller closes the file (FileResponse does).
+    """
+    cached = get(key, fmt)
+    if cached:
+        return cached
+    output = generate_outfit_image(outfit, layers=layers, profile=profile, fmt=fmt, size=size)
+    if output is None:
+        return None
+    mtime = put(key, fmt, output.getbuffer())
+    cached = get(key, fmt)
+    if cached:
+        return cached
+    # Evicted before it could be reopened: serve this render from memory
+    output.seek(0)
+    return output, mtime
+
+
+def maybe_evict():
+    """Runs evict() at most once per EVICT_INTERVAL in this process."""
+    global _last_evict
+    now = time.monotonic()
+    if now - _last_evict < EVICT_INTERVAL or not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        _last_evict = now
+        evict()
+    finally:
+        _evict_lock.release()
+
+
+def evict(max_bytes=None):
+    """Deletes least recently served renders until the cache fits max_bytes. Returns (files, bytes) removed."""
+    if max_bytes is None:
+        max_bytes = settings.OUTFIT_RENDER_CACHE_MAX_BYTES
+    entries = []
+    total = 0
+    for root, _, files in os.walk(settings.OUTFIT_RENDER_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue # Evicted by another process meanwhile
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0, 0
+
+    removed_files = removed_bytes = 0
+    entries.sort()
+    for _, nbytes, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= nbytes
+        removed_files += 1
+        removed_bytes += nbytes
+    logger.info(f"Outfit render cache: evicted {removed_files} file(s), {removed_bytes / 1048576:.1f} MB")
+    return removed_files, removed_bytes
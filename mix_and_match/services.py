@@ -0,0 +1,256 @@
+# mix_and_match/services.py
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from . import ai_cache
+from .gemini_client import generate_outfit_image_with_critique, outfit_prompt_details
+from .image_generator import outfit_layers
+from .models import AIGenerationJob, OutfitAIResult, PreviewRenderJob
+from .utils import update_outfit_preview_image
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_preview_render(outfit_id):
+    """
+    Queues (or re-queues) the preview render for an outfit; call it via transaction.on_commit
+    so the worker never sees uncommitted items. Each call moves requested_at forward, and a
+    job is only claimed once requested_at is OUTFIT_PREVIEW_DEBOUNCE seconds old, so a burst
+    of saves ends in one render. A job RUNNING when this is called is set back to PENDING,
+    which makes the worker's finish a no-op and the outfit is rendered again.
+    """
+    job, created = PreviewRenderJob.objects.update_or_create(
+        outfit_id=outfit_id,
+        defaults={
+            'status': PreviewRenderJob.STATUS_PENDING,
+            'requested_at': timezone.now(),
+            'attempts': 0,
+            'error': '',
+        },
+    )
+    logger.info(f"{'Queued' if created else 'Re-queued'} preview render job {job.id} for outfit {outfit_id}")
+    return job
+
+
+def worker_name():
+    # Same format as image_scanning.services.worker_name; not imported from there so
+    # web processes enqueueing renders don't load rembg/onnxruntime
+    return f"{socket.gethostname()}:{os.getpid()}/{threading.current_thread().name}"[:100]
+
+
+def claim_next_preview_job():
+    """
+    Atomically moves the oldest PENDING job whose last request is older than the
+    debounce window to RUNNING and returns it (or None). SKIP LOCKED as in
+    image_scanning.services.claim_next_job.
+    """
+    quiet_since = timezone.now() - timedelta(seconds=settings.OUTFIT_PREVIEW_DEBOUNCE)
+    with transaction.atomic():
+        job = (
+            PreviewRenderJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=PreviewRenderJob.STATUS_PENDING, requested_at__lte=quiet_since)
+            .order_by('requested_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = PreviewRenderJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.worker = worker_name()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'worker'])
+    return job
+
+
+def _finish_preview_job(job, status, error=''):
+    job.finished_at = timezone.now()
+    # Only if nobody re-queued it meanwhile: a newer request keeps the job PENDING for another render
+    return PreviewRenderJob.objects.filter(
+        pk=job.pk, status=PreviewRenderJob.STATUS_RUNNING, requested_at=job.requested_at,
+    ).update(status=status, error=error, finished_at=job.finished_at)
+
+
+def run_preview_job(job):
+    """Renders a claimed job's outfit preview and records DONE or FAILED. Returns True on success."""
+    if not update_outfit_preview_image(job.outfit):
+        # update_outfit_preview_image has logged the cause
+        _finish_preview_job(job, PreviewRenderJob.STATUS_FAILED, "Preview could not be generated.")
+        return False
+
+    if _finish_preview_job(job, PreviewRenderJob.STATUS_DONE):
+        logger.info(f"Preview render job {job.id} done in {(job.finished_at - job.started_at).total_seconds():.2f}s")
+    else:
+        logger.info(f"Outfit {job.outfit_id} changed during preview render job {job.id}; it will render again")
+    return True
+
+
+def requeue_stale_preview_jobs():
+    """
+    Returns RUNNING jobs whose worker died (started longer than IMAGE_JOB_STALE_AFTER
+    ago) to PENDING, or marks them FAILED once they used up IMAGE_JOB_MAX_ATTEMPTS.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_STALE_AFTER)
+    stale = PreviewRenderJob.objects.filter(status=PreviewRenderJob.STATUS_RUNNING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.IMAGE_JOB_MAX_ATTEMPTS).update(
+        status=PreviewRenderJob.STATUS_FAILED,
+        error="Worker stopped responding too many times.",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=PreviewRenderJob.STATUS_PENDING)
+    if failed or requeued:
+        logger.warning(f"Stale preview render jobs: {requeued} re-queued, {failed} failed")
+    return requeued, failed
+
+
+def enqueue_ai_generation(outfit_id):
+    """
+    Queues AI generation for an outfit and returns (job, queued). A job that is already
+    QUEUED or RUNNING is left alone (queued is False), so repeated clicks cost one generation.
+    """
+    with transaction.atomic():
+        job, created = AIGenerationJob.objects.select_for_update().get_or_create(outfit_id=outfit_id)
+        if not created:
+            if job.is_active:
+                return job, False
+            job.status = AIGenerationJob.STATUS_QUEUED
+            job.requested_at = timezone.now()
+            job.attempts = 0
+            job.error = ''
+            job.started_at = job.finished_at = None
+            job.save()
+    logger.info(f"Queued AI generation job {job.id} for outfit {outfit_id}")
+    return job, True
+
+
+def claim_next_ai_job():
+    """Atomically moves the oldest QUEUED AI job to RUNNING and returns it (or None)."""
+    with transaction.atomic():
+        job = (
+            AIGenerationJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=AIGenerationJob.STATUS_QUEUED)
+            .order_by('requested_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = AIGenerationJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.worker = worker_name()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'worker'])
+    return job
+
+
+def _finish_ai_job(job, status, error=''):
+    job.finished_at = timezone.now()
+    # No-op if the outfit (and with it the job) was deleted meanwhile
+    return AIGenerationJob.objects.filter(pk=job.pk, status=AIGenerationJob.STATUS_RUNNING).update(
+        status=status, error=error, finished_at=job.finished_at,
+    )
+
+
+def save_ai_result(outfit, image_bytes, critique, content_key=''):
+    """
+    Stores a generation (PNG bytes or None, critique) in the outfit's OutfitAIResult,
+    replacing (and deleting) the previous image.
+    """
+    previous_image = OutfitAIResult.objects.filter(outfit=outfit).values_list('generated', flat=True).first()
+    ai_result, created = OutfitAIResult.objects.update_or_create(
+        outfit=outfit,
+        defaults={
+            'critique': critique or "Critique not generated.",
+            'content_key': content_key,
+            # Clear old image before saving new one if update_or_create updates
+            'generated': None
+        }
+    )
+    # Save the new image if generated
+    if image_bytes:
+        ai_result.generated.save(f"ai_outfit_{outfit.id}.png", ContentFile(image_bytes), save=True)
+        logger.info(f"Saved generated AI image for Outfit {outfit.id}")
+    # The row no longer points at the previous image; remove its file
+    if previous_image and previous_image != ai_result.generated.name:
+        ai_result.generated.storage.delete(previous_image)
+    return ai_result
+
+
+def ai_request(outfit):
+    """(layers, prompt details, ai_cache key) of the Gemini request the outfit would make now."""
+    layers = outfit_layers(outfit)
+    details = outfit_prompt_details(outfit, layers)
+    return layers, details, ai_cache.cache_key(layers, *details)
+
+
+def serve_cached_ai_result(outfit, key):
+    """
+    Answers an AI generation request from ai_cache if possible; returns True if it did.
+    When the outfit's current OutfitAIResult already answers this request it is kept as is.
+    """
+    entry = ai_cache.lookup(key)
+    if entry is None:
+        return False
+    if OutfitAIResult.objects.filter(outfit=outfit, content_key=key).exists():
+        return True
+    image_bytes = None
+    if entry.generated:
+        with entry.generated.open('rb') as f:
+            image_bytes = f.read()
+    save_ai_result(outfit, image_bytes, entry.critique, content_key=key)
+    return True
+
+
+def run_ai_job(job):
+    """Runs a claimed job's critique and image generation and records SUCCEEDED or FAILED. Returns True on success."""
+    try:
+        layers, details, key = ai_request(job.outfit)
+        # An identical request may have been answered since this job was queued
+        if not serve_cached_ai_result(job.outfit, key):
+            ai_cache.record_miss()
+            generated_image, critique, error_message = generate_outfit_image_with_critique(job.outfit, layers, details)
+            if error_message:
+                _finish_ai_job(job, AIGenerationJob.STATUS_FAILED, error_message)
+                return False
+            if not (critique or generated_image):
+                _finish_ai_job(job, AIGenerationJob.STATUS_FAILED, "AI generation completed but returned no image or critique.")
+                return False
+            image_bytes = None
+            if generated_image:
+                img_buffer = BytesIO()
+                generated_image.save(img_buffer, format='PNG')
+                image_bytes = img_buffer.getvalue()
+            ai_cache.store(key, critique, image_bytes)
+            save_ai_result(job.outfit, image_bytes, critique, content_key=key)
+    except Exception as e:
+        logger.error(f"AI generation job {job.id} for Outfit {job.outfit_id} failed: {e}", exc_info=True)
+        _finish_ai_job(job, AIGenerationJob.STATUS_FAILED, "AI generated results but failed to save them.")
+        return False
+
+    _finish_ai_job(job, AIGenerationJob.STATUS_SUCCEEDED)
+    logger.info(f"AI generation job {job.id} succeeded in {(job.finished_at - job.started_at).total_seconds():.2f}s")
+    return True
+
+
+def requeue_stale_ai_jobs():
+    """Same as requeue_stale_preview_jobs, for AI generation jobs (cutoff AI_JOB_STALE_AFTER)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_JOB_STALE_AFTER)
+    stale = AIGenerationJob.objects.filter(status=AIGenerationJob.STATUS_RUNNING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.IMAGE_JOB_MAX_ATTEMPTS).update(
+        status=AIGenerationJob.STATUS_FAILED,
+        error="AI generation was interrupted. Please try again.",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=AIGenerationJob.STATUS_QUEUED)
+    if failed or requeued:
+        logger.warning(f"Stale AI generation jobs: {requeued} re-queued, {failed} failed")
+    return requeued, failed
@@ -0,0 +1,26 @@
+# mix_and_match/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import AICritiqueCacheEntry, UserOutfit, OutfitAIResult
+from .utils import release_preview_file
+
+
+@receiver(post_delete, sender=UserOutfit)
+def outfit_deleted(sender, instance, **kwargs):
+    """Previews are shared by identical layouts; the file goes once no outfit uses it."""
+    release_preview_file(instance.preview_image.name)
+
+
+@receiver(post_delete, sender=OutfitAIResult)
+def ai_result_deleted(sender, instance, **kwargs):
+    """The generated image belongs to this row alone."""
+    if instance.generated:
+        instance.generated.delete(save=False)
+
+
+@receiver(post_delete, sender=AICritiqueCacheEntry)
+def ai_cache_entry_deleted(sender, instance, **kwargs):
+    """Results served from the entry hold their own copy of the image."""
+    if instance.generated:
+        instance.generated.delete(save=False)
@@ -1,3 +1,88 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from . import gemini_client
+from .gemini_client import StubBackend, critique_and_generate, generate_outfit_image_with_critique, run_on_ai_loop
+
+DETAILS = ("person wearing the outfit.", "Shirt - No description")
+
+
+def composite_png():
+    buffer = BytesIO()
+    Image.new('RGB', (500, 500), 'white').save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+@override_settings(GEMINI_BACKEND='stub', GEMINI_CRITIQUE_TIMEOUT=5, GEMINI_IMAGE_TIMEOUT=5)
+@mock.patch.object(StubBackend, 'critique_delay', 0.2)
+@mock.patch.object(StubBackend, 'image_delay', 0.3)
+class GeminiClientTests(SimpleTestCase):
+
+    def setUp(self):
+        # get_backend() caches per process; start from the stub selected above
+        patcher = mock.patch.object(gemini_client, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stub_backend_selected(self):
+        self.assertIsInstance(gemini_client.get_backend(), StubBackend)
+
+    def test_critique_and_image_run_concurrently(self):
+        started = time.perf_counter()
+        image, critique, critique_error, image_error = run_on_ai_loop(critique_and_generate(
+            gemini_client.get_backend(), 1, Image.new('RGB', (500, 500)), *DETAILS,
+        ))
+        elapsed = time.perf_counter() - started
+        self.assertIsNotNone(image)
+        self.assertTrue(critique)
+        self.assertIsNone(critique_error)
+        self.assertIsNone(image_error)
+        # Sequential calls would take 0.5s; concurrent ones about the slower (0.3s)
+        self.assertLess(elapsed, 0.45)
+
+    @override_settings(GEMINI_CRITIQUE_TIMEOUT=0.05)
+    def test_timeout_becomes_error_message(self):
+        outfit = SimpleNamespace(id=1)
+        with mock.patch.object(gemini_client, 'generate_outfit_image', return_value=composite_png()):
+            image, critique, error = generate_outfit_image_with_critique(outfit, layers=[], details=DETAILS)
+        self.assertIsNotNone(image)
+        self.assertIsNone(critique)
+        self.assertEqual(error, "Critique generation timed out.")
+
+    @override_settings(GEMINI_CRITIQUE_TIMEOUT=0.05, GEMINI_IMAGE_TIMEOUT=0.05)
+    def test_both_timeouts_reported(self):
+        outfit = SimpleNamespace(id=1)
+        with mock.patch.object(gemini_client, 'generate_outfit_image', return_value=composite_png()):
+            image, critique, error = generate_outfit_image_with_critique(outfit, layers=[], details=DETAILS)
+        self.assertIsNone(image)
+        self.assertIsNone(critique)
+        self.assertEqual(error, "Critique generation timed out. | Image generation timed out.")
+
+    def test_threads_share_one_loop(self):
+        async def running_loop():
+            return asyncio.get_running_loop(), threading.current_thread().name
+
+        results, backends = [], []
+
+        def call():
+            backends.append(gemini_client.get_backend())
+            results.append(run_on_ai_loop(running_loop()))
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual({id(loop) for loop, _ in results}, {id(gemini_client._get_loop())})
+        self.assertEqual({name for _, name in results}, {'gemini-loop'})
+        self.assertEqual(len({id(backend) for backend in backends}), 1)
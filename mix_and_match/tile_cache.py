@@ -0,0 +1,154 @@
+# mix_and_match/tile_cache.py
+"""
+Process-wide LRU cache of decoded product images for outfit compositing.
+Popular products appear in many outfits, and every save, download and AI
+request re-renders, so decoded RGBA images (and their resized tiles) are kept
+in memory keyed by (image path, mtime, target width, filter). The mtime in the key
+means an edited image file is never served stale.
+The cache is bounded by pixel bytes (OUTFIT_TILE_CACHE_MAX_BYTES).
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from PIL import Image
+from PIL.Image import Resampling
+
+logger = logging.getLogger(__name__)
+
+SOURCE = None # Target width used in keys for the decoded, un-resized image
+
+
+def _image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class TileCache:
+    """Thread-safe LRU of PIL images, bounded by the total size of their pixel data."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (image, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, image):
+        nbytes = _image_bytes(image)
+        if nbytes > self.max_bytes:
+            return # Larger than the whole cache; don't flush everything for it
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (image, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+tile_cache = TileCache(settings.OUTFIT_TILE_CACHE_MAX_BYTES)
+
+
+def _decode(image_field):
+    with image_field.open('rb') as f:
+        image = Image.open(f)
+        return image.convert("RGBA") # convert() loads the pixels before the file closes
+
+
+def _cache_identity(image_field):
+    """(path, mtime_ns) for files on local storage, or None when the storage has no paths."""
+    try:
+        path = image_field.path
+    except NotImplementedError:
+        return None
+    return path, os.stat(path).st_mtime_ns # Raises FileNotFoundError for missing files
+
+
+def get_source(image_field):
+    """Decoded RGBA image for an ImageField file, cached."""
+    identity = _cache_identity(image_field)
+    if identity is None:
+        return _decode(image_field)
+    key = (*identity, SOURCE)
+    image = tile_cache.get(key)
+    if image is None:
+        image = _decode(image_field)
+        tile_cache.put(key, image)
+    return image
+
+
+def _resize(source, size, resample, reduce):
+    if reduce:
+        # Integer box-downscale first (cheap), so the filter only covers the last <2x step
+        factor = min(source.width // size[0], source.height // size[1])
+        if factor >= 2:
+            source = source.reduce(factor)
+    return source.resize(size, resample)
+
+
+def get_tile(image_field, target_width, resample=Resampling.LANCZOS, reduce=False):
+    """
+    RGBA tile of the image resized to target_width (height keeps the aspect ratio,
+    both at least 1px), cached. reduce=True box-reduces by the largest integer factor
+    before resampling (draft quality). Callers must not modify the returned image.
+    """
+    identity = _cache_identity(image_field)
+    key = (*identity, target_width, resample, reduce) if identity else None
+    if key is not None:
+        tile = tile_cache.get(key)
+        if tile is not None:
+            return tile
+
+    source = get_source(image_field)
+    if source.width <= 0 or source.height <= 0:
+        raise ValueError(f"Image has zero/negative dimensions: {source.size}")
+    target_height = max(1, int(target_width * source.height / source.width))
+    tile = _resize(source, (max(1, target_width), target_height), resample, reduce)
+    if key is not None:
+        tile_cache.put(key, tile)
+    return tile
+
+
+def log_stats(context):
+    stats = tile_cache.stats()
+    logger.info(
+        f"Outfit tile cache after {context}: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%}), {stats['entries']} entries, "
+        f"{stats['bytes'] / 1048576:.1f}/{stats['max_bytes'] / 1048576:.0f} MB, {stats['evictions']} evictions"
+    )
+    return stats
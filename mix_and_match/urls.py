@@ -2,8 +2,8 @@
 from django.urls import path
 # Import the views needed
 from .views import (
-    create_outfit, preview_outfit, recommendations,
-    download_outfit, edit_outfit, ai_generate_view, delete_outfit, toggle_outfit_privacy, public_outfit_preview
+    create_outfit, palette_items, preview_outfit, recommendations,
+    download_outfit, render_outfit, edit_outfit, ai_generate_view, ai_status, delete_outfit, toggle_outfit_privacy, public_outfit_preview
 )
 # Removed uuid import as default ID is likely integer
 
@@ -11,12 +11,15 @@ app_name = 'mix_and_match'
 
 urlpatterns = [
     path('create/', create_outfit, name='create_outfit'),
+    path('palette/', palette_items, name='palette_items'),
     # --- Use int path converter for default IDs ---
     path('edit/<int:outfit_id>/', edit_outfit, name='edit_outfit'),
     path('preview/<int:outfit_id>/', preview_outfit, name='preview_outfit'),
     path('download/<int:outfit_id>/', download_outfit, name='download_outfit'),
+    path('outfit/<int:outfit_id>/render/', render_outfit, name='render_outfit'),
     path('recommendations/', recommendations, name='recommendations'),
     path('outfit/<int:outfit_id>/generate-ai/', ai_generate_view, name='ai_generate'),
+    path('outfit/<int:outfit_id>/ai-status/', ai_status, name='ai_status'),
     path('outfit/<int:outfit_id>/delete/', delete_outfit, name='delete_outfit'),
     path('outfit/<int:outfit_id>/toggle-privacy/', toggle_outfit_privacy, name='toggle_outfit_privacy'),
     path('outfit/<int:outfit_id>/view/', public_outfit_preview, name='public_outfit_preview'),
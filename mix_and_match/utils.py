@@ -1,20 +1,68 @@
 # mix_and_match/utils.py
 
 import logging
-from io import BytesIO
+from django.conf import settings
 from django.core.files.base import ContentFile
-from .image_generator import generate_outfit_image
+from django.db import connection, transaction
+from django.utils import timezone
+from .image_generator import EXTENSIONS, generate_outfit_image, outfit_layers, output_format, render_key
 # Import UserOutfit model within the function or at top if no circular dependency risk
 # from .models import UserOutfit # Might cause issues if models.py imports utils
 
 logger = logging.getLogger(__name__)
 
-def update_outfit_preview_image(outfit):
+PREVIEW_DIR = 'outfit_previews'
+
+
+def preview_name(render_key, fmt):
+    """Storage name of the preview for a render key; shared by every outfit with that layout."""
+    return f"{PREVIEW_DIR}/{render_key}.{EXTENSIONS[fmt]}"
+
+
+def lock_preview_file(name):
+    """
+    Transaction-scoped advisory lock on a preview name. Held while checking whether the
+    file exists or is used and acting on it, so a worker about to point an outfit at an
+    existing file and one deleting it as unused can't interleave. Call inside atomic().
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [name])
+
+
+def release_preview_file(name, exclude_outfit_id=None):
+    """
+    Deletes a preview file once no outfit (other than exclude_outfit_id) points at it.
+    Content-addressed previews are shared, so callers must not delete them directly.
+    """
+    from .models import UserOutfit
+    if not name:
+        return False
+    storage = UserOutfit._meta.get_field('preview_image').storage
+    with transaction.atomic():
+        lock_preview_file(name)
+        still_used = UserOutfit.objects.filter(preview_image=name).exclude(pk=exclude_outfit_id).exists()
+        if still_used:
+            return False
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Could not delete unused outfit preview {name}: {e}")
+            return False
+    logger.info(f"Deleted unused outfit preview {name}")
+    return True
+
+
+def update_outfit_preview_image(outfit, force=False):
     """
     Generates the 2D composite preview image for an outfit and saves it
     to the preview_image field.
+    Previews are stored under their render key (see image_generator.render_key):
+    an outfit whose layout is unchanged is not re-rendered, and a layout already
+    rendered for any outfit reuses that file. force=True re-renders and overwrites it.
+    Rendered with OUTFIT_PREVIEW_PROFILE, encoded as OUTFIT_PREVIEW_FORMAT.
     Args:
         outfit (UserOutfit): The UserOutfit instance to update.
+        force (bool): Render even if a file for the layout exists.
     Returns:
         bool: True if the image was successfully generated and saved, False otherwise.
     """
@@ -24,26 +72,57 @@ def update_outfit_preview_image(outfit):
 
     logger.info(f"Attempting to generate 2D preview for Outfit ID: {outfit.id}")
     try:
-        # Generate the image using the existing function
-        image_buffer = generate_outfit_image(outfit)
-
-        if image_buffer:
-            # Create a Django ContentFile
-            file_name = f"outfit_preview_{outfit.id}.png"
-            content_file = ContentFile(image_buffer.getvalue(), name=file_name)
-
-            # Save the file to the preview_image field
-            # Using save=False first to avoid recursive calls if signals are involved later
-            outfit.preview_image.save(file_name, content_file, save=False)
-            # Now explicitly save the outfit instance with the updated field
-            outfit.save(update_fields=['preview_image', 'updated_at'])
-
-            logger.info(f"Successfully generated and saved preview for Outfit ID: {outfit.id}")
-            return True
-        else:
-            logger.warning(f"generate_outfit_image returned None for Outfit ID: {outfit.id}. Cannot save preview.")
-            return False
+        # Taken before rendering: changes committed while it runs must still count as newer
+        render_started_at = timezone.now()
+        profile = settings.OUTFIT_PREVIEW_PROFILE
+        fmt = output_format(profile, settings.OUTFIT_PREVIEW_FORMAT)
+        layers = outfit_layers(outfit)
+        key = render_key(layers, profile, fmt)
+        file_name = preview_name(key, fmt)
+        storage = outfit.preview_image.storage
+        previous_name = outfit.preview_image.name
+
+        image_buffer = None
+        if force or not storage.exists(file_name):
+            # Rendered before taking the lock, so workers with other layouts aren't held up
+            image_buffer = generate_outfit_image(outfit, layers=layers, profile=profile, fmt=fmt)
+            if not image_buffer:
+                logger.warning(f"generate_outfit_image returned None for Outfit ID: {outfit.id}. Cannot save preview.")
+                return False
+
+        with transaction.atomic():
+            # Until this commits, release_preview_file can't delete the file the row is about to point at
+            lock_preview_file(file_name)
+            if force or not storage.exists(file_name):
+                if image_buffer is None:
+                    # Released as unused since the check above; render it after all
+                    image_buffer = generate_outfit_image(outfit, layers=layers, profile=profile, fmt=fmt)
+                    if not image_buffer:
+                        logger.warning(f"generate_outfit_image returned None for Outfit ID: {outfit.id}. Cannot save preview.")
+                        return False
+                if force:
+                    storage.delete(file_name)
+                saved_name = storage.save(file_name, ContentFile(image_buffer.getvalue()))
+                if saved_name != file_name:
+                    # Another worker wrote the same layout first; its file is identical, keep that one
+                    storage.delete(saved_name)
+                logger.info(f"Rendered preview {file_name} for Outfit ID: {outfit.id}")
+            elif key == outfit.preview_hash and previous_name == file_name:
+                logger.info(f"Preview for Outfit ID {outfit.id} is unchanged; skipped rendering.")
+            else:
+                logger.info(f"Reusing existing preview {file_name} for Outfit ID: {outfit.id}")
+
+            outfit.preview_image.name = file_name
+            outfit.preview_hash = key
+            outfit.preview_generated_at = render_started_at
+            # updated_at is left alone: a re-render is not a change the user made
+            outfit.save(update_fields=['preview_image', 'preview_hash', 'preview_generated_at'])
+
+        if previous_name and previous_name != file_name:
+            release_preview_file(previous_name, exclude_outfit_id=outfit.id)
+        logger.info(f"Successfully generated and saved preview for Outfit ID: {outfit.id}")
+        return True
 
     except Exception as e:
         logger.error(f"Error generating or saving preview image for Outfit ID {outfit.id}: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
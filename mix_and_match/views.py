@@ -2,25 +2,31 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 import json
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponseBadRequest, HttpResponseServerError, JsonResponse
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, urlencode
 from .models import UserOutfit, OutfitItem
 from marketplace.models import Product, ProductImage 
-from .image_generator import generate_outfit_image
+from marketplace.pagination import InvalidCursor, KeysetPaginator
+from .image_generator import (
+    EXTENSIONS, MIME_TYPES, OUTPUT_FORMATS, TARGET_CANVAS_WIDTH, outfit_layers, output_format, render_key,
+)
+from . import render_cache
+from .recommendations import filter_options, personalized_products
+from .tile_cache import log_stats
 import logging
 from django.conf.urls.static import static
 logger = logging.getLogger(__name__)
 BASE_WIDTH = 80  # base container width at scale=1
-import os
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_safe
 from django.contrib import messages
-from .gemini_client import generate_outfit_image_with_critique
-from django.core.files.base import ContentFile
-from  .models import OutfitAIResult
-from io import BytesIO
+from .models import AIGenerationJob
 from django.http import Http404 
 from django.urls import reverse
 from django.db import transaction
-from .utils import update_outfit_preview_image
+from .services import ai_request, enqueue_ai_generation, enqueue_preview_render, serve_cached_ai_result
+from functools import partial
 @login_required
 def create_outfit(request, outfit_id=None):
     
@@ -83,30 +89,17 @@ def create_outfit(request, outfit_id=None):
                 else:
                      logger.info(f"No valid items to save for outfit {outfit.id}.")
 
-                # Important: Assign the saved/created outfit instance to use AFTER the transaction
-                outfit_instance_for_preview = outfit
                 # Force update timestamp if editing, even if no items changed (unlikely but possible)
                 if outfit_id:
                     outfit.save(update_fields=['updated_at'])
 
+                # --- Queue the preview render; run_preview_worker picks it up after this commits ---
+                # Saving again before the worker gets to it just pushes the same job back.
+                # robust: a queueing failure is logged and must not turn a saved outfit into an error
+                transaction.on_commit(partial(enqueue_preview_render, outfit.id), robust=True)
 
-            # --- Generate Preview Image (AFTER transaction commits) ---
-            if outfit_instance_for_preview:
-                 logger.info(f"Attempting preview generation for Outfit ID: {outfit_instance_for_preview.id}")
-                 # The helper function handles logging success/failure internally
-                 preview_generated = update_outfit_preview_image(outfit_instance_for_preview)
-                 if not preview_generated:
-                      messages.warning(request, "Outfit saved, but the preview image could not be generated.")
-                 else:
-                     messages.success(request, "Outfit saved successfully.")
-            else:
-                 # Should not happen if logic is correct, but good to handle
-                 messages.error(request, "Failed to get outfit instance after saving.")
-                 logger.error("outfit_instance_for_preview was None after transaction commit.")
-
-
-            # Redirect regardless of preview generation outcome (unless a critical error occurred earlier)
-            return redirect('mix_and_match:preview_outfit', outfit_id=outfit_instance_for_preview.id)
+            messages.success(request, "Outfit saved successfully.")
+            return redirect('mix_and_match:preview_outfit', outfit_id=outfit.id)
 
 
         except json.JSONDecodeError:
@@ -136,9 +129,12 @@ def create_outfit(request, outfit_id=None):
         # Prepare JSON data *only if* editing an existing outfit
         if outfit: # This means outfit_id was valid and outfit was fetched
             items_data = []
-            for item in outfit.items.select_related('product').all().order_by('z_index'):
+            for item in outfit.items.select_related('product__primary_image').all().order_by('z_index'):
                 items_data.append({
                     'product_id': item.product.id,
+                    # The palette is paginated, so the canvas can't look these up in it
+                    'src': item.product.get_primary_image_url(),
+                    'title': item.product.title,
                     'position_x': item.position_x,
                     'position_y': item.position_y,
                     'scale': item.scale,
@@ -148,35 +144,8 @@ def create_outfit(request, outfit_id=None):
             logger.debug(f"Prepared JSON for existing items: {existing_items_json}")
         # If not editing (outfit is None), existing_items_json remains "[]" (default)
 
-        # Fetch ALL available items for the user to choose from (Original Logic)
-        available_items = Product.objects.filter(
-            Q(is_public=True, is_sold=False, quantity__gt=0) | Q(seller=request.user, is_public=False)
-        ).prefetch_related('images').distinct() # Use prefetch_related
-
-        # Attach primary image (Original Logic - ensure JS can find img src)
-        for item in available_items:
-            # Use the prefetched data if available
-            primary_image = None
-            first_image = None
-            # Access prefetched images if manager setup allows direct iteration,
-            # otherwise .all() might trigger queries if not prefetched correctly
-            image_qs = item.images.all()
-            for img in image_qs:
-                 if img.is_primary:
-                     primary_image = img
-                     break
-                 if first_image is None:
-                     first_image = img
-            item.primary_image = primary_image or first_image # Attach image instance
-            # Ensure JS has access to data-src for items being loaded
-            if item.primary_image:
-                item.primary_image_url = item.primary_image.image.url # Provide URL for JS data-src
-            else:
-                item.primary_image_url = None # Handle case where item has no image
-
-        # Filter out items completely lacking an image for the available list display
-        # This ensures `item.primary_image.image.url` works in the template loop
-        displayable_available_items = [item for item in available_items if item.primary_image]
+        # Only the first palette page is rendered; the builder fetches the rest from palette_items as the user scrolls
+        palette_page = _palette_page(request)
 
         # Get all available categories for the filter buttons (Original Logic)
         all_categories = list(Product.objects.filter(
@@ -187,14 +156,60 @@ def create_outfit(request, outfit_id=None):
 
 
         context = {
-            'available_items': displayable_available_items, # Pass items that have an image
+            'palette_page': palette_page, # First page of the item palette, same shape as palette_items returns
             'outfit': outfit, # Pass the outfit object (or None if creating)
             'existing_items_json': existing_items_json, # Pass the JSON string or "[]"
             'all_categories': ['ALL'] + all_categories, # Categories for filter buttons
         }
-        print(context)
         return render(request, 'mix_and_match/create_outfit.html', context)
 
+PALETTE_PAGE_SIZE = 36
+PALETTE_THUMB_WIDTH = 160 # Palette tiles are 80px wide; 2x for high-DPI screens
+
+
+def _palette_page(request, category=None, cursor=None):
+    """
+    One page of the outfit builder's item palette: public available products plus the
+    user's private closet, newest first, optionally limited to a category ('NONE' for
+    uncategorized). Returns {'items': [...], 'next_cursor': str | None}; raises InvalidCursor.
+    """
+    products = Product.objects.filter(
+        Q(is_public=True, is_sold=False, quantity__gt=0) | Q(seller=request.user, is_public=False),
+        primary_image__isnull=False,
+    ).select_related('primary_image') # primary_image is denormalized on Product
+    if category == 'NONE':
+        products = products.filter(Q(category__isnull=True) | Q(category=''))
+    elif category and category != 'ALL':
+        products = products.filter(category=category)
+
+    # Keyset on the primary key: newest first, and deep pages cost the same as the first
+    page = KeysetPaginator(products, PALETTE_PAGE_SIZE, '-id').page(cursor)
+    return {
+        'items': [
+            {
+                'id': product.id,
+                'title': product.title,
+                'category': product.category or 'NONE',
+                'thumb_url': product.primary_image.rendition_url(PALETTE_THUMB_WIDTH),
+                'image_url': product.primary_image.image.url, # Full size, for the canvas
+            }
+            for product in page
+        ],
+        'next_cursor': page.next_cursor,
+    }
+
+
+@login_required
+@require_safe
+def palette_items(request):
+    """JSON page of the outfit builder's item palette: ?category= and ?cursor= (from next_cursor)."""
+    try:
+        data = _palette_page(request, request.GET.get('category'), request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': "Invalid cursor."}, status=400)
+    return JsonResponse(data)
+
+
 @login_required
 def edit_outfit(request, outfit_id):
     """
@@ -208,9 +223,10 @@ def preview_outfit(request, outfit_id):
     # Prefetch related product data including seller username for display/checks
     outfit = get_object_or_404(
         UserOutfit.objects.prefetch_related(
-            'items__product__images', # Images for display
+            'items__product__primary_image', # Primary image for display
             'items__product__seller', # Seller info if needed
-            'ai_result'               # Existing AI result
+            'ai_result',              # Existing AI result
+            'ai_job',                 # Queued/running AI generation, if any
         ),
         id=outfit_id,
         user=request.user
@@ -226,7 +242,6 @@ def preview_outfit(request, outfit_id):
 
     for item in outfit.items.all(): # Access prefetched items
         product = item.product
-        primary_image = next((img for img in product.images.all() if img.is_primary), product.images.first())
 
         # Check if the product is currently unavailable (sold OR quantity <= 0)
         # Exclude the user's own private items from this check if desired
@@ -239,7 +254,7 @@ def preview_outfit(request, outfit_id):
             'id': item.id,
             'product_id': product.id,
             'title': product.title,
-            'primary_image_url': primary_image.image.url if primary_image and hasattr(primary_image, 'image') and primary_image.image else static('images/placeholder.png'),
+            'primary_image_url': product.get_primary_image_url(),
             # Pass ORIGINAL saved data needed for JS scaling
             'saved_x': item.position_x,
             'saved_y': item.position_y,
@@ -252,8 +267,14 @@ def preview_outfit(request, outfit_id):
     # Sort by z_index for correct layering in template loop
     outfit_items_for_template.sort(key=lambda x: x['z_index'])
 
+    try:
+        ai_job = outfit.ai_job
+    except AIGenerationJob.DoesNotExist:
+        ai_job = None
+
     context = {
         'outfit': outfit,
+        'ai_job': ai_job, # Template shows progress (and polls ai_status) while it is active
         'outfit_items_data': outfit_items_for_template, # Pass the list of dictionaries
         'contains_unavailable_item': contains_unavailable_item,
         # Pass constants needed by JS
@@ -264,70 +285,174 @@ def preview_outfit(request, outfit_id):
     return render(request, 'mix_and_match/preview_outfit.html', context)
 
 
+RENDER_SIZES = (250, 500, 1000)
+RENDER_QUALITIES = ('draft', 'hq')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _render_params(request, default_format, default_quality):
+    """(size, profile, fmt) from ?size=, ?quality= and ?format=, or None if any is invalid."""
+    try:
+        size = int(request.GET.get('size', TARGET_CANVAS_WIDTH))
+    except ValueError:
+        return None
+    profile = request.GET.get('quality', default_quality).lower()
+    fmt = request.GET.get('format', default_format).lower()
+    if size not in RENDER_SIZES or profile not in RENDER_QUALITIES or fmt not in OUTPUT_FORMATS:
+        return None
+    return size, profile, fmt
+
+
+def outfit_render_url(outfit, layers, size=TARGET_CANVAS_WIDTH, quality='draft', fmt=None):
+    """Versioned (immutable, cache-first in the PWA) render_outfit URL for the outfit's current layout."""
+    fmt = output_format(quality, fmt)
+    key = render_key(layers, quality, fmt, size)
+    query = urlencode({'size': size, 'quality': quality, 'format': fmt, 'v': key[:12]})
+    return f"{reverse('mix_and_match:render_outfit', args=[outfit.id])}?{query}"
+
+
+def _cached_render_response(request, outfit, size, profile, fmt):
+    """
+    Serves a render from the disk cache (rendering it on a miss) with validators:
+    the ETag is the render key, Last-Modified the later of the items' last change and
+    the render time. Returns (response, render key); the response is a 304 when the
+    client's copy is current, and (500 response, None) if rendering failed.
+    """
+    layers = outfit_layers(outfit)
+    key = render_key(layers, profile, fmt, size)
+    cached = render_cache.get_or_render(outfit, layers, key, profile, fmt, size)
+    if cached is None:
+        return HttpResponseServerError("Could not render outfit."), None
+    render_file, rendered_at = cached
+    items_modified = [item.modified_at.timestamp() for item in layers if item.modified_at]
+    last_modified = int(max([rendered_at, *items_modified]))
+    etag = f'"{key[:32]}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(render_file, content_type=MIME_TYPES[fmt])
+    else:
+        render_file.close()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response, key
+
+
 @login_required
 def download_outfit(request, outfit_id):
     """
-    Generate and return the composite PNG image for the outfit.
+    Return the composite image for the outfit as an attachment, from the render cache.
+    ?format=png (default), webp or jpeg; ?size= and ?quality= as for render_outfit (default hq).
     """
     outfit = get_object_or_404(UserOutfit, id=outfit_id, user=request.user)
-    output = generate_outfit_image(outfit)
-    filename = f"outfit_{outfit.id}.png"
-    return FileResponse(output, as_attachment=True, filename=filename)
+    params = _render_params(request, default_format='png', default_quality='hq')
+    if params is None:
+        return HttpResponseBadRequest("Invalid size, quality or format.")
+    size, profile, fmt = params
+    response, key = _cached_render_response(request, outfit, size, profile, fmt)
+    if key is None:
+        return response
+    log_stats(f"download of outfit {outfit.id}")
+    response['Content-Disposition'] = f'attachment; filename="outfit_{outfit.id}.{EXTENSIONS[fmt]}"'
+    patch_cache_control(response, private=True, no_cache=True) # Revalidate; a 304 skips the transfer
+    return response
+
+
+@require_safe
+def render_outfit(request, outfit_id):
+    """
+    Rendered outfit image for <img> tags, the PWA and nginx:
+    ?size=250|500|1000 (default 500), ?quality=draft|hq (default draft),
+    ?format=webp|png|jpeg (default webp), optional ?v=<render key prefix>.
+    Public outfits are cacheable by shared caches for OUTFIT_RENDER_MAX_AGE seconds and
+    then revalidated with ETag/Last-Modified; private ones only by the owner's browser.
+    A ?v= matching the current render key marks the URL immutable for a year.
+    """
+    outfit = get_object_or_404(UserOutfit, id=outfit_id)
+    if not outfit.is_public:
+        # request.user is only touched here: reading the session adds Vary: Cookie,
+        # which would keep nginx from sharing public renders between visitors
+        if not (request.user.is_authenticated and request.user.id == outfit.user_id):
+            raise Http404("Outfit not found or is private.")
+    params = _render_params(request, default_format=output_format('draft'), default_quality='draft')
+    if params is None:
+        return HttpResponseBadRequest("Invalid size, quality or format.")
+    size, profile, fmt = params
+
+    response, key = _cached_render_response(request, outfit, size, profile, fmt)
+    if key is None:
+        return response
+    version = request.GET.get('v')
+    if version and key.startswith(version) and len(version) >= 12:
+        max_age = IMMUTABLE_MAX_AGE
+    else:
+        max_age = settings.OUTFIT_RENDER_MAX_AGE
+    if outfit.is_public:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, max_age=max_age)
+    if max_age == IMMUTABLE_MAX_AGE:
+        patch_cache_control(response, immutable=True)
+    return response
 
 
 # --- NEW AI Generation View ---
 @login_required
 @require_POST # Make this POST only to prevent accidental triggers
 def ai_generate_view(request, outfit_id):
-    """Generates AI critique and image for an outfit."""
+    """
+    Queues AI critique and image generation for an outfit, unless ai_cache already holds
+    the answer. The run_ai_worker command runs the job; the preview page polls ai_status
+    and shows the result once it is stored.
+    """
     outfit = get_object_or_404(UserOutfit, id=outfit_id, user=request.user)
     logger.info(f"AI Generation requested for Outfit {outfit_id} by User {request.user.email}")
 
-    # Call the Gemini client function
-    generated_image, critique, error_message = generate_outfit_image_with_critique(outfit)
+    # Unchanged (or identical) outfits are answered from the AI response cache right away
+    _, _, key = ai_request(outfit)
+    if serve_cached_ai_result(outfit, key):
+        AIGenerationJob.objects.filter(outfit=outfit, status=AIGenerationJob.STATUS_FAILED).delete() # Superseded
+        messages.success(request, "AI critique and image generated successfully!")
+        return redirect('mix_and_match:preview_outfit', outfit_id=outfit_id)
 
-    if error_message:
-        messages.error(request, f"AI Generation Failed: {error_message}")
+    job, queued = enqueue_ai_generation(outfit.id)
+    if queued:
+        messages.info(request, "AI generation started. Your suggestion will appear here when it is ready.")
     else:
-        if critique or generated_image:
-            try:
-                ai_result, created = OutfitAIResult.objects.update_or_create(
-                    outfit=outfit,
-                    defaults={
-                        'critique': critique or "Critique not generated.",
-                        # Clear old image before saving new one if update_or_create updates
-                        'generated': None
-                    }
-                )
-                # Save the new image if generated
-                if generated_image:
-                     img_buffer = BytesIO()
-                     generated_image.save(img_buffer, format='PNG')
-                     ai_result.generated.save(f"ai_outfit_{outfit.id}.png", ContentFile(img_buffer.getvalue()), save=True)
-                     logger.info(f"Saved generated AI image for Outfit {outfit.id}")
-
-                messages.success(request, "AI critique and image generated successfully!")
-            except Exception as e:
-                logger.error(f"Failed to save AI result for Outfit {outfit.id}: {e}", exc_info=True)
-                messages.error(request, "AI generated results but failed to save them.")
-        else:
-             messages.warning(request, "AI generation completed but returned no image or critique.")
-
+        messages.info(request, "AI generation is already in progress for this outfit.")
     return redirect('mix_and_match:preview_outfit', outfit_id=outfit_id)
 
+@login_required
+@require_safe
+def ai_status(request, outfit_id):
+    """JSON status of the outfit's AI generation job, polled by the preview page."""
+    outfit = get_object_or_404(UserOutfit, id=outfit_id, user=request.user)
+    job = AIGenerationJob.objects.filter(outfit=outfit).first()
+    if job is None:
+        return JsonResponse({'status': None, 'error': "No AI generation found for this outfit."}, status=404)
+    data = {'status': job.status, 'error': job.error if job.status == AIGenerationJob.STATUS_FAILED else ''}
+    if job.status == AIGenerationJob.STATUS_QUEUED:
+        # Rough queue position so the page can say "2 outfits ahead of yours"
+        data['queue_position'] = AIGenerationJob.objects.filter(
+            status=AIGenerationJob.STATUS_QUEUED, requested_at__lt=job.requested_at
+        ).count()
+    response = JsonResponse(data)
+    patch_cache_control(response, no_cache=True)
+    return response
+
 @login_required
 def recommendations(request):
     category = request.GET.get('category')
     condition = request.GET.get('condition')
-    recommended_items = Product.objects.filter(is_public=True)
+    recommended_items = Product.objects.filter(is_public=True, is_sold=False, quantity__gt=0).exclude(seller=request.user)
     if category:
         recommended_items = recommended_items.filter(category=category)
     if condition:
         recommended_items = recommended_items.filter(condition=condition)
-    recommended_items = recommended_items.order_by('?')[:10]
+    # Precomputed by the compute_recommendations command; random index probes fill the rest
+    recommended_items = personalized_products(request.user, recommended_items.select_related('primary_image'), 10)
 
-    categories = Product.objects.filter(is_public=True).values_list('category', flat=True).distinct()
-    conditions = Product.objects.filter(is_public=True).values_list('condition', flat=True).distinct()
+    categories, conditions = filter_options() # Cached distinct values for the filter dropdowns
 
     context = {
         'recommended_items': recommended_items,
@@ -347,15 +472,7 @@ def delete_outfit(request, outfit_id):
     outfit = get_object_or_404(UserOutfit, id=outfit_id, user=request.user)
     try:
         outfit_id_short = str(outfit.id)[:8]
-        # Optional: Delete associated preview image file first
-        if outfit.preview_image:
-            if os.path.exists(outfit.preview_image.path):
-                 os.remove(outfit.preview_image.path)
-        # Optional: Delete associated AI result image file first
-        if hasattr(outfit, 'ai_result') and outfit.ai_result.generated:
-             if os.path.exists(outfit.ai_result.generated.path):
-                 os.remove(outfit.ai_result.generated.path)
-
+        # Preview and AI image files are removed by the post_delete receivers in signals.py
         outfit.delete()
         messages.success(request, f"Outfit ({outfit_id_short}...) deleted successfully.")
         logger.info(f"Deleted outfit {outfit_id} for user {request.user.email}")
@@ -368,7 +485,6 @@ def delete_outfit(request, outfit_id):
     return redirect('user:profile') # Redirect to profile after successful delete
 
 
-from django.http import JsonResponse 
 @login_required
 @require_POST # Ensure this view only accepts POST requests
 def toggle_outfit_privacy(request, outfit_id):
@@ -407,9 +523,7 @@ def public_outfit_preview(request, outfit_id):
     # Fetch items and related product data
     outfit_items = outfit.items.select_related(
         'product__seller', # Needed if linking to product
-        'product'
-    ).prefetch_related(
-        'product__images' # For primary image
+        'product__primary_image', # For primary image
     ).order_by('z_index')
 
     outfit_items_for_template = []
@@ -421,7 +535,6 @@ def public_outfit_preview(request, outfit_id):
 
     for item in outfit_items:
         product = item.product
-        primary_image = next((img for img in product.images.all() if img.is_primary), product.images.first())
 
         # Check product availability (only relevant if the product itself is public)
         is_unavailable = False
@@ -434,7 +547,7 @@ def public_outfit_preview(request, outfit_id):
             'id': item.id,
             'product_id': product.id,
             'title': product.title,
-            'primary_image_url': primary_image.image.url if primary_image and hasattr(primary_image, 'image') and primary_image.image else static('images/placeholder.png'),
+            'primary_image_url': product.get_primary_image_url(),
             'saved_x': item.position_x,
             'saved_y': item.position_y,
             'saved_scale': item.scale,
@@ -454,5 +567,7 @@ def public_outfit_preview(request, outfit_id):
         'TARGET_CANVAS_WIDTH': TARGET_CANVAS_WIDTH,
         'BASE_ITEM_WIDTH_ON_SAVE': BASE_ITEM_WIDTH_ON_SAVE,
         'is_public_view': True, # Flag for the template
+        # Link-preview image for shares; versioned, so shared caches can keep it
+        'share_image_url': request.build_absolute_uri(outfit_render_url(outfit, outfit_layers(outfit), size=1000)),
     }
     return render(request, 'mix_and_match/public_outfit_preview.html', context)
\ No newline at end of file
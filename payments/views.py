@@ -25,6 +25,7 @@ from wallet.models import Wallet, WalletTransaction, add_funds # Import add_fund
 
 # Other App Views/Functions (ensure correct import path)
 from cart.views import distribute_payment, initialize_cart # Assuming these are still correct
+from cart.services import clear_cart
 
 # Seller Notification Helper (keep from previous step)
 from .utils import send_seller_sale_notification # Assume moved helper here
@@ -169,7 +170,7 @@ def _handle_order_success(order_locked, xendit_payment_id, request):
     # 5. Clear Buyer's Cart
     logger.info(f"--- Order {order_locked.id}: Clear Cart ---")
     if order_locked.buyer:
-        try: cart=initialize_cart(order_locked.buyer); count, _ = cart.cart_items.all().delete(); logger.info(f"Cleared {count} cart items.")
+        try: cart=initialize_cart(order_locked.buyer); count = clear_cart(cart); logger.info(f"Cleared {count} cart items.")
         except Exception as cart_e: logger.error(f"Non-critical cart clear error: {cart_e}")
 
     # 6. Send Seller Notifications (Outside main transaction potentially better, but here for now)
@@ -50,8 +50,39 @@ self.addEventListener('activate', event => {
     );
 });
 
+// Versioned outfit renders (?v=<render key>) never change, so they are served cache-first
+// from their own cache, kept to the most recent renderCacheLimit entries.
+var renderCacheName = "outfit-renders";
+var renderCacheLimit = 100;
+var renderPath = /^\/mix-and-match\/outfit\/\d+\/render\/$/;
+
+function cachedRender(request) {
+    return caches.open(renderCacheName).then(cache =>
+        cache.match(request).then(cached => {
+            if (cached) {
+                return cached;
+            }
+            return fetch(request).then(response => {
+                if (response.ok) {
+                    cache.put(request, response.clone())
+                        .then(() => cache.keys())
+                        .then(keys => Promise.all(
+                            keys.slice(0, Math.max(0, keys.length - renderCacheLimit)).map(key => cache.delete(key))
+                        ));
+                }
+                return response;
+            });
+        })
+    );
+}
+
 // Serve from Cache
 self.addEventListener("fetch", event => {
+    var url = new URL(event.request.url);
+    if (event.request.method === "GET" && renderPath.test(url.pathname) && url.searchParams.has("v")) {
+        event.respondWith(cachedRender(event.request));
+        return;
+    }
     event.respondWith(
         caches.match(event.request)
             .then(response => {
@@ -29,6 +29,11 @@ GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 
 if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY environment variable not set!")
+# 'gemini', or 'stub' for an offline fake with fixed latencies (mix_and_match/gemini_client.py)
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'gemini')
+# Per-call timeouts in seconds; the critique and image calls run concurrently
+GEMINI_CRITIQUE_TIMEOUT = float(os.getenv('GEMINI_CRITIQUE_TIMEOUT', 45))
+GEMINI_IMAGE_TIMEOUT = float(os.getenv('GEMINI_IMAGE_TIMEOUT', 90))
     
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -63,6 +68,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
     'user',
     'marketplace',
     'pwa',
@@ -134,6 +140,60 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared across gunicorn workers so invalidation (e.g. marketplace facet counts) is seen by all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'TIMEOUT': 300,
+    }
+}
+
+# Background removal queue (image_scanning.BackgroundRemovalJob), drained by
+# `python manage.py run_image_worker` running outside the gunicorn workers.
+IMAGE_WORKER_CONCURRENCY = int(os.getenv('IMAGE_WORKER_CONCURRENCY', 2))
+IMAGE_WORKER_POLL_INTERVAL = float(os.getenv('IMAGE_WORKER_POLL_INTERVAL', 1.0)) # seconds between empty-queue polls
+IMAGE_JOB_STALE_AFTER = int(os.getenv('IMAGE_JOB_STALE_AFTER', 300)) # seconds before a RUNNING job is presumed orphaned
+IMAGE_JOB_MAX_ATTEMPTS = 3
+# rembg model and ONNX threading (image_scanning/sessions.py). One of u2net, u2netp,
+# isnet-general-use, silueta. Each worker thread runs inferences on the shared session,
+# so keep IMAGE_WORKER_CONCURRENCY * REMBG_INTRA_OP_THREADS around the core count.
+REMBG_MODEL = os.getenv('REMBG_MODEL', 'u2net')
+REMBG_INTRA_OP_THREADS = int(os.getenv('REMBG_INTRA_OP_THREADS', 0)) # 0 = onnxruntime default
+REMBG_INTER_OP_THREADS = int(os.getenv('REMBG_INTER_OP_THREADS', 0))
+
+# Per-process LRU of decoded product images used when compositing outfits (mix_and_match/tile_cache.py)
+OUTFIT_TILE_CACHE_MAX_BYTES = int(os.getenv('OUTFIT_TILE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Outfit preview renders (mix_and_match.PreviewRenderJob), drained by `python manage.py run_preview_worker`.
+# A job is claimed once the outfit has gone this many seconds without another save; the
+# worker shares IMAGE_WORKER_POLL_INTERVAL, IMAGE_JOB_STALE_AFTER and IMAGE_JOB_MAX_ATTEMPTS.
+OUTFIT_PREVIEW_DEBOUNCE = float(os.getenv('OUTFIT_PREVIEW_DEBOUNCE', 2.0))
+# Render profile ('draft' or 'hq', see mix_and_match/image_generator.py) and format ('png', 'webp',
+# 'jpeg'; empty = the profile's default) of stored previews. Changing either gives every layout a
+# new render key, so run `generate_previews --force` afterwards.
+OUTFIT_PREVIEW_PROFILE = os.getenv('OUTFIT_PREVIEW_PROFILE', 'draft')
+OUTFIT_PREVIEW_FORMAT = os.getenv('OUTFIT_PREVIEW_FORMAT', '')
+# On-demand renders from mix_and_match.views.render_outfit (mix_and_match/render_cache.py)
+OUTFIT_RENDER_CACHE_DIR = os.getenv('OUTFIT_RENDER_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'outfit_renders'))
+OUTFIT_RENDER_CACHE_MAX_BYTES = int(os.getenv('OUTFIT_RENDER_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+OUTFIT_RENDER_MAX_AGE = int(os.getenv('OUTFIT_RENDER_MAX_AGE', 60)) # seconds; versioned (?v=) URLs are immutable
+# Memory-mapped "more like this" index (marketplace/similarity.py); rebuild with `build_similarity_index`
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', os.path.join(BASE_DIR, 'cache', 'similarity'))
+# AI critique/image generation (mix_and_match.AIGenerationJob), drained by `python manage.py run_ai_worker`.
+# Concurrency caps simultaneous generations per worker; the time is spent waiting on Gemini, not CPU.
+AI_WORKER_CONCURRENCY = int(os.getenv('AI_WORKER_CONCURRENCY', 4))
+# Must exceed the longest generation: the critique and up to two image attempts (GEMINI_*_TIMEOUT)
+AI_JOB_STALE_AFTER = int(os.getenv('AI_JOB_STALE_AFTER', 600))
+# Cached Gemini responses (mix_and_match/ai_cache.py): an unchanged outfit is answered without API calls
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 7 * 24 * 3600)) # seconds
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 1000)) # each holds one generated PNG
+
+# Personalized recommendations (compute_recommendations command, run e.g. nightly, --incremental hourly)
+RECOMMENDATIONS_TOP_N = int(os.getenv('RECOMMENDATIONS_TOP_N', 30)) # stored per user
+# Products in the item-item similarity matrix (the most interacted with); memory is 4 * N^2 bytes
+RECOMMENDATIONS_MAX_ITEMS = int(os.getenv('RECOMMENDATIONS_MAX_ITEMS', 4000))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -246,7 +246,6 @@ def profile_view(request):
         user=request.user
     ).prefetch_related(
         'items',
-        'items__product__images', # Prefetch product images via items
         'ai_result' # Prefetch the AI result if it exists
     ).order_by('-created_at')
 